@@ -0,0 +1,83 @@
+"""
+子进程方式的转发吞吐量测试
+
+`SubprocessServer`为每个连接启动`cat`，客户端通过本机的TCP连接发送N MB数据，同时读回同样多的数据。
+比较两种转发方式：
+* copy   在Python中复制(StreamReader.read + StreamWriter.write)
+* splice 用`os.splice`在socket和管道之间直接移动数据
+
+测量每秒转发的数据量(两个方向之和)，以及服务端和客户端在同一个进程中消耗的CPU时间。
+客户端的开销在两种方式中相同，CPU时间之差就是转发的开销。
+
+用法::
+
+    python benchmark/forward_bench.py [--size 256] [-c 并发连接数] [-n 次数]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samoyed.server import SPLICE, SubprocessServer  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+async def client(host: str, port: int, size: int) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b"\n")
+    assert await reader.readline() == b"OK\n"
+    chunk = b"x" * CHUNK
+
+    async def send():
+        for _ in range(size // CHUNK):
+            writer.write(chunk)
+            await writer.drain()
+
+    async def receive():
+        received = 0
+        while received < size:
+            data = await reader.read(CHUNK * 4)
+            assert data, "connection closed after {} bytes".format(received)
+            received += len(data)
+
+    # 读回所有的数据之后再关闭连接，关闭连接时进程被结束
+    await asyncio.gather(send(), receive())
+    writer.close()
+
+
+async def run(splice: bool, size: int, connections: int) -> dict:
+    session_server = SubprocessServer(["cat"], splice=splice)
+    server = await session_server.start("127.0.0.1", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    async with server:
+        cpu = time.process_time()
+        start = time.perf_counter()
+        await asyncio.gather(*[client(host, port, size) for _ in range(connections)])
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+    return {"rate": 2 * size * connections / elapsed, "cpu": cpu}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256, help="每个连接发送的数据量(MB)")
+    parser.add_argument("-c", type=int, default=1, help="并发连接数")
+    parser.add_argument("-n", type=int, default=3, help="每种方式的次数，取中位数")
+    args = parser.parse_args()
+
+    modes = [("copy", False)] + ([("splice", True)] if SPLICE else [])
+    print("{:>8} {:>10} {:>10}".format("mode", "MB/s", "CPU(s)"))
+    for name, splice in modes:
+        results = [asyncio.run(run(splice, args.size * 1024 * 1024, args.c)) for _ in range(args.n)]
+        print("{:>8} {:>10.1f} {:>10.2f}".format(name, statistics.median(r["rate"] for r in results) / 1024 / 1024,
+                                                 statistics.median(r["cpu"] for r in results)))
+
+
+if __name__ == '__main__':
+    main()
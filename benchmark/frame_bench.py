@@ -0,0 +1,109 @@
+"""
+变量存储测试
+
+* 循环：一个状态自己跳转N次，每次读写几个变量，测量三种执行模式的CPU时间(R次中最好的一次)
+* 每个会话的内存：同一个程序创建M个会话(解释器和上下文)，全部保留，用tracemalloc测量平均每个会话占用的内存，
+  以及其中保存变量的数组或者字典的大小
+* 共享符号表：M个会话各自传入一个不同的新名字之后，程序的符号表的大小
+
+用法::
+
+    python benchmark/frame_bench.py [-n 5000] [-r 15] [-m 2000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samoyed.core import Interpreter  # noqa: E402
+
+LOOP_CODE = """
+i = 0
+total = 0
+state main:
+    total = total + i * 2 - i // 3
+    i = i + 1
+    if i < {n}:
+        branch main
+"""
+
+SESSION_CODE = """
+名字 = "张三"
+剩余金额 = 100
+月份 = 1
+state main:
+    speak(名字 + "，您好")
+    match @(30)listen():
+        /投诉(.*)/ =>
+            内容 = $mg1
+            speak("已记录" + 内容)
+        "账单" =>
+            账单 = 剩余金额 * 月份
+            speak(账单)
+        silence =>
+            exit()
+"""
+
+
+def run_loop(n: int, mode: str, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        i = Interpreter(LOOP_CODE.format(n=n), cache=False, mode=mode)
+        start = time.process_time()
+        i.exec()
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def storage_size(interpreter: Interpreter) -> int:
+    """保存变量的数组或者字典的大小"""
+    frame = getattr(interpreter.context, "frame", None)
+    if frame is None:
+        return sys.getsizeof(interpreter.context.names)
+    if hasattr(frame, "slots"):
+        extra = getattr(frame, "extra", None)
+        return sys.getsizeof(frame.slots) + (sys.getsizeof(extra) if extra is not None else 0)
+    return sys.getsizeof(frame.values)
+
+
+def session_memory(m: int, mode: str) -> (float, float, int):
+    """平均每个会话的内存和保存变量的大小(字节)，以及之后符号表的大小"""
+    ast = Interpreter(SESSION_CODE, dont_init=True, cache=False).ast
+    Interpreter(ast, mode=mode)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = []
+    for k in range(m):
+        i = Interpreter(ast, mode=mode)
+        i.context.names["caller_{}".format(k)] = k
+        sessions.append(i)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    storage = sum(storage_size(i) for i in sessions)
+    symbols = getattr(sessions[0], "symbols", None)
+    return size / m, storage / m, len(symbols) if symbols is not None else -1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5000, help="循环次数")
+    parser.add_argument("-r", type=int, default=15, help="循环重复的次数")
+    parser.add_argument("-m", type=int, default=2000, help="会话数")
+    args = parser.parse_args()
+
+    print("{:>8} {:>10} {:>14} {:>10} {:>8}".format("模式", "循环(s)", "每个会话(字节)", "变量(字节)", "符号表"))
+    # 先测量所有的循环，避免创建会话产生的垃圾影响计时
+    loops = {mode: run_loop(args.n, mode, args.r) for mode in Interpreter.MODES}
+    for mode, loop in loops.items():
+        memory, storage, symbols = session_memory(args.m, mode)
+        print("{:>8} {:>10.4f} {:>14.0f} {:>10.0f} {:>8}".format(mode, loop, memory, storage, symbols))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+输入到speak的延迟测试
+
+用`samc run`执行test/script/example.sam：
+
+    speak("hello")
+    match @(4,2)listen():
+        "hello" => speak("hello world")
+
+通过管道输入"hello"，测量输出"hello world"的时间：
+* after  在min_wait之后输入，延迟 = 输出时间 - 输入时间
+* before 在min_wait之前输入，要等到min_wait才能输出，延迟 = 输出时间 - (输出"hello"的时间 + min_wait)
+* 等待输入期间进程消耗的CPU时间(毫秒/秒)，从/proc读取，只在Linux上有
+
+用法::
+
+    python benchmark/latency_bench.py [-n 次数] [--exec-mode tree]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SAMC = os.path.join(ROOT, "samc")
+SCRIPT = os.path.join(ROOT, "test", "script", "example.sam")
+MIN_WAIT = 2.0
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def cpu_time(pid: int):
+    """进程消耗的CPU时间(秒)，无法读取时返回None"""
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def run_once(delay: float, exec_mode: str) -> dict:
+    """启动一次对话，在输出"hello"之后delay秒输入"hello"
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    proc = subprocess.Popen([sys.executable, SAMC, "run", SCRIPT, "--exec-mode", exec_mode],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+    try:
+        line = proc.stdout.readline()
+        assert line.strip() == b"hello", line
+        greeted = time.monotonic()
+        cpu_before = cpu_time(proc.pid)
+        time.sleep(delay)
+        cpu_after = cpu_time(proc.pid)
+        sent = time.monotonic()
+        proc.stdin.write(b"hello\n")
+        proc.stdin.flush()
+        line = proc.stdout.readline()
+        answered = time.monotonic()
+        assert line.strip() == b"hello world", line
+    finally:
+        proc.kill()
+        proc.wait()
+    idle = None
+    if cpu_before is not None and cpu_after is not None:
+        idle = (cpu_after - cpu_before) / delay * 1000
+    return {"latency": answered - max(sent, greeted + MIN_WAIT), "idle": idle}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5, help="每种情况的次数")
+    parser.add_argument("--exec-mode", default="tree", choices=["tree", "closure", "vm"])
+    args = parser.parse_args()
+
+    print("{:>8} {:>14} {:>14} {:>16}".format("输入时间", "延迟中位数(ms)", "延迟最大(ms)", "等待时CPU(ms/s)"))
+    for name, delay in (("after", MIN_WAIT + 0.5), ("before", 0.5)):
+        results = [run_once(delay, args.exec_mode) for _ in range(args.n)]
+        latencies = [r["latency"] * 1000 for r in results]
+        idles = [r["idle"] for r in results if r["idle"] is not None]
+        idle = "{:.2f}".format(statistics.median(idles)) if idles else "-"
+        print("{:>8} {:>14.2f} {:>14.2f} {:>16}".format(name, statistics.median(latencies), max(latencies), idle))
+
+
+if __name__ == '__main__':
+    main()
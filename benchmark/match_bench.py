@@ -0,0 +1,88 @@
+"""
+多关键字match测试
+
+模拟带时间控制的match中一次匹配的代价：输入一句话，case是很多个关键字，
+只有最后一个关键字出现在输入中。比较逐个调用`Interpreter._match_value`和`matcher.CaseMatcher`。
+
+流式输入：输入一个字一个字地到达，每到达一个字就匹配一次，只有最后一个字到达时才匹配成功。
+比较每次拼接全部输入后从头匹配，和`CaseMatcher.feed`只扫描新的输入。
+
+用法::
+
+    python benchmark/match_bench.py [-n 次数]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samoyed.core import Interpreter  # noqa: E402
+from samoyed.matcher import CaseMatcher  # noqa: E402
+
+
+def match_one_by_one(text: str, cases: list):
+    for i, case in enumerate(cases):
+        is_matched, result = Interpreter._match_value(text, case)
+        if is_matched:
+            return i, result
+    return None, None
+
+
+def rescan(chunks: list, cases: list):
+    """原来的做法：每次拼接全部输入，从头匹配"""
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        index, result = match_one_by_one(text, cases)
+        if index is not None:
+            return index, result
+    return None, None
+
+
+def stream(chunks: list, cases: list):
+    matcher = CaseMatcher(cases, Interpreter._match_value)
+    for chunk in chunks:
+        index, result = matcher.feed(chunk)
+        if index is not None:
+            return index, result
+    return None, None
+
+
+def timeit(func, n: int) -> float:
+    """平均耗时，单位us"""
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - start) * 1e6 / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多关键字match测试")
+    parser.add_argument("-n", type=int, default=2000, help="每项测量的次数")
+    args = parser.parse_args()
+    print("{:>8}|{:>12}|{:>12}".format("cases", "find us", "matcher us"))
+    for count in (4, 16, 64, 256, 1024):
+        cases = ["关键字{}号问题".format(i) for i in range(count)]
+        text = "我想问一下关于那个关键字{}号问题的事情".format(count - 1)
+        matcher = CaseMatcher(cases, Interpreter._match_value)
+        assert matcher.match(text) == match_one_by_one(text, cases)
+        print("{:>8}|{:>12.1f}|{:>12.1f}".format(count, timeit(lambda: match_one_by_one(text, cases), args.n),
+                                               timeit(lambda: matcher.match(text), args.n)))
+
+    print()
+    print("{:>8}|{:>8}|{:>12}|{:>12}".format("cases", "chars", "rescan us", "feed us"))
+    for count in (4, 64):
+        cases = ["关键字{}号问题".format(i) for i in range(count)]
+        for length in (16, 256, 1024):
+            chunks = list("嗯" * (length - len(cases[-1])) + cases[-1])
+            n = max(args.n // length, 3)
+            assert rescan(chunks, cases) == stream(chunks, cases)
+            print("{:>8}|{:>8}|{:>12.1f}|{:>12.1f}".format(count, length, timeit(lambda: rescan(chunks, cases), n),
+                                                          timeit(lambda: stream(chunks, cases), n)))
+
+
+if __name__ == "__main__":
+    main()
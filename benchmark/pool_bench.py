@@ -0,0 +1,107 @@
+"""
+sqlite连接池测试
+
+N个对话访问同一个账单数据库，每个对话`sqlite_connect`一次，再执行几条查询。比较两种方式：
+* connect 每个对话打开一个新的连接，保存在对话中不关闭(以前的实现)
+* pool    进程内共享的连接池(`pool.pools`)，对话结束时释放
+
+对话由T个线程同时执行。测量每秒完成的对话数、每条查询的平均时间和结束时打开的文件描述符数。
+
+用法::
+
+    python benchmark/pool_bench.py [-n 2000] [--threads 8] [--queries 3]
+"""
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samoyed.libs import sqlite, sqlite_close, sqlite_connect  # noqa: E402
+from samoyed.pool import pools  # noqa: E402
+
+QUERY = "SELECT fee FROM BALANCE WHERE id=1 AND month=3;"
+
+
+def make_database(path: str) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE BALANCE (id INTEGER, month INTEGER, fee FLOAT);")
+    conn.executemany("INSERT INTO BALANCE(id,month,fee) VALUES(?,?,?)",
+                     [(i, m, i * m) for i in range(1, 101) for m in range(1, 13)])
+    conn.commit()
+    conn.close()
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else -1
+
+
+def connect_session(path: str, queries: int, kept: list) -> None:
+    """以前的sqlite_connect和sqlite"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    kept.append(conn)
+    for _ in range(queries):
+        cursor.execute(QUERY)
+        conn.commit()
+        assert cursor.fetchall() == [(3.0,)]
+
+
+def pool_session(path: str, queries: int, kept: list) -> None:
+    conn2curosr = {}
+    cursor = sqlite_connect(conn2curosr, path)
+    for _ in range(queries):
+        assert sqlite(conn2curosr, cursor, QUERY) == [(3.0,)]
+    sqlite_close(conn2curosr)
+
+
+def run(session, path: str, count: int, threads: int, queries: int) -> dict:
+    kept = []
+    per_thread = count // threads
+    fds = open_fds()
+
+    def work():
+        for _ in range(per_thread):
+            session(path, queries, kept)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    result = {"sessions": per_thread * threads / elapsed, "query_us": elapsed / (per_thread * threads * queries) * 1e6,
+              "fds": open_fds() - fds}
+    # 连接只能在创建它的线程中关闭，释放引用时关闭
+    kept.clear()
+    gc.collect()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=2000, help="对话数")
+    parser.add_argument("--threads", type=int, default=8, help="同时执行的线程数")
+    parser.add_argument("--queries", type=int, default=3, help="每个对话的查询数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "billing.db")
+        make_database(path)
+        print("{:>8} {:>10} {:>14} {:>10}".format("方式", "对话/秒", "每条查询(us)", "新增fd"))
+        for name, session in (("connect", connect_session), ("pool", pool_session)):
+            result = run(session, path, args.n, args.threads, args.queries)
+            print("{:>8} {:>10.0f} {:>14.1f} {:>10}".format(name, result["sessions"], result["query_us"],
+                                                           result["fds"]))
+        print("pool:", pools.get(path).stats())
+
+
+if __name__ == '__main__':
+    main()
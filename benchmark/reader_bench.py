@@ -0,0 +1,140 @@
+"""
+管道读取测试
+
+通过管道写入大量中文文本，每次写入的长度不固定，一个汉字的字节可能被分到两次写入中。比较几种读取方式：
+* os.read  以前的`get_pipe_read_end`：`os.read(fd, num).decode("utf-8")`，按块读取
+* reader   `utils.PipeReader.read`：读入同一个bytearray，用增量解码器解码，按块读取
+* split    以前的`FileSource`：每次读取的bytes追加到bytearray，按换行符切分后逐行解码
+* lines    `utils.PipeReader.fill`：增量解码之后按行切分
+
+测量：
+* 解码出错的次数(UnicodeDecodeError)和读到的文本是否与写入的相同
+* 每秒读取的字节数
+* 不保留读到的文本时，读取期间的内存峰值(tracemalloc，单独运行一次，不影响速度的测量)
+
+用法::
+
+    python benchmark/reader_bench.py [--size 20] [--chunk 4093]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samoyed.utils import READ_SIZE, PipeReader  # noqa: E402
+
+LINE = "您好，请问有什么可以帮您？我想查询一下本月的账单。\n"
+
+
+def write_all(fd: int, data: bytes, chunk: int) -> None:
+    """每次写入chunk个字节，chunk不是3的倍数时汉字会被分开"""
+    view = memoryview(data)
+    for i in range(0, len(data), chunk):
+        os.write(fd, view[i:i + chunk])
+    os.close(fd)
+
+
+def read_os(fd: int, parts: list) -> int:
+    """返回解码出错的次数"""
+    read = lambda num: os.read(fd, num).decode("utf-8")
+    errors = 0
+    while True:
+        try:
+            text = read(READ_SIZE)
+        except UnicodeDecodeError:
+            errors += 1
+            continue
+        if not text:
+            return errors
+        parts.append(text)
+
+
+def read_chunks(fd: int, parts: list) -> int:
+    reader = PipeReader(fd)
+    while True:
+        text = reader.read()
+        if reader.eof:
+            parts.append(text)
+            return 0
+        parts.append(text)
+
+
+def read_split(fd: int, parts: list) -> int:
+    buffer = bytearray()
+    while True:
+        data = os.read(fd, READ_SIZE)
+        if not data:
+            parts.append(buffer.decode("utf-8", errors="replace"))
+            return 0
+        buffer += data
+        if b"\n" not in data:
+            continue
+        *lines, rest = buffer.split(b"\n")
+        parts.extend(line.decode("utf-8", errors="replace") + "\n" for line in lines)
+        buffer = bytearray(rest)
+
+
+def read_lines(fd: int, parts: list) -> int:
+    reader = PipeReader(fd)
+    while reader.fill():
+        parts.extend(line + "\n" for line in reader.lines)
+        reader.lines.clear()
+    return 0
+
+
+class Discard(list):
+    """不保留读到的文本"""
+
+    def append(self, _):
+        pass
+
+    def extend(self, items):
+        for _ in items:
+            pass
+
+
+def run(read, data: bytes, chunk: int, parts: list, trace: bool = False) -> dict:
+    r, w = os.pipe()
+    writer = threading.Thread(target=write_all, args=(w, data, chunk))
+    if trace:
+        tracemalloc.start()
+    writer.start()
+    start = time.perf_counter()
+    errors = read(r, parts)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    writer.join()
+    os.close(r)
+    return {"errors": errors, "rate": len(data) / elapsed, "peak": peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20, help="写入的数据量(MB)")
+    parser.add_argument("--chunk", type=int, default=4093, help="每次写入的字节数")
+    args = parser.parse_args()
+
+    line = LINE.encode()
+    data = line * (args.size * 1024 * 1024 // len(line))
+    expected = data.decode()
+    print("{:>8} {:>10} {:>8} {:>10} {:>14}".format("reader", "解码错误", "正确", "MB/s", "内存峰值(KB)"))
+    for name, read in (("os.read", read_os), ("reader", read_chunks), ("split", read_split), ("lines", read_lines)):
+        parts = []
+        run(read, data, args.chunk, parts)
+        correct = "".join(parts) == expected
+        r = run(read, data, args.chunk, Discard())
+        peak = run(read, data, args.chunk, Discard(), trace=True)["peak"]
+        print("{:>8} {:>10} {:>8} {:>10.1f} {:>14.1f}".format(name, r["errors"], str(correct),
+                                                              r["rate"] / 1024 / 1024, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+正则match测试
+
+生成有多个机器人的场景：每个机器人是一个程序，其中有一个200个正则case的match，
+各个机器人的正则表达式互不相同。按轮流的方式执行所有机器人，测量每次执行match的平均耗时。
+机器人足够多时，所有正则表达式的总数超过`re`模块自带缓存的大小(512)。
+
+用法::
+
+    python benchmark/regex_bench.py [-n 轮数] [--cases case数] [--bots 机器人数]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samoyed.core import Interpreter  # noqa: E402
+
+
+def make_script(bot: int, cases: int) -> str:
+    """生成一个有很多正则case的脚本"""
+    lines = ["state main:", "    match 输入:"]
+    for i in range(cases):
+        lines += ["        /机器人{}_问题{}(.*)/ =>".format(bot, i),
+                  "            回答 = {}".format(i)]
+    lines += ["        default =>", "            回答 = -1"]
+    return "\n".join(lines) + "\n"
+
+
+def bench(mode: str, bots: int, cases: int, rounds: int) -> float:
+    """返回每次执行match的平均耗时，单位us"""
+    interpreters = []
+    for bot in range(bots):
+        i = Interpreter(make_script(bot, cases), dont_init=True, mode=mode, cache=False)
+        i.context.names["输入"] = "机器人{}_问题{}".format(bot, cases - 1)
+        i.init()
+        interpreters.append(i)
+    statements = [(i, i.entrance.body[0]) for i in interpreters]
+    # 预热
+    for i, stat in statements:
+        i.exec_statement(stat)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i, stat in statements:
+            i.exec_statement(stat)
+    return (time.perf_counter() - start) * 1e6 / (rounds * bots)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="正则match测试")
+    parser.add_argument("-n", type=int, default=200, help="轮数")
+    parser.add_argument("--cases", type=int, default=200, help="每个match中case的个数")
+    parser.add_argument("--bots", type=int, default=4, help="机器人的个数")
+    args = parser.parse_args()
+    print("{:<8}|{:>12}|{:>12}".format("mode", "1 bot us", "{} bots us".format(args.bots)))
+    for mode in ("tree", "closure", "vm"):
+        if mode not in Interpreter.MODES:
+            continue
+        print("{:<8}|{:>12.1f}|{:>12.1f}".format(mode, bench(mode, 1, args.cases, args.n),
+                                                 bench(mode, args.bots, args.cases, args.n)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+对话服务的压力测试
+
+启动`server.py`，同时建立N个连接，每个连接进行T轮对话(输入"账单"，等待回复)，测量：
+* 建立连接到收到第一句话的时间
+* 每一轮从发送输入到收到回复的往返时间
+* 每秒完成的轮数
+
+两种方式：
+* session    进程内的对话(`SessionServer`)
+* subprocess 每个连接一个进程(`SubprocessServer`，执行`samc gen`生成的程序)
+
+用法::
+
+    python benchmark/server_bench.py [-c 并发连接数] [-t 每个连接的轮数] [--mode session subprocess]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SAMC = os.path.join(ROOT, "samc")
+SERVER = os.path.join(ROOT, "server.py")
+
+SCRIPT = """
+state main:
+    speak("您好")
+    branch ask
+state ask:
+    match @(30)listen():
+        "账单" =>
+            speak("您的本月账单是100元")
+            branch ask
+        "再见" =>
+            speak("再见")
+        silence =>
+            speak("超时")
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode: str, workdir: str, port: int) -> subprocess.Popen:
+    """启动服务，等到可以连接"""
+    source = os.path.join(workdir, "bench.sam")
+    with open(source, "w", encoding="utf-8") as f:
+        f.write(SCRIPT)
+    command = [sys.executable, SERVER, "--port", str(port)]
+    if mode == "session":
+        command.append(source)
+    else:
+        program = os.path.join(workdir, "bench.py")
+        subprocess.run([sys.executable, SAMC, "gen", source, "-o", program], check=True)
+        command += ["--subprocess", "{} {}".format(sys.executable, program)]
+    # 生成的程序需要导入samoyed
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, env=env)
+    for _ in range(200):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not start")
+
+
+async def client(port: int, first_line: str, turns: int, setups: list, rtts: list) -> None:
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((first_line + "\n").encode())
+    await writer.drain()
+    assert (await reader.readline()).strip() == b"OK"
+    assert (await reader.readline()).strip() == "您好".encode()
+    setups.append(time.perf_counter() - start)
+    for _ in range(turns):
+        sent = time.perf_counter()
+        writer.write("账单\n".encode())
+        await writer.drain()
+        line = await reader.readline()
+        rtts.append(time.perf_counter() - sent)
+        assert line.strip() == "您的本月账单是100元".encode(), line
+    writer.write("再见\n".encode())
+    await writer.drain()
+    await reader.read()
+    writer.close()
+
+
+async def load(port: int, first_line: str, connections: int, turns: int) -> dict:
+    setups, rtts = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(port, first_line, turns, setups, rtts) for _ in range(connections)])
+    elapsed = time.perf_counter() - start
+    rtts.sort()
+    return {"setup": statistics.median(setups), "median": statistics.median(rtts),
+            "p99": rtts[min(len(rtts) - 1, int(len(rtts) * 0.99))], "max": rtts[-1], "rate": len(rtts) / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", type=int, default=20, help="并发连接数")
+    parser.add_argument("-t", type=int, default=50, help="每个连接的轮数")
+    parser.add_argument("--mode", nargs="+", default=["session", "subprocess"], choices=["session", "subprocess"])
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>12} {:>12} {:>10}".format("mode", "建立(ms)", "往返中位(ms)", "往返p99(ms)",
+                                                             "往返最大(ms)", "轮/秒"))
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in args.mode:
+            port = free_port()
+            proc = start_server(mode, workdir, port)
+            try:
+                first_line = "bench" if mode == "session" else ""
+                r = asyncio.run(load(port, first_line, args.c, args.t))
+            finally:
+                proc.terminate()
+                proc.wait()
+            print("{:>10} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.2f} {:>10.0f}".format(
+                mode, r["setup"] * 1000, r["median"] * 1000, r["p99"] * 1000, r["max"] * 1000, r["rate"]))
+
+
+if __name__ == '__main__':
+    main()
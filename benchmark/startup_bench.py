@@ -0,0 +1,109 @@
+"""
+`samc gen`启动速度测试
+
+比较两种输出格式：
+* tree    旧格式，把语法树以python字面量的形式写入生成的文件
+* program 二进制程序加上加载器
+
+对test/script下的脚本，以及一个生成的大脚本，分别测量：
+* 生成文件的大小
+* 进程内还原语法树的时间（tree需要编译并执行字面量，program需要解码）
+* 以`--help`启动生成文件的进程耗时（包含解释器启动、导入和还原语法树，不执行状态机）
+
+用法::
+
+    python benchmark/startup_bench.py [-n 次数]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import b85decode, b85encode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lark import Token, Tree  # noqa: E402
+
+from samoyed.core import Interpreter  # noqa: E402
+from samoyed.serialize import dump_program, load_program  # noqa: E402
+
+SAMC = os.path.join(ROOT, "samc")
+SCRIPT_DIR = os.path.join(ROOT, "test", "script")
+
+
+def make_large_script(states: int = 200) -> str:
+    """生成一个有很多状态的脚本"""
+    lines = ["剩余金额 = 100"]
+    for i in range(states):
+        nxt = "main" if i == states - 1 else "s{}".format(i + 1)
+        lines += ["state {}:".format("main" if i == 0 else "s{}".format(i)),
+                  '    speak("状态{}" + 剩余金额 * {})'.format(i, i),
+                  "    match @(5,2)listen():",
+                  '        /投诉(.*)/ =>',
+                  "            com = $mg1",
+                  '            branch {}'.format(nxt),
+                  '        "账单{}" =>'.format(i),
+                  "            if 剩余金额 > {}:".format(i),
+                  '                speak("ok")',
+                  "            else:",
+                  "                exit()",
+                  "        silence =>",
+                  "            branch {}".format(nxt)]
+    return "\n".join(lines) + "\n"
+
+
+def timeit(func, n: int) -> float:
+    """n次执行的中位数，单位ms"""
+    result = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        result.append((time.perf_counter() - start) * 1000)
+    return statistics.median(result)
+
+
+def bench(name: str, source_file: str, workdir: str, n: int) -> None:
+    with open(source_file, encoding="utf-8") as f:
+        i = Interpreter(f.read(), cache=False)
+    tree_literal = repr(i.ast)
+    program = b85encode(dump_program(i.ast, i.context.seq_args, i.context.option_args))
+
+    def load_tree():
+        eval(compile(tree_literal, "<ast>", "eval"), {"Tree": Tree, "Token": Token})
+
+    def load_binary():
+        load_program(b85decode(program))
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    row = [name]
+    for emit, load in (("tree", load_tree), ("program", load_binary)):
+        out = os.path.join(workdir, "{}.{}.py".format(name, emit))
+        subprocess.run([sys.executable, SAMC, "gen", source_file, "-o", out, "--emit", emit], check=True, env=env)
+        command = [sys.executable, out, "--help"] + ["x"] * len(i.context.seq_args)
+        row += [os.path.getsize(out), timeit(load, n),
+                timeit(lambda: subprocess.run(command, env=env, stdout=subprocess.DEVNULL), max(n // 10, 3))]
+    print("{:<14}|{:>9} {:>9.3f} {:>9.1f} |{:>9} {:>9.3f} {:>9.1f}".format(*row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="samc gen启动速度测试")
+    parser.add_argument("-n", type=int, default=50, help="每项测量的次数")
+    args = parser.parse_args()
+    print("{:<14}|{:^29}|{:^29}".format("", "tree", "program"))
+    print("{:<14}|{:>9} {:>9} {:>9} |{:>9} {:>9} {:>9}".format(
+        "script", "bytes", "load ms", "start ms", "bytes", "load ms", "start ms"))
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in sorted(os.listdir(SCRIPT_DIR)):
+            bench(name, os.path.join(SCRIPT_DIR, name), workdir, args.n)
+        large = os.path.join(workdir, "large.sam")
+        with open(large, "w", encoding="utf-8") as f:
+            f.write(make_large_script())
+        bench("large.sam", large, workdir, args.n)
+
+
+if __name__ == "__main__":
+    main()
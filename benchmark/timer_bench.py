@@ -0,0 +1,89 @@
+"""
+带时间控制的match计时测试
+
+同时进行N个带时间控制的match(每个都有min_wait和max_wait)，比较两种计时方式：
+* threads  每个match创建两个`threading.Timer`置位事件(以前的实现)
+* deadline `TimeControl`在每次产生结果之前按截止时间置位事件，不使用计时器
+
+每个match从一个已经有输入的队列读取一次，然后等待计时结束。测量：
+* 计时期间的线程数峰值
+* 从开始到所有match超时消耗的CPU时间(进程内所有线程)
+* 最后一个match超时的时刻与max_wait之差
+
+用法::
+
+    python benchmark/timer_bench.py [-n 1000 5000] [--max-wait 2] [--min-wait 1]
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samoyed.libs import TimeControl  # noqa: E402
+from samoyed.source import QueueSource  # noqa: E402
+
+
+class ThreadTimeControl(TimeControl):
+    """
+    每次调用创建两个`threading.Timer`，与以前的`TimeControl`相同
+    """
+
+    def __call__(self, *args, **kwargs):
+        timers = [threading.Timer(self.max_wait, self.timeout.set)]
+        if self.min_wait is not None:
+            timers.append(threading.Timer(self.min_wait, self.can_exit.set))
+        for timer in timers:
+            timer.start()
+        try:
+            yield from super().__call__(*args, **kwargs)
+        finally:
+            for timer in timers:
+                timer.cancel()
+
+
+def run(count: int, max_wait: float, min_wait: float, control_class) -> dict:
+    """同时进行count个match，直到全部超时"""
+    q = queue.Queue()
+    for _ in range(count):
+        q.put("x")
+    controls = [control_class(QueueSource(q), max_wait, min_wait) for _ in range(count)]
+    peak = threading.active_count()
+    cpu = time.process_time()
+    start = time.monotonic()
+    generators = []
+    for control in controls:
+        g = control()
+        next(g)
+        generators.append(g)
+        peak = max(peak, threading.active_count())
+    # 依次等待每个match超时，前面的match超时时后面的截止时间也已经到了
+    for g in generators:
+        for _ in g:
+            peak = max(peak, threading.active_count())
+    late = time.monotonic() - start - max_wait
+    cpu = time.process_time() - cpu
+    return {"peak": peak, "cpu": cpu, "late": late}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, nargs="+", default=[1000, 5000], help="同时进行的match数")
+    parser.add_argument("--max-wait", type=float, default=2.0)
+    parser.add_argument("--min-wait", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print("{:>6} {:>8} {:>10} {:>10} {:>10}".format("N", "方式", "线程峰值", "CPU(s)", "延迟(ms)"))
+    for count in args.n:
+        for name, control_class in (("threads", ThreadTimeControl), ("deadline", TimeControl)):
+            result = run(count, args.max_wait, args.min_wait, control_class)
+            print("{:>6} {:>8} {:>10} {:>10.3f} {:>10.1f}".format(count, name, result["peak"], result["cpu"],
+                                                                   result["late"] * 1000))
+
+
+if __name__ == '__main__':
+    main()
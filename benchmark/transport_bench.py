@@ -0,0 +1,130 @@
+"""
+传输的往返时间测试
+
+程序每收到一次"ping"就speak一次"pong"。对每种传输进行N轮，测量从输入到收到输出的往返时间：
+* memory 进程内的队列(`MemoryTransport`)，解释器在另一个线程中
+* unix   socketpair(`UnixTransport`)，解释器在另一个线程中
+* fifo   一对具名管道(`FifoTransport`)，解释器在另一个线程中
+* stdio  `samc run`子进程的标准输入输出
+
+用法::
+
+    python benchmark/transport_bench.py [-n 轮数] [--exec-mode closure]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from samoyed.core import Interpreter  # noqa: E402
+from samoyed.transport import FifoTransport, MemoryTransport, UnixTransport  # noqa: E402
+from samoyed.utils import PipeReader, make_pipe  # noqa: E402
+
+SAMC = os.path.join(ROOT, "samc")
+
+SCRIPT = """
+state main:
+    match @(30)listen():
+        "ping" =>
+            speak("pong")
+            branch main
+        "bye" =>
+            speak("bye")
+"""
+
+
+def measure(send, receive, turns: int) -> list:
+    """进行turns轮，返回每一轮的往返时间"""
+    rtts = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        send("ping")
+        line = receive()
+        rtts.append(time.perf_counter() - start)
+        assert line == "pong", line
+    send("bye")
+    assert receive() == "bye"
+    return rtts
+
+
+def in_thread(transport, exec_mode: str, send, receive, turns: int) -> list:
+    thread = threading.Thread(target=lambda: Interpreter(SCRIPT, transport=transport, mode=exec_mode).exec())
+    thread.start()
+    try:
+        return measure(send, receive, turns)
+    finally:
+        thread.join()
+
+
+def run_memory(turns: int, exec_mode: str) -> list:
+    transport = MemoryTransport()
+    return in_thread(transport, exec_mode, transport.send, transport.receive, turns)
+
+
+def run_unix(turns: int, exec_mode: str) -> list:
+    ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    reader = PipeReader(ours.fileno())
+    with ours, UnixTransport(theirs) as transport:
+        return in_thread(transport, exec_mode, lambda line: ours.sendall((line + "\n").encode()), reader.readline,
+                         turns)
+
+
+def run_fifo(turns: int, exec_mode: str) -> list:
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = os.path.join(workdir, "in"), os.path.join(workdir, "out")
+        for path in paths:
+            make_pipe(path)
+        write_fd, read_fd = os.open(paths[0], os.O_RDWR), os.open(paths[1], os.O_RDWR)
+        reader = PipeReader(read_fd)
+        try:
+            with FifoTransport(*paths) as transport:
+                return in_thread(transport, exec_mode, lambda line: os.write(write_fd, (line + "\n").encode()),
+                                 reader.readline, turns)
+        finally:
+            os.close(write_fd)
+            os.close(read_fd)
+
+
+def run_stdio(turns: int, exec_mode: str) -> list:
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "bench.sam")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write(SCRIPT)
+        proc = subprocess.Popen([sys.executable, SAMC, "run", source, "--exec-mode", exec_mode],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        reader = PipeReader(proc.stdout.fileno())
+
+        def send(line):
+            proc.stdin.write((line + "\n").encode())
+            proc.stdin.flush()
+
+        try:
+            return measure(send, reader.readline, turns)
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=2000, help="轮数")
+    parser.add_argument("--exec-mode", default="closure", choices=Interpreter.MODES)
+    args = parser.parse_args()
+
+    print("{:>8} {:>14} {:>12} {:>10}".format("传输", "往返中位(us)", "往返p99(us)", "轮/秒"))
+    for name, run in (("memory", run_memory), ("unix", run_unix), ("fifo", run_fifo), ("stdio", run_stdio)):
+        rtts = sorted(run(args.n, args.exec_mode))
+        print("{:>8} {:>14.1f} {:>12.1f} {:>10.0f}".format(name, statistics.median(rtts) * 1e6,
+                                                          rtts[int(len(rtts) * 0.99)] * 1e6, len(rtts) / sum(rtts)))
+
+
+if __name__ == '__main__':
+    main()
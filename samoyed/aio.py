@@ -0,0 +1,406 @@
+"""
+异步解释器
+
+`AsyncInterpreter`在asyncio的事件循环中执行程序，一个进程中可以同时进行很多个对话：
+
+* 函数调用的返回值如果是awaitable，会被await。`listen`、`sqlite`等内置函数都是协程，
+  `speak`的内容累积在`Context.output`中，等待输入或者结束时一次写入
+* 带时间控制的match用事件循环计时(`wait_for_match`)，不需要信号和计时线程
+* `exit()`只结束当前的对话，不会退出进程
+* sqlite在线程池中执行，不阻塞事件循环。连接来自进程内共享的连接池(见`pool`)，可以在任意线程中使用
+
+语句和表达式中不包含函数调用的部分仍然由同步的解释器执行(closure模式下使用编译好的闭包)，
+只有包含函数调用的部分才按异步的方式遍历语法树。执行结果与同步的解释器一致。
+
+传入的`listen`等函数应当是协程函数，或者是不会阻塞的普通函数。
+"""
+import asyncio
+import inspect
+import sys
+from functools import partial, reduce
+from operator import and_, not_, or_
+from typing import Any, Awaitable, Callable, List, Tuple, Union
+
+import lark
+
+from .core import Context, Interpreter
+from .exception import *
+from .libs import sqlite, sqlite_connect
+from .matcher import CaseMatcher
+
+# 是否包含函数调用，保存在语法树节点的这个属性上
+ASYNC_ATTR = "_samoyed_async"
+
+# 输入函数没有返回内容时，再次调用前等待的时间
+SLEEP_INTERVAL = 0.1
+
+
+async def call(func: Callable, *args) -> Any:
+    """调用函数，如果返回值是awaitable，等待它的结果
+    """
+    result = func(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def wait_for_match(func: Callable, max_wait: Union[int, float], min_wait: Union[int, float, None],
+                         cases: List[Any], sleep_interval: float = SLEEP_INTERVAL) \
+        -> Tuple[Union[int, None], Any]:
+    """不断调用输入函数，直到某个case匹配成功或者超时
+
+    与`libs.TimeControl`的语义一致：
+    * 超过min_wait之后才能因为匹配成功而结束，在这之前仍然会继续读取输入
+    * 超过max_wait时结束，视为沉默
+    等待输入时如果到了结束的时间，输入函数会被取消。输入结束(`EOFError`)之后不再调用输入函数，
+    直接等到结束的时间：已经匹配时等到min_wait，否则等到max_wait
+
+    Parameters
+    ----------
+    func
+        输入函数，可以是协程函数
+    max_wait
+        最长等待时间
+    min_wait
+        最短等待时间，可以为None
+    cases
+        每个case的值，不包含silence子句
+    sleep_interval
+        不会阻塞的输入函数返回None(还没有输入)时，再次调用前最多等待的时间。
+        会等待输入的函数(例如`StdinReader.readline`)不会返回None，不会定时醒来
+
+    Returns
+    -------
+        匹配成功的case的序号和正则匹配结果。如果超时，返回(None,None)
+
+    Raises
+    ------
+        `SamoyedRuntimeError`:
+            输入函数出错
+    """
+    loop = asyncio.get_running_loop()
+    matcher = CaseMatcher(cases, Interpreter._match_value)
+    index, result = matcher.feed("")
+    start = loop.time()
+    deadline = start + max_wait
+    can_exit = start + (min_wait if min_wait is not None else 0)
+    ended = False
+    while True:
+        now = loop.time()
+        if index is not None and now >= can_exit:
+            return index, result
+        if now >= deadline:
+            return None, None
+        # 已经匹配时只需要等到允许退出，否则等到超时
+        wake = can_exit if index is not None else deadline
+        if ended:
+            # 输入已经结束，不会再有新的输入
+            await asyncio.sleep(wake - now)
+            continue
+        try:
+            chunk = await asyncio.wait_for(call(func), wake - now)
+        except asyncio.TimeoutError:
+            continue
+        except EOFError:
+            ended = True
+            continue
+        except Exception as e:
+            raise SamoyedRuntimeError(str(e))
+        if chunk is None:
+            # 不会阻塞的输入函数还没有输入，防止频繁调用
+            await asyncio.sleep(min(sleep_interval, max(wake - loop.time(), 0)))
+        else:
+            index, result = matcher.feed(chunk)
+
+
+class StdinReader:
+    """
+    异步读取标准输入，一个进程只有一个
+    """
+    _reader = None  # type:Union[asyncio.StreamReader,None]
+    # 在线程中读取时还没有结果的readline，超时被取消后留给下一次读取
+    _pending = None  # type:Union[asyncio.Future,None]
+
+    @classmethod
+    async def readline(cls) -> str:
+        """读取一行，不包含换行符
+
+        Raises
+        ------
+            `EOFError`:
+                输入已经结束
+        """
+        if cls._reader is None:
+            loop = asyncio.get_running_loop()
+            reader = asyncio.StreamReader()
+            try:
+                await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            except (ValueError, OSError):
+                # 普通文件等不能注册到事件循环，在线程中读取。
+                # 线程中的readline无法取消，等待被取消时(例如超时)不能丢掉读到的行
+                if cls._pending is None or cls._pending.get_loop() is not loop:
+                    cls._pending = loop.run_in_executor(None, sys.stdin.readline)
+                try:
+                    line = await asyncio.shield(cls._pending)
+                except asyncio.CancelledError:
+                    # 读到的行留给下一次读取
+                    raise
+                except Exception:
+                    cls._pending = None
+                    raise
+                cls._pending = None
+                if not line:
+                    raise EOFError
+                return line.rstrip("\n")
+            cls._reader = reader
+        line = await cls._reader.readline()
+        if not line:
+            raise EOFError
+        return line.decode("utf-8").rstrip("\n")
+
+
+class AsyncContext(Context):
+    """
+    异步解释器的上下文，内置的listen、sqlite是协程
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.names["speak"] = self.output
+        self.names["listen"] = self.listen
+        self.names["exit"] = self.exit
+        self.names["sqlite_connect"] = self.sqlite_connect
+        self.names["sqlite"] = self.sqlite
+
+    async def listen(self) -> str:
+        """交出speak累积的输出，再从标准输入读取一行
+        """
+        self.output.flush()
+        return await StdinReader.readline()
+
+    def exit(self) -> None:
+        """结束当前的对话
+        """
+        self.set_exit()
+        raise SystemExit
+
+    def _run_sqlite(self, func: Callable, *args) -> Awaitable:
+        # 连接池中的连接不绑定线程，在事件循环默认的线程池中执行
+        return asyncio.get_running_loop().run_in_executor(None, partial(func, self.conn2curosr, *args))
+
+    async def sqlite_connect(self, db_name: str):
+        return await self._run_sqlite(sqlite_connect, db_name)
+
+    async def sqlite(self, cursor, sql: str):
+        return await self._run_sqlite(sqlite, cursor, sql)
+
+
+class AsyncInterpreter(Interpreter):
+    """
+    异步解释器
+
+    用法::
+
+        interpreter = AsyncInterpreter(code)
+        await interpreter.init()
+        await interpreter.exec()
+
+    没有调用`init`时，`exec`会先完成初始化。不支持vm模式
+    """
+    MODES = ("tree", "closure")
+    context_class = AsyncContext
+
+    def __init__(self, code: Union[str, lark.Tree], context: dict = None, args: dict = None, cache=True,
+                 mode: str = "tree"):
+        """
+        Parameters
+        ----------
+        code
+            代码
+        context
+            额外的上下文
+        args
+            命令行等特殊参数
+        cache
+            语法树缓存，见`Interpreter`
+        mode
+            执行模式，见MODES
+        """
+        # 外部语句可能调用协程，初始化需要在事件循环中进行
+        super().__init__(code, context=context, args=args, dont_init=True, cache=cache, mode=mode)
+
+    async def init(self) -> None:
+        """执行所有外部的语句
+        """
+        for node in self._init_steps():
+            await self.exec_statement_async(node)
+
+    async def exec(self) -> None:
+        """执行程序，程序调用exit()或者没有下一个状态时结束
+        """
+        try:
+            if not self.is_init:
+                await self.init()
+            while True:
+                for stat in self.context.stage.body:
+                    # 遍历并执行每个状态中的语句
+                    await self.exec_statement_async(stat)
+                    # 如果调用了exit，直接退出
+                    if self.context.is_exit():
+                        return
+                if self.context.next is None:
+                    return
+                self.context.stage = self.context.next
+                self.context.next = None
+        except SystemExit:
+            # exit()只结束当前的对话
+            self.context.set_exit()
+        finally:
+            self._flush_output()
+            self.context.close()
+
+    @staticmethod
+    def _is_async(node: Any) -> bool:
+        """判断语法树中是否有函数调用或者带时间控制的match，结果保存在节点上
+        """
+        if not isinstance(node, lark.Tree):
+            return False
+        result = getattr(node, ASYNC_ATTR, None)
+        if result is None:
+            result = node.data == "funccall" or node.data == "at_expr" or \
+                     any([AsyncInterpreter._is_async(child) for child in node.children])
+            setattr(node, ASYNC_ATTR, result)
+        return result
+
+    async def _exec_block(self, statements: List[lark.Tree], checked: bool = True) -> None:
+        """执行块中的每个语句，checked时执行了branch后跳过剩余的语句
+        """
+        for stmt in statements:
+            await self.exec_statement_async(stmt)
+            if checked and self.context.next is not None:
+                return
+
+    async def exec_statement_async(self, stat: lark.Tree) -> None:
+        """执行一个语句，见`Interpreter.exec_statement`
+        """
+        if not self._is_async(stat):
+            # 没有函数调用，同步执行
+            self.exec_statement(stat)
+            return
+        if stat.data == "simple_stmt":
+            simple_stmt = stat.children[0]
+            if simple_stmt.data == "assign_expr":
+                self.context.frame.set(simple_stmt.children[0].value,
+                                       await self.get_expression_async(simple_stmt.children[2]))
+            else:
+                await self.get_expression_async(simple_stmt)
+        elif stat.data == "match_stmt":
+            expr = stat.children[0]
+            if isinstance(expr, lark.Tree) and expr.data == "at_expr":
+                await self._time_control_match(stat)
+            else:
+                await self._normal_match(stat)
+        elif stat.data == "if_stmt":
+            if bool(await self.get_expression_async(stat.children[0])):
+                await self._exec_block(stat.children[1].children)
+            elif len(stat.children) == 3:
+                await self._exec_block(stat.children[2].children)
+        else:
+            raise SamoyedNotImplementError
+
+    async def _normal_match(self, stat: lark.Tree) -> None:
+        """普通的match，见`Interpreter.__normal_match`
+        """
+        expr_result = await self.get_expression_async(stat.children[0])
+        for case_statment in stat.children[1:]:
+            if case_statment.data == "default_stmt":
+                await self._exec_block(case_statment.children)
+                break
+            matching_value = await self.get_expression_async(case_statment.children[0])
+            is_matched, result = self._match_value(matching_value, expr_result)
+            if is_matched:
+                await self._exec_block(case_statment.children[1:], checked=False)
+                self._bind_match_groups(result)
+                break
+
+    async def _time_control_match(self, stat: lark.Tree) -> None:
+        """带时间控制的match，见`Interpreter.__time_control_match`
+        """
+        expr = stat.children[0]
+        func = self.context.frame.get(expr.children[1], None)
+        if func is None or not callable(func):
+            raise SamoyedNameError("No such function {}".format(expr.children[1]))
+        if expr.children[2] is not None:
+            func = partial(func, *[await self.get_expression_async(i) for i in expr.children[2].children])
+        times = expr.children[0].children
+        cases = [case_statment for case_statment in stat.children[1:] if case_statment.data != "silence_stmt"]
+        values = [await self.get_expression_async(case_statment.children[0]) for case_statment in cases]
+
+        index, result = await self._wait_for_match(func, times[0], times[1] if len(times) > 1 else None, values)
+        if index is not None:
+            # 将正则匹配结果绑定到特殊变量上
+            self._bind_match_groups(result)
+            await self._exec_block(cases[index].children[1:])
+        elif stat.children[-1].data == "silence_stmt":
+            await self._exec_block(stat.children[-1].children)
+
+    async def _wait_for_match(self, func: Callable, max_wait: Union[int, float], min_wait: Union[int, float, None],
+                              cases: List[Any]) -> Tuple[Union[int, None], Any]:
+        """等待输入直到匹配或者超时，见`wait_for_match`
+        """
+        self._flush_output()
+        return await wait_for_match(func, max_wait, min_wait, cases)
+
+    async def get_expression_async(self, expr: Any) -> Any:
+        """获取表达式的值，函数的返回值是awaitable时等待它的结果
+
+        只处理包含函数调用的节点，其余的由`Interpreter.get_expression`计算，
+        运算的细节和抛出的异常与它一致
+        """
+        if not self._is_async(expr):
+            return self.get_expression(expr)
+        data = expr.data
+        if data == "funccall":
+            func = self.context.frame.get(expr.children[0], None)
+            if func is None or not callable(func):
+                raise SamoyedNameError("No such function {}".format(expr.children[0]))
+            try:
+                if expr.children[1] is not None:
+                    # 如果有参数
+                    return await call(func, *[await self.get_expression_async(i) for i in expr.children[1].children])
+                return await call(func)
+            except Exception as e:
+                # 函数可能会崩溃
+                raise SamoyedRuntimeError(str(e))
+        elif data == "conditional_expr":
+            if await self.get_expression_async(expr.children[0]):
+                return await self.get_expression_async(expr.children[1])
+            return await self.get_expression_async(expr.children[2])
+        elif data == "compare_expr":
+            left = await self.get_expression_async(expr.children[0])
+            right = await self.get_expression_async(expr.children[2])
+            op = self.compare_operator[expr.children[1].children[0]]
+            try:
+                return op(left, right)
+            except Exception:
+                raise SamoyedTypeError("can not compare{} and {}".format(type(left), type(right)))
+        elif data == "not_test":
+            return bool(not_(await self.get_expression_async(expr.children[0])))
+        elif data == "or_test" or data == "and_test":
+            values = [await self.get_expression_async(i) for i in expr.children]
+            return bool(reduce(or_ if data == "or_test" else and_, values))
+        elif data == "plus_expr" or data == "mul_expr":
+            # 与同步的解释器一致，计算操作数时的异常也转换成SamoyedRuntimeError
+            try:
+                return self.reduce([await self.get_expression_async(i) for i in expr.children])
+            except Exception:
+                raise SamoyedRuntimeError("can not compute {}".format(expr))
+        elif data == "factor":
+            tmp = await self.get_expression_async(expr.children[1])
+            if expr.children[0] == '-':
+                if isinstance(tmp, str):
+                    raise SamoyedTypeError("can not add '-' to string")
+                return -tmp
+            return tmp
+        else:
+            raise SamoyedNotImplementError
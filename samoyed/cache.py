@@ -0,0 +1,175 @@
+"""
+语法树缓存
+
+以源代码和文法指纹的哈希作为键，把语法分析的结果以二进制形式保存在磁盘上。
+源代码没有变化时，直接读取语法树，跳过词法和语法分析。
+"""
+import hashlib
+import os
+import tempfile
+from typing import Set, Tuple, Union
+
+import lark
+
+from .exception import SamoyedFormatError
+from .serialize import dumps, loads
+from .utils import get_cache_dir
+
+NO_CACHE_ENV = "SAMOYED_NO_CACHE"  # 设置后不使用语法树缓存
+CACHE_SIZE_ENV = "SAMOYED_CACHE_SIZE"  # 缓存最大字节数
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class ASTCache:
+    """
+    语法树缓存
+
+    每个源代码对应目录下的一个文件。命中时会更新文件的修改时间，
+    写入后如果目录超过了大小上限，会从最久未使用的文件开始删除。
+    """
+
+    SUFFIX = ".ast"
+
+    def __init__(self, directory: str, salt: str = "", max_size: int = DEFAULT_MAX_SIZE):
+        """
+        Parameters
+        ----------
+        directory
+            缓存目录
+        salt
+            参与计算键的额外字符串，一般为文法指纹
+        max_size
+            缓存目录的最大字节数
+        """
+        self.directory = directory
+        self.salt = salt
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source: str) -> str:
+        """计算源代码对应的键
+        """
+        return hashlib.sha256("{}\0{}".format(self.salt, source).encode("utf-8")).hexdigest()
+
+    def path(self, source: str) -> str:
+        return os.path.join(self.directory, self.key(source) + self.SUFFIX)
+
+    def get(self, source: str) -> Union[Tuple[lark.Tree, Set[str]], None]:
+        """读取缓存
+
+        Parameters
+        ----------
+        source
+            源代码
+
+        Returns
+        -------
+            语法树和扫描到的dollar符号。未命中或者缓存损坏时返回None
+        """
+        path = self.path(source)
+        try:
+            with open(path, "rb") as f:
+                dollar, ast = loads(f.read())
+            os.utime(path)
+        except (OSError, TypeError, ValueError, SamoyedFormatError):
+            return None
+        return ast, set(dollar)
+
+    def put(self, source: str, ast: lark.Tree, dollar: Set[str]) -> None:
+        """写入缓存
+
+        先写入临时文件再重命名，多个进程同时写入也不会读到不完整的文件
+
+        Parameters
+        ----------
+        source
+            源代码
+        ast
+            语法树
+        dollar
+            扫描到的dollar符号
+        """
+        data = dumps([sorted(dollar), ast])
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path(source))
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """删除最久未使用的文件，直到缓存大小不超过上限
+        """
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(self.SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+        except OSError:
+            return
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        """清空缓存
+        """
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.SUFFIX):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+
+def default_cache(salt: str) -> Union[ASTCache, None]:
+    """根据环境变量创建默认的语法树缓存
+
+    * SAMOYED_NO_CACHE 不为空时，不使用缓存
+    * SAMOYED_CACHE_DIR 指定缓存目录，语法树保存在其中的ast目录下
+    * SAMOYED_CACHE_SIZE 指定缓存的最大字节数
+
+    Parameters
+    ----------
+    salt
+        文法指纹
+
+    Returns
+    -------
+        缓存对象。如果禁用了缓存或者无法创建目录，返回None
+    """
+    if os.environ.get(NO_CACHE_ENV):
+        return None
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    try:
+        max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_MAX_SIZE))
+    except ValueError:
+        max_size = DEFAULT_MAX_SIZE
+    try:
+        return ASTCache(os.path.join(cache_dir, "ast"), salt=salt, max_size=max_size)
+    except OSError:
+        return None
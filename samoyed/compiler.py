@@ -0,0 +1,321 @@
+"""
+表达式编译
+
+把表达式子树编译成预先绑定好的python闭包。
+闭包只接受一个参数：上下文(`core.Context`)，返回表达式的值。
+变量在编译时就确定了在符号表中的下标(见`frame`)，求值时直接按下标读取。
+
+编译时会完成树遍历解释器在每次求值时都要做的工作：
+判断节点类型、查找运算符、拆出常量、驻留变量名。
+编译结果与树遍历解释器(`Interpreter.get_expression`)的结果和抛出的异常保持一致。
+"""
+import re
+import sys
+import weakref
+from functools import reduce
+from numbers import Number
+from operator import not_, or_, and_
+from typing import Any, Callable, Dict
+
+import lark
+
+from .exception import *
+from .frame import Frame, SymbolTable, UNSET
+from .libs import compile_regex
+
+# 编译后的表达式
+Closure = Callable[[Any], Any]
+
+# 编译结果保存在树节点的这个属性上。闭包不绑定解释器，因此可以在多个解释器之间共享
+CLOSURE_ATTR = "_samoyed_closure"
+
+# 编译结果只由类型和值决定的终结符，按(类型,值)缓存
+CACHED_TOKENS = frozenset(["STR", "none", "true", "false", "SIGNED_INT", "SIGNED_FLOAT", "NAME", "DOLLAR_VAR"])
+
+# 可以编译的非终结符表达式
+EXPRESSION_RULES = frozenset(["add_op", "mul_op", "conditional_expr", "compare_expr", "not_test", "or_test",
+                              "and_test", "plus_expr", "mul_expr", "factor", "funccall", "reg"])
+
+
+def _constant(value: Any) -> Closure:
+    return lambda ctx: value
+
+
+def _load(frame: Frame, symbols: SymbolTable, slot: int, name: str) -> Any:
+    """读取变量，没有赋值时返回None
+
+    frame使用编译时的符号表时直接按下标读取，否则按名字查找
+    """
+    if frame.symbols is symbols:
+        try:
+            value = frame.slots[slot]
+        except IndexError:
+            # 名字是在frame创建之后才加入符号表的
+            value = UNSET
+        if value is not UNSET:
+            return value
+    # 没有赋值的槽，值可能在frame.extra中
+    return frame.get(name)
+
+
+def _raise(exception: Callable[[], Exception]) -> Closure:
+    """求值时才抛出异常，与树遍历解释器的行为一致"""
+
+    def closure(ctx):
+        raise exception()
+
+    return closure
+
+
+class ExpressionCompiler:
+    """
+    表达式编译器
+    """
+
+    def __init__(self, compare_operator: Dict[str, Callable], arith_operator: Dict[str, Callable],
+                 reduce_func: Callable[[list], Any]):
+        """
+        Parameters
+        ----------
+        compare_operator
+            比较运算符表
+        arith_operator
+            算术运算符表
+        reduce_func
+            计算[1,+,2,-,3]形式列表的函数，即`Interpreter.reduce`
+        """
+        self.compare_operator = compare_operator
+        self.arith_operator = arith_operator
+        self.reduce_func = reduce_func
+        # 终结符和常量没有保存属性的地方，编译结果按符号表分别缓存，程序被释放时一起释放
+        self._tokens = weakref.WeakKeyDictionary()  # type:weakref.WeakKeyDictionary[SymbolTable,Dict[tuple,Closure]]
+
+    def compile(self, expr: Any, symbols: SymbolTable) -> Closure:
+        """编译一个表达式
+
+        非终结符的编译结果会缓存在节点上，同一棵子树只会编译一次；
+        常量和变量按(类型,值)缓存，例如case的值、赋值的右边在每次求值时不会重新编译
+
+        Parameters
+        ----------
+        expr
+            表达式树、终结符或者常量
+        symbols
+            程序的符号表，变量按其中的下标读取
+
+        Returns
+        -------
+            闭包
+        """
+        if isinstance(expr, lark.Tree):
+            closure = getattr(expr, CLOSURE_ATTR, None)
+            if closure is None:
+                closure = self._compile_tree(expr, symbols)
+                setattr(expr, CLOSURE_ATTR, closure)
+            return closure
+        elif isinstance(expr, lark.Token):
+            if expr.type not in CACHED_TOKENS:
+                return self._compile_token(expr, symbols)
+            key = (expr.type, expr.value)
+        elif isinstance(expr, Number) or isinstance(expr, str) or expr is None:
+            # 解析时已经转换成python值的常量。类型也是键的一部分，1、1.0和True不会共用
+            key = (type(expr), expr)
+        else:
+            return _raise(SamoyedNotImplementError)
+        closures = self._tokens.get(symbols)
+        if closures is None:
+            closures = self._tokens.setdefault(symbols, {})
+        closure = closures.get(key)
+        if closure is None:
+            closure = self._compile_token(expr, symbols) if isinstance(expr, lark.Token) else _constant(expr)
+            closures[key] = closure
+        return closure
+
+    def compile_program(self, ast: lark.Tree, symbols: SymbolTable) -> None:
+        """预先编译程序中所有的表达式
+
+        Parameters
+        ----------
+        ast
+            程序的语法树
+        symbols
+            程序的符号表
+        """
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            for child in node.children:
+                if isinstance(child, lark.Tree):
+                    if child.data in EXPRESSION_RULES:
+                        self.compile(child, symbols)
+                    else:
+                        stack.append(child)
+
+    @staticmethod
+    def _compile_token(expr: lark.Token, symbols: SymbolTable) -> Closure:
+        if expr.type == "STR" or expr.type == 'none' or \
+                expr.type == "true" or expr.type == "false" or \
+                expr.type == "SIGNED_INT" or expr.type == "SIGNED_FLOAT":
+            return _constant(expr)
+        elif expr.type == "NAME" or expr.type == "DOLLAR_VAR":
+            name = sys.intern(str(expr.value))
+            slot = symbols.slot(name)
+
+            def load(ctx):
+                # 与_load相同，展开以减少一次函数调用
+                frame = ctx.frame
+                if frame.symbols is symbols:
+                    try:
+                        var = frame.slots[slot]
+                    except IndexError:
+                        var = UNSET
+                    if var is UNSET:
+                        var = frame.get(name)
+                else:
+                    var = frame.get(name)
+                if var is not None:
+                    return var
+                raise SamoyedNameError("No such variable {}".format(name))
+
+            return load
+        else:
+            return _raise(lambda: SamoyedInterpretError(expr.type, pos=(expr.line, expr.column)))
+
+    def _compile_tree(self, expr: lark.Tree, symbols: SymbolTable) -> Closure:
+        data = expr.data
+        children = expr.children
+        if data == "add_op" or data == "mul_op":
+            op = self.arith_operator.get(children[0])
+            if op is None:
+                return _raise(lambda: KeyError(children[0]))
+            return _constant(op)
+        elif data == "conditional_expr":
+            test, first, second = (self.compile(child, symbols) for child in children)
+            return lambda ctx: first(ctx) if test(ctx) else second(ctx)
+        elif data == "compare_expr":
+            return self._compile_compare(expr, symbols)
+        elif data == "not_test":
+            operand = self.compile(children[0], symbols)
+            return lambda ctx: bool(not_(operand(ctx)))
+        elif data == "or_test" or data == "and_test":
+            # 与解释器一致：所有子句都会被求值，没有短路
+            op = or_ if data == "or_test" else and_
+            operands = [self.compile(child, symbols) for child in children]
+            return lambda ctx: bool(reduce(op, [operand(ctx) for operand in operands]))
+        elif data == "plus_expr" or data == "mul_expr":
+            return self._compile_arith(expr, symbols)
+        elif data == "factor":
+            operand = self.compile(children[1], symbols)
+            if children[0] != '-':
+                return operand
+
+            def negative(ctx):
+                tmp = operand(ctx)
+                if isinstance(tmp, str):
+                    raise SamoyedTypeError("can not add '-' to string")
+                return -tmp
+
+            return negative
+        elif data == "funccall":
+            return self._compile_funccall(expr, symbols)
+        elif data == "reg":
+            pattern = children[0].value
+            try:
+                return _constant(compile_regex(pattern))
+            except re.error:
+                # 错误的正则表达式在求值时才报错
+                return lambda ctx: compile_regex(pattern)
+        else:
+            return _raise(SamoyedNotImplementError)
+
+    def _compile_compare(self, expr: lark.Tree, symbols: SymbolTable) -> Closure:
+        left, right = self.compile(expr.children[0], symbols), self.compile(expr.children[2], symbols)
+        op = self.compare_operator.get(expr.children[1].children[0])
+        if op is None:
+            return _raise(lambda: KeyError(expr.children[1].children[0]))
+
+        def compare(ctx):
+            lvalue = left(ctx)
+            rvalue = right(ctx)
+            try:
+                # 两种类型可能不能比较
+                return op(lvalue, rvalue)
+            except Exception:
+                raise SamoyedTypeError("can not compare{} and {}".format(type(lvalue), type(rvalue)))
+
+        return compare
+
+    def _compile_arith(self, expr: lark.Tree, symbols: SymbolTable) -> Closure:
+        """
+        加法或乘法，形如[1,+,2,-,3]
+        所有操作数先全部求值，再从左到右计算。任何错误都会转换为SamoyedRuntimeError
+        """
+        children = expr.children
+        operands = [self.compile(child, symbols) for child in children[0::2]]
+        ops = []
+        for child in children[1::2]:
+            if not isinstance(child, lark.Tree) or child.data not in ("add_op", "mul_op") \
+                    or child.children[0] not in self.arith_operator:
+                ops = None
+                break
+            ops.append(self.arith_operator[child.children[0]])
+        if ops is None or len(children) % 2 == 0:
+            # 不规范的树，按解释器的方式逐项计算
+            items = [self.compile(child, symbols) for child in children]
+            reduce_func = self.reduce_func
+
+            def generic(ctx):
+                try:
+                    return reduce_func([item(ctx) for item in items])
+                except Exception:
+                    raise SamoyedRuntimeError("can not compute {}".format(expr))
+
+            return generic
+
+        if len(operands) == 2:
+            left, right = operands
+            op = ops[0]
+
+            def binary(ctx):
+                try:
+                    return op(left(ctx), right(ctx))
+                except Exception:
+                    raise SamoyedRuntimeError("can not compute {}".format(expr))
+
+            return binary
+
+        def arith(ctx):
+            try:
+                values = [operand(ctx) for operand in operands]
+                result = values[0]
+                for op, value in zip(ops, values[1:]):
+                    result = op(result, value)
+                return result
+            except Exception:
+                raise SamoyedRuntimeError("can not compute {}".format(expr))
+
+        return arith
+
+    def _compile_funccall(self, expr: lark.Tree, symbols: SymbolTable) -> Closure:
+        name = sys.intern(str(expr.children[0]))
+        slot = symbols.slot(name)
+        if expr.children[1] is not None:
+            args = [self.compile(child, symbols) for child in expr.children[1].children]
+        else:
+            args = None
+
+        def call(ctx):
+            if (func := _load(ctx.frame, symbols, slot, name)) is not None and callable(func):
+                try:
+                    if args is not None:
+                        # 如果有参数
+                        return func(*[arg(ctx) for arg in args])
+                    else:
+                        return func()
+                except Exception as e:
+                    # 函数可能会崩溃
+                    raise SamoyedRuntimeError(str(e))
+            else:
+                raise SamoyedNameError("No such function {}".format(name))
+
+        return call
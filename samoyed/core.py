@@ -1,12 +1,13 @@
+import hashlib
 import os
 import re
-import sqlite3
+from functools import lru_cache
 from functools import partial
 from functools import reduce
 from numbers import Number
 from operator import lt, le, eq, ne, ge, gt, not_, or_, and_ \
     , sub, mul, mod, truediv, floordiv
-from typing import Union, Dict
+from typing import Any, Callable, Union, Dict, Iterator, Tuple
 import sys
 
 import lark
@@ -14,13 +15,27 @@ from lark import Lark, Transformer
 from lark.exceptions import UnexpectedToken, UnexpectedEOF
 from lark.indenter import Indenter
 
+from .cache import ASTCache, default_cache
+from . import vm
+from .compiler import ExpressionCompiler
 from .exception import *
-from .libs import TimeControl, arg_seq_add, arg_option_add, mock_add, sqlite, sqlite_connect
+from .frame import DictFrame, Frame, Namespace, SymbolTable
+from .link import LINK_ATTR, PATTERN_ATTR, State, compile_patterns, link
+from .libs import TimeControl, arg_seq_add, arg_option_add, compile_regex, mock_add, sqlite, sqlite_close, \
+    sqlite_connect
+from .matcher import CaseMatcher
+from .pool import Database
+from .source import CallableSource, FlushingSource, InputSource, input_source
+from .transport import StdioTransport, Transport
+from .utils import get_cache_dir
 
 """
 解释器核心
 """
 
+# 文法文件的位置
+GRAMMAR_FILE = "{}/samoyed.gram".format(os.path.abspath(os.path.dirname(__file__)))
+
 
 class SamoyedIndenter(Indenter):
     """
@@ -66,12 +81,90 @@ class SamoyedTransformer(Transformer):
         return value
 
 
+@lru_cache(maxsize=None)
+def _load_grammar() -> Tuple[str, str]:
+    """读取文法，并计算文法的指纹
+
+    Returns
+    -------
+        文法文本和指纹。指纹由文法内容和lark的版本共同决定
+    """
+    with open(GRAMMAR_FILE, encoding="utf-8") as f:
+        grammar = f.read()
+    digest = hashlib.sha256("{}\0{}".format(grammar, lark.__version__).encode("utf-8")).hexdigest()[:16]
+    return grammar, digest
+
+
+def grammar_hash() -> str:
+    """文法指纹
+
+    文法或者lark版本变化时，指纹也会变化。可以用于区分各种缓存
+    """
+    return _load_grammar()[1]
+
+
+_parser = None  # type:Union[Lark,None]
+
+
+def get_parser() -> Lark:
+    """获取语法分析器
+
+    语法分析器只会在第一次需要解析源代码时才创建。
+    lalr分析表会被序列化到缓存目录下，文件名中带有文法指纹；
+    之后的进程直接读取分析表，不再重新分析文法。
+
+    Returns
+    -------
+        lark语法分析器
+    """
+    global _parser
+    if _parser is None:
+        grammar, digest = _load_grammar()
+        cache_dir = get_cache_dir()
+        cache = os.path.join(cache_dir, "parser-{}.lark".format(digest)) if cache_dir is not None else False
+        _parser = Lark(grammar, parser='lalr', postlex=SamoyedIndenter(), transformer=Interpreter.transformer,
+                       cache=cache)
+    return _parser
+
+
+_ast_cache = None  # type:Union[ASTCache,None,bool]
+
+
+def get_ast_cache() -> Union[ASTCache, None]:
+    """获取默认的语法树缓存
+
+    见`cache.default_cache`。禁用缓存时返回None
+    """
+    global _ast_cache
+    if _ast_cache is None:
+        _ast_cache = default_cache(grammar_hash()) or False
+    return _ast_cache or None
+
+
+def bind_match_groups(names: dict, result: Union[re.Match, None]) -> None:
+    """
+    将正则匹配结果绑定到特殊变量$mg0,$mg1...上
+
+    Parameters
+    ----------
+    names
+        变量表
+    result
+        正则匹配结果，为None时什么也不做
+    """
+    if result is not None:
+        names["$mg0"] = result.group(0)
+        for i, group in enumerate(result.groups()):
+            names["$mg{}".format(i + 1)] = group
+
+
 class Context:
     """
     上下文
     """
 
-    def __init__(self, names: dict = None, dollar_names: Dict[str, str] = None):
+    def __init__(self, names: dict = None, dollar_names: Dict[str, str] = None, symbols: SymbolTable = None,
+                 transport: Transport = None):
         """
         Notes
         ---------
@@ -84,8 +177,16 @@ class Context:
             外部传入的变量表
         dollar_names
             传入的参数
+        symbols
+            符号表，一般由解释器传入程序的符号表。为None时按名字保存变量(`frame.DictFrame`)，树遍历模式使用
+        transport
+            listen和speak使用的传输，见`transport`。为None时使用标准输入输出
         """
-        self.names = dict(names) if names is not None else dict()
+        # 变量按下标保存在frame中，names是它的字典视图
+        self.frame = Frame(symbols) if symbols is not None else DictFrame()
+        self.__names = Namespace(self.frame)
+        if names is not None:
+            self.names.update(names)
         self.seq_args = []
         self.option_args = []
 
@@ -97,22 +198,59 @@ class Context:
                 self.names["$" + key] = dollar_names[key]
 
         # 绑定内置函数
-        self.conn2curosr = {}  # type:Dict[sqlite3.Cursor,sqlite3.Connection]
+        # 对话打开的数据库，连接从进程内共享的连接池中取出(见`pool`)，close时释放
+        self.conn2curosr = {}  # type:Dict[str,Database]
+        # 带时间控制的match的输入函数在后台线程中调用(`source.CallableSource`)，按match保存，
+        # 没有结束的调用留给同一个match的下一次读取，close时丢弃
+        self.input_sources = {}  # type:Dict[Any,CallableSource]
+        # listen从transport读取，speak的内容累积在output中，等待输入或者结束时一次写入
+        self.transport = transport if transport is not None else StdioTransport()
+        self.output = self.transport.output
         self.names["print"] = sys.stderr.write
-        self.names["speak"] = print
-        self.names["listen"] = input
+        self.names["speak"] = self.output
+        self.names["listen"] = FlushingSource(self.output.flush, lambda: self.transport.source)
         self.names["exit"] = sys.exit
         self.names["arg_seq_add"] = partial(arg_seq_add, self.seq_args)
         self.names["arg_option_add"] = partial(arg_option_add, self.option_args)
         self.names["sqlite_connect"] = partial(sqlite_connect, self.conn2curosr)
         self.names["sqlite"] = partial(sqlite, self.conn2curosr)
-        self.names["eval"] = lambda str: eval(str, self.names)
+        # eval需要一个真正的字典，传入变量的副本
+        self.names["eval"] = lambda str: eval(str, self.names.copy())
 
         # 状态初始化
-        self.stage = None  # type:lark.tree.Tree
-        self.next = None  # type:lark.tree.Tree
+        self.stage = None  # type:State
+        self.next = None  # type:State
         self.__exit = False
 
+    @property
+    def names(self) -> Namespace:
+        """变量表，frame的字典视图
+        """
+        return self.__names
+
+    @names.setter
+    def names(self, names: dict) -> None:
+        """用一个字典替换所有的变量
+        """
+        self.frame.clear()
+        self.__names.update(names)
+
+    def use_symbols(self, symbols: SymbolTable) -> None:
+        """换成另一个符号表，保留所有的变量
+
+        Parameters
+        ----------
+        symbols
+            符号表
+        """
+        if isinstance(self.frame, Frame):
+            self.frame.rebind(symbols)
+            return
+        frame = Frame(symbols)
+        for name, value in self.frame.items():
+            frame.set(name, value)
+        self.frame = self.__names.frame = frame
+
     def is_exit(self) -> bool:
         """判断当前程序是否已经退出
         Returns
@@ -128,6 +266,29 @@ class Context:
         """
         self.__exit = True
 
+    def input_source(self, site: Any, func: Callable) -> InputSource:
+        """带时间控制的match的输入源
+
+        Parameters
+        ----------
+        site
+            match的位置，同一个位置的输入函数复用同一个`CallableSource`
+        func
+            输入函数，每次执行match时可能是新绑定了参数的函数
+        """
+        source = input_source(func, reuse=self.input_sources.get(site))
+        if isinstance(source, CallableSource):
+            self.input_sources[site] = source
+        return source
+
+    def close(self) -> None:
+        """对话结束时释放打开的数据库和输入源
+        """
+        sqlite_close(self.conn2curosr)
+        for source in self.input_sources.values():
+            source.close()
+        self.input_sources.clear()
+
 
 class Interpreter:
     """解释器类
@@ -135,13 +296,20 @@ class Interpreter:
 
     # 语法制导。用于构件AST时转换一些常量
     # 因为每次语法制导
+    # 语法分析器见get_parser，只有在需要解析代码时才会创建
     transformer = SamoyedTransformer()
 
-    # 读取文法
-    with open("{}/samoyed.gram".format(os.path.abspath(os.path.dirname(__file__)))) as f:
-        parser = Lark(f.read(), parser='lalr', postlex=SamoyedIndenter(), transformer=transformer)
+    # 执行模式
+    # tree: 遍历语法树求值
+    # closure: 预先把表达式编译成闭包
+    # vm: 表达式编译成闭包，状态编译成指令序列，由虚拟机执行
+    MODES = ("tree", "closure", "vm")
 
-    def __init__(self, code: Union[str, lark.Tree], context: dict = None, args: dict = None, dont_init=False):
+    # 上下文的类型
+    context_class = Context
+
+    def __init__(self, code: Union[str, lark.Tree], context: dict = None, args: dict = None, dont_init=False,
+                 cache: Union[bool, ASTCache] = True, mode: str = "tree", transport: Transport = None):
         """
         Parameters
         ----------
@@ -153,25 +321,43 @@ class Interpreter:
             命令行等特殊参数
         dont_init:bool
             是否执行初始化
+        cache:Union[bool, ASTCache]
+            语法树缓存。True使用默认缓存，False不使用缓存
+        mode:str
+            执行模式，见MODES
+        transport:Transport
+            listen和speak使用的传输，见`transport`。为None时使用标准输入输出
         """
+        if mode not in self.MODES:
+            raise SamoyedInterpretError("unknown mode {}".format(mode))
+        self.mode = mode
         self.__isinit = False
         self.transformer.dollar.clear()
 
         # 词法和语法分析
         if isinstance(code, str):
-            # 如果传入的是代码
-            try:
-                self.ast = self.parser.parse(code)  # type:lark.tree.Tree
-                # 提取出扫描到的dollar符号
-                self.dollar_symbol = self.transformer.dollar.copy()
-            except (UnexpectedEOF, UnexpectedToken) as e:
-                raise SamoyedSyntaxError(e.expected, e.token, pos=(e.line, e.column))
+            # 如果传入的是代码，先查找缓存
+            ast_cache = get_ast_cache() if cache is True else (cache or None)
+            cached = ast_cache.get(code) if ast_cache is not None else None
+            if cached is not None:
+                self.ast, self.dollar_symbol = cached
+            else:
+                try:
+                    self.ast = get_parser().parse(code)  # type:lark.tree.Tree
+                    # 提取出扫描到的dollar符号
+                    self.dollar_symbol = self.transformer.dollar.copy()
+                except (UnexpectedEOF, UnexpectedToken) as e:
+                    raise SamoyedSyntaxError(e.expected, e.token, pos=(e.line, e.column))
+                if ast_cache is not None:
+                    ast_cache.put(code, self.ast, self.dollar_symbol)
         else:
             # 否则直接绑定
             self.ast = code
 
-        # 建立上下文
-        self.context = Context(names=context, dollar_names=args)
+        # 为程序中的名字分配下标，建立上下文。树遍历模式不使用下标，变量按名字保存
+        self.symbols = SymbolTable.of(self.ast)
+        self.context = self.context_class(names=context, dollar_names=args,
+                                          symbols=self.symbols if self.mode != "tree" else None, transport=transport)
 
         # 初始化会执行所有外部的语句。
         if not dont_init:
@@ -185,37 +371,79 @@ class Interpreter:
             pass
         这里x=1就是外部的语句
         """
+        for node in self._init_steps():
+            # 如果不是状态，那么直接执行
+            self.exec_statement(node)
+
+    def _init_steps(self) -> Iterator[lark.Tree]:
+        """初始化的过程：确定所有的stage和入口，依次产生需要执行的外部语句，最后完成链接
+
+        外部语句由调用者执行(见`init`)，执行时只能看到它之前定义的状态
+
+        Returns
+        -------
+            需要执行的外部语句
+        """
         self.stage = dict()
         self.entrance = None
+        # 预先编译所有的正则字面量
+        compile_patterns(self.ast)
+        if self.mode != "tree":
+            # 预先编译所有的表达式
+            self.compiler.compile_program(self.ast, self.symbols)
         # 遍历AST的顶层，确定所有的stage和入口
         for node in self.ast.children:
             if node.data == 'statedef':
                 # 如果是状态定义
-                name = node.children[0]  # 第一个子节点是名称
+                state = State.of(node)
                 # 如果是入口，绑定入口点
-                if name == "main":
-                    self.entrance = self.stage[name] = node
+                if state.name == "main":
+                    self.entrance = self.stage[state.name] = state
                 else:
-                    self.stage[name] = node
+                    self.stage[state.name] = state
             else:
-                # 如果不是状态，那么直接执行
-                self.exec_statement(node)
+                yield node
 
         # 如果没有入口，报错
         if self.entrance is None:
             raise SamoyedNotFoundEntrance
 
+        # 把branch链接到目标状态，目标不存在时报错
+        link(self.stage)
+        if self.mode == "vm":
+            for state in self.stage.values():
+                state.code = self.bytecode.compile_state(state.node, self.symbols)
+
         self.context.stage = self.entrance
         self.__isinit = True
 
+    @property
+    def is_init(self) -> bool:
+        """是否已经完成初始化
+        """
+        return self.__isinit
+
     def exec(self) -> None:
         """解释执行程序
 
         """
         if not self.__isinit:
             return
+        try:
+            if self.mode == "vm":
+                self.__exec_vm()
+            else:
+                self.__exec_tree()
+        finally:
+            # 结束(包括exit和异常)时交出还没有写入的输出，释放数据库
+            self._flush_output()
+            self.context.close()
+
+    def __exec_tree(self) -> None:
+        """遍历语法树执行程序
+        """
         while True:
-            for stat in self.context.stage.children[1:]:
+            for stat in self.context.stage.body:
                 # 遍历并执行每个状态中的语句
                 self.exec_statement(stat)
                 # 如果调用了exit，直接退出
@@ -229,6 +457,22 @@ class Interpreter:
                 self.context.stage = self.context.next
                 self.context.next = None
 
+    def __exec_vm(self) -> None:
+        """用虚拟机执行程序
+        """
+        while True:
+            vm.run(self.context.stage.code, self)
+            # 如果调用了exit，直接退出
+            if self.context.is_exit() or self.context.next is None:
+                return
+            self.context.stage = self.context.next
+            self.context.next = None
+
+    def _flush_output(self) -> None:
+        """交出speak累积的输出，在等待输入之前和程序结束时调用
+        """
+        self.context.output.flush()
+
     def exec_statement(self, stat: lark.tree.Tree) -> None:
         """执行每一个语句
         可执行的语句有以下几种：
@@ -248,6 +492,9 @@ class Interpreter:
             `SamoyedTypeError`:
                 类型错误
         """
+        if self.mode == "vm":
+            vm.run(self.bytecode.compile_statement(stat, self.symbols), self)
+            return
         if stat.data == "simple_stmt":
             """
             如果是一个简单的表达式
@@ -277,9 +524,13 @@ class Interpreter:
                     |
                    node(NAME)
                 NAME即要跳转到的状态名
+                初始化时已经链接过的语句直接跳转，否则按名字查找
                 """
+                target = getattr(simple_stmt, LINK_ATTR, None)
                 next_state = simple_stmt.children[0]
-                if next_state in self.stage:
+                if target is not None:
+                    self.context.next = target
+                elif next_state in self.stage:
                     self.context.next = self.stage[next_state]
                 else:
                     raise SamoyedNameError
@@ -294,7 +545,7 @@ class Interpreter:
                 simple_stmt.children[0].value -> var
                 simple_stmt.children[2]       -> expr
                 """
-                self.context.names[simple_stmt.children[0].value] = self.get_expression(simple_stmt.children[2])
+                self.context.frame.set(simple_stmt.children[0].value, self.get_expression(simple_stmt.children[2]))
             elif simple_stmt_type == "pass_expr":
                 """
                 是跳过语句
@@ -377,7 +628,9 @@ class Interpreter:
             `SamoyedTypeError`:
                 类型错误
         """
-
+        if self.mode != "tree":
+            # 直接调用编译好的闭包
+            return self.compiler.compile(expr, self.symbols)(self.context)
 
         if isinstance(expr, lark.lexer.Token):
             """
@@ -403,8 +656,7 @@ class Interpreter:
                 return expr
             elif expr.type == "NAME" or expr.type == "DOLLAR_VAR":
                 # 查看是否有该变量
-                _context = self.context.names
-                if (var := _context.get(expr.value)) is not None:
+                if (var := self.context.frame.get(expr.value)) is not None:
                     return var
                 else:
                     raise SamoyedNameError("No such variable {}".format(expr.value))
@@ -522,7 +774,7 @@ class Interpreter:
                 """
                 函数调用
                 """
-                _context = self.context.names
+                _context = self.context.frame
                 if (func := _context.get(expr.children[0], None)) is not None and callable(func):
                     try:
                         if expr.children[1] is not None:
@@ -538,9 +790,10 @@ class Interpreter:
             elif expr.data == "reg":
                 """
                 如果是正则表达式...
-                直接编译后，返回
+                返回加载时编译好的结果，没有时再编译
                 """
-                return re.compile(expr.children[0].value)
+                pattern = getattr(expr, PATTERN_ATTR, None)
+                return pattern if pattern is not None else compile_regex(expr.children[0].value)
             else:
                 raise SamoyedNotImplementError
         else:
@@ -589,7 +842,8 @@ class Interpreter:
             raise SamoyedRuntimeError(e.__str__())
         return sum
 
-    def _match_value(self, value1: Union[int, float, bool, None, str],
+    @staticmethod
+    def _match_value(value1: Union[int, float, bool, None, str],
                      value2: Union[int, float, bool, None, str, re.Pattern]) -> Tuple[bool, Union[re.Match, None]]:
         """
         判断节点的值是否匹配
@@ -670,11 +924,9 @@ class Interpreter:
                     for st in case_statment.children[1:]:
                         self.exec_statement(st)
 
-                    if result is not None:
-                        self.context.names["$mg0"] = result.group(0)
-                        for i, group in enumerate(result.groups()):
-                            self.context.names["$mg{}".format(i + 1)] = group
+                    self._bind_match_groups(result)
                     break
+
     def __time_control_match(self,stat)->None:
         """
         如果是限定时间的语句...
@@ -701,87 +953,127 @@ class Interpreter:
             执行的time_control语句
 
         """
+        finded_case = self._listen_match(stat)
+        if finded_case is not None:
+            # 如果匹配，那么执行这个子块，并返回
+            for st in stat.children[finded_case + 1].children[1:]:
+                self.exec_statement(st)
+                if self.context.next is not None:break
+            return
+        """
+        匹配块结束....
+        如果超时了，并且没有完成任何匹配...
+        """
+        # 如果有silence块，执行silence块
+        if stat.children[-1].data == "silence_stmt":
+            for st in stat.children[-1].children:
+                # 执行块中的每个语句
+                self.exec_statement(st)
+                if self.context.next is not None:break
+
+    def _listen_match(self, stat) -> Union[int, None]:
+        """
+        执行带时间控制的匹配，但不执行匹配到的子块
+
+        Parameters
+        ----------
+        stat
+            执行的time_control语句
+
+        Returns
+        -------
+            匹配成功的case的序号（不包含silence字句）。如果超时，返回None
+        """
         expr = stat.children[0]
         # 下面首先是获取@()func()的函数
         # expr.children[0] -> @内部的参数，用于控制时间
         # expr.children[1] -> func的函数名
         # expr.children[2] -> func的参数，可能为None
-        _context = self.context.names
+        _context = self.context.frame
         if (func := _context.get(expr.children[1], None)) is not None and callable(func):
             if expr.children[2] is not None:
                 # 如果有参数
-                assert expr.children[2] < expr.children[1]
                 func = partial(func, *[self.get_expression(i) for i in expr.children[2].children])
         else:
             raise SamoyedNameError("No such function {}".format(expr.children[1]))
 
         # 接着构造定时器
-        # 构造一个TimeControl对象。将这个函数传入构造
-        control = TimeControl(func, *expr.children[0].children)
+        # 构造一个TimeControl对象。将这个函数的输入源传入构造，同一个match复用同一个输入源
+        control = TimeControl(self.context.input_source(id(expr), func), *expr.children[0].children)
+        # 输入函数不一定会交出输出，等待输入之前先交出
+        self._flush_output()
 
         # 预先算出每个case的表达式，不包含silence字句
         cases = [self.get_expression(case_statment.children[0]) for case_statment in stat.children[1:] if
                  case_statment.data != "silence_stmt"]
 
-        results = ""  # 每次读取的值
-        find_flag = False  # 是否完成匹配
-        finded_case = None  # 匹配的是第几个
+        index, result = self._wait_for_match(control, cases)
+        if index is not None:
+            # 将正则匹配结果绑定到特殊变量上
+            self._bind_match_groups(result)
+        return index
+
+    @staticmethod
+    def _wait_for_match(control: TimeControl, cases: list) -> Tuple[Union[int, None], Union[re.Match, None]]:
+        """
+        不断读取输入，直到某个case匹配成功或者超时
+
+        Parameters
+        ----------
+        control
+            时间控制对象
+        cases
+            每个case的值
+
+        Returns
+        -------
+            匹配成功的case的序号和正则匹配结果。如果超时，返回(None,None)
+        """
+        # 每个case的匹配状态，每次只扫描新的输入
+        # 字符串case很多时用自动机一次找出所有的字符串case，其余的逐个判断
+        matcher = CaseMatcher(cases, Interpreter._match_value)
+        # 到目前为止的全部输入的匹配结果，还没有输入时与空字符串匹配
+        index, match_result = matcher.feed("")
+        if index is not None and control.min_wait is None:
+            # 与空输入匹配并且不需要等待，不读取输入直接结束，与Session和aio.wait_for_match一致
+            return index, match_result
 
         """
         开始执行匹配
 
         允许断断续续地输入，
-        每一次新的输入都会更新值并判断结果是否匹配
+        每一次新的输入都会更新匹配结果
         """
         for result in control():
-            # 如果新的结果不为空，保存
+            # 如果新的结果不为空，继续匹配
+            """
+            匹配结果:
+            返回第一个匹配的case的序号和匹配结果。
+            如果是正则表达式，匹配结果才有效
+            匹配结果保存的是分组后的信息
+            """
             if result is not None:
-                results += result
+                index, match_result = matcher.feed(result)
 
             # 如果当前时间不允许退出，那么即使匹配了也无法退出
             # 这种情况下，直接跳过即可
             if not control.can_exit.is_set(): continue
 
-            # 依次对每个case进行判断
-            for i, case in enumerate(cases):
-                # 拼接结果
-                concat_result = "".join(results)
+            if index is not None:
+                control.cancel()
+                return index, match_result
+        return None, None
 
-                """
-                匹配结果:
-                会返回一个bool变量和一个匹配结果。
-                如果是正则表达式，匹配结果才有效
-                匹配结果保存的是分组后的信息
-                """
-                is_matched, result = self._match_value(concat_result, case)
-                if is_matched:
-                    find_flag = True
-                    finded_case = i
-                    control.cancel()
-
-                    # 将正则匹配结果绑定到特殊变量上
-                    if result is not None:
-                        self.context.names["$mg0"] = result.group(0)
-                        for i, group in enumerate(result.groups()):
-                            self.context.names["$mg{}".format(i + 1)] = group
-                    break
-
-            # 如果匹配，那么执行这个子块，并返回
-            if find_flag and control.can_exit.is_set():
-                for st in stat.children[finded_case + 1].children[1:]:
-                    self.exec_statement(st)
-                    if self.context.next is not None:break
-                return
+    def _bind_match_groups(self, result: Union[re.Match, None]) -> None:
         """
-        匹配块结束....
-        如果超时了，并且没有完成任何匹配...
+        将正则匹配结果绑定到特殊变量$mg0,$mg1...上
+
+        Parameters
+        ----------
+        result
+            正则匹配结果，为None时什么也不做
         """
-        # 如果有silence块，执行silence块
-        if stat.children[-1].data == "silence_stmt":
-            for st in stat.children[-1].children:
-                # 执行块中的每个语句
-                self.exec_statement(st)
-                if self.context.next is not None:break
+        bind_match_groups(self.context.names, result)
 
     compare_operator = {
         ">": gt,
@@ -799,3 +1091,7 @@ class Interpreter:
         "//": floordiv,
         "%": mod
     }
+    # 表达式编译器，closure和vm模式使用
+    compiler = ExpressionCompiler(compare_operator, arith_operator, reduce.__func__)
+    # 语句编译器，vm模式使用
+    bytecode = vm.BytecodeCompiler(compiler)
@@ -103,4 +103,11 @@ class SamoyedTimeout(SamoyedRuntimeError):
     """
     执行超时
     """
-    pass
\ No newline at end of file
+    pass
+
+
+class SamoyedFormatError(SamoyedInterpretError):
+    """
+    二进制格式错误
+    """
+    pass
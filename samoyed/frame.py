@@ -0,0 +1,279 @@
+"""
+变量存储
+
+加载程序时，解析器(`resolve`)为程序中出现的每个变量名、函数名和$变量分配一个下标，
+保存在符号表(`SymbolTable`)中。每个会话的变量保存在一个按下标存取的数组(`Frame`)中，
+编译后的表达式直接用下标读写，不需要按字符串查找。
+
+符号表由语法树决定，保存在语法树的根节点上，使用同一个程序的所有会话共享一个符号表。
+执行时才出现的名字（外部传入的变量、动态正则表达式的分组$mgN等）不会加入共享的符号表，
+而是保存在会话自己的`Frame.extra`字典中，共享的符号表的大小只由程序决定，会话之间也不会互相影响。
+
+树遍历模式在执行时不使用下标，变量保存在字典中(`DictFrame`)，读写与原来的字典一样快。
+
+`Namespace`是数组的字典视图，只用于eval、调试和外部代码对`Context.names`的访问。
+"""
+import re
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+
+import lark
+
+from .libs import compile_regex
+
+# 符号表保存在语法树根节点的这个属性上
+SYMBOLS_ATTR = "_samoyed_symbols"
+
+# 内置的名字，见`core.Context`
+BUILTIN_NAMES = ("$PWD", "print", "speak", "listen", "exit", "arg_seq_add", "arg_option_add", "sqlite_connect",
+                 "sqlite", "eval")
+
+
+class _Unset:
+    """
+    未赋值的槽
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<unset>"
+
+
+UNSET = _Unset()
+
+
+def resolve(ast: lark.Tree) -> List[str]:
+    """找出程序中用到的所有名字
+
+    包括变量名、函数名、$变量，以及正则表达式分组对应的$mgN。状态名不包括在内
+
+    Parameters
+    ----------
+    ast
+        程序的语法树
+
+    Returns
+    -------
+        按出现顺序排列的名字
+    """
+    names = {}
+    groups = 0
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, lark.Token):
+            if node.type == "NAME" or node.type == "DOLLAR_VAR":
+                names.setdefault(str(node.value), None)
+            continue
+        if not isinstance(node, lark.Tree) or node.data == "branch_expr":
+            continue
+        children = node.children
+        if node.data == "statedef":
+            children = children[1:]
+        elif node.data == "reg":
+            try:
+                groups = max(groups, compile_regex(children[0].value).groups)
+            except re.error:
+                pass
+            continue
+        # 倒序压栈，保证按出现顺序处理
+        stack.extend(reversed(children))
+    if groups:
+        for i in range(groups + 1):
+            names.setdefault("$mg{}".format(i), None)
+    return list(names)
+
+
+class SymbolTable:
+    """
+    符号表，名字到下标的映射
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        """
+        Parameters
+        ----------
+        names
+            预先分配下标的名字
+        """
+        self.index = {}  # type:dict[str,int]
+        self.names = []  # type:list[str]
+        self._lock = threading.Lock()
+        for name in names:
+            self.slot(name)
+
+    @classmethod
+    def of(cls, ast: lark.Tree) -> "SymbolTable":
+        """获取程序的符号表，每棵语法树只会解析一次
+        """
+        symbols = getattr(ast, SYMBOLS_ATTR, None)
+        if symbols is None:
+            symbols = cls(BUILTIN_NAMES + tuple(resolve(ast)))
+            setattr(ast, SYMBOLS_ATTR, symbols)
+        return symbols
+
+    def slot(self, name: str) -> int:
+        """获取名字的下标，没有时分配一个新的下标
+        """
+        slot = self.index.get(name)
+        if slot is None:
+            with self._lock:
+                slot = self.index.get(name)
+                if slot is None:
+                    slot = len(self.names)
+                    self.names.append(name)
+                    self.index[name] = slot
+        return slot
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Frame:
+    """
+    一个会话的变量，按符号表的下标保存在数组中，符号表之外的名字保存在extra中
+    """
+    __slots__ = ("symbols", "slots", "extra")
+
+    def __init__(self, symbols: SymbolTable):
+        """
+        Parameters
+        ----------
+        symbols
+            符号表
+        """
+        self.symbols = symbols
+        self.slots = [UNSET] * len(symbols)  # type:List[Any]
+        # 符号表之外的名字，用到时才创建
+        self.extra = None  # type:Union[Dict[str,Any],None]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        slot = self.symbols.index.get(name)
+        if slot is not None and slot < len(self.slots):
+            value = self.slots[slot]
+            if value is not UNSET:
+                return value
+        if self.extra is not None:
+            return self.extra.get(name, default)
+        return default
+
+    def set(self, name: str, value: Any) -> None:
+        slot = self.symbols.index.get(name)
+        if slot is None:
+            # 不在符号表中的名字不会加入共享的符号表
+            if self.extra is None:
+                self.extra = {}
+            self.extra[name] = value
+            return
+        slots = self.slots
+        if slot >= len(slots):
+            # 符号表在这个数组创建之后又增加了名字
+            slots.extend([UNSET] * (len(self.symbols) - len(slots)))
+        slots[slot] = value
+        if self.extra:
+            # 编译时才加入符号表的名字，原来的值在extra中
+            self.extra.pop(name, None)
+
+    def delete(self, name: str) -> None:
+        slot = self.symbols.index.get(name)
+        if slot is not None and slot < len(self.slots) and self.slots[slot] is not UNSET:
+            self.slots[slot] = UNSET
+        elif self.extra is not None and name in self.extra:
+            del self.extra[name]
+        else:
+            raise KeyError(name)
+
+    def clear(self) -> None:
+        slots = self.slots
+        for i in range(len(slots)):
+            slots[i] = UNSET
+        self.extra = None
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        names = self.symbols.names
+        for i, value in enumerate(self.slots):
+            if value is not UNSET:
+                yield names[i], value
+        if self.extra:
+            yield from list(self.extra.items())
+
+    def rebind(self, symbols: SymbolTable) -> None:
+        """换成另一个符号表，保留所有的值
+
+        数组对象本身不变，已经取得数组引用的代码仍然有效
+        """
+        if symbols is self.symbols:
+            return
+        items = list(self.items())
+        self.symbols = symbols
+        self.slots[:] = [UNSET] * len(symbols)
+        self.extra = None
+        for name, value in items:
+            self.set(name, value)
+
+
+class DictFrame:
+    """
+    按名字保存变量的frame，树遍历模式使用
+
+    树遍历解释器在语法树节点上无法保存下标，每次都按名字查找。
+    get、set、delete直接绑定为字典的方法，读写与使用字典时一样快
+    """
+    __slots__ = ("values", "get", "set", "delete")
+    # 不使用符号表，编译后的代码遇到它时按名字查找
+    symbols = None
+
+    def __init__(self):
+        self.values = {}  # type:Dict[str,Any]
+        self.get = self.values.get
+        self.set = self.values.__setitem__
+        self.delete = self.values.__delitem__
+
+    def clear(self) -> None:
+        self.values.clear()
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return iter(list(self.values.items()))
+
+
+class Namespace(MutableMapping):
+    """
+    `Frame`的字典视图
+    """
+    __slots__ = ("frame",)
+
+    def __init__(self, frame: Union[Frame, DictFrame]):
+        self.frame = frame
+
+    def __getitem__(self, name: str) -> Any:
+        value = self.frame.get(name, UNSET)
+        if value is UNSET:
+            raise KeyError(name)
+        return value
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.frame.get(name, default)
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        self.frame.set(name, value)
+
+    def __delitem__(self, name: str) -> None:
+        self.frame.delete(name)
+
+    def __contains__(self, name: Any) -> bool:
+        return self.frame.get(name, UNSET) is not UNSET
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name, _ in self.frame.items())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.frame.items())
+
+    def copy(self) -> dict:
+        """复制出一个普通的字典
+        """
+        return dict(self.frame.items())
+
+    def __repr__(self):
+        return "Namespace({!r})".format(self.copy())
@@ -2,45 +2,61 @@
 内置函数
 """
 import argparse
-import sqlite3
+import re
 import threading
 import time
+from functools import lru_cache
 from numbers import Number
 from typing import List, Union, Tuple, Dict, Any
 
-from .exception import SamoyedTimeout, SamoyedRuntimeError
-from .utils import watchdog
+from .exception import SamoyedRuntimeError
+from .pool import Database
+from .source import POLL_INTERVAL, CallableSource, input_source
+
+# 正则表达式缓存的大小，所有解释器共享
+REGEX_CACHE_SIZE = 1024
 
 
 class TimeControl:
     """
     返回一个可调用对象，调用该对象会进行延迟
-    如果主线程先结束，那么会取消计时器；
-    否则，计时器会杀死主线程
+
+    输入从输入源(见`source.input_source`)读取，每次最多等到下一个需要检查的时间，
+    有输入时立即返回，不使用信号。等待输入时不会定时醒来，只在有输入、到了min_wait、
+    到了max_wait或者被`cancel`时继续执行。
+
+    `can_exit`和`timeout`只由生成器自己按截止时间置位，不使用计时器和计时线程：
+    每次产生结果之前检查一次，调用者在这之后看到的状态与生成器的判断一致
     """
 
-    def __init__(self, func, max_wait, min_wait=None, timeout_interval=0.2, sleep_interval=0.2):
+    def __init__(self, func, max_wait, min_wait=None, timeout_interval=None, sleep_interval=POLL_INTERVAL):
         """初始化
         Parameters
         ----------
         func
-            要定时的函数
+            要定时的函数，也可以是输入源
         max_wait
             最大等待
         min_wait
             至少等待时间
         timeout_interval
-            函数执行最大周期
+            每次读取最长的等待时间，到了这个时间没有输入时返回一次None。
+            为None时一直等到有输入或者下一个需要检查的时间
         sleep_interval
-            每循环停顿周期
+            输入函数没有返回内容时，再次调用前等待的时间(见`source.CallableSource`)
         """
         self.func = func
         self.timeout = threading.Event()
         self.can_exit = threading.Event()
         self.max_wait = max_wait
         self.min_wait = min_wait
-        self.timeout_interval = 0.1
-        self.sleep_interval = 0.1
+        self.timeout_interval = timeout_interval
+        self.sleep_interval = sleep_interval
+        # 正在读取的输入源，cancel时唤醒它
+        self._reading = None
+        # 输入函数的CallableSource，多次调用时复用，上一次没有结束的调用留给下一次
+        self._source = None  # type:Union[CallableSource,None]
+        self._cancelled = threading.Event()
 
     def __call__(self, *args, **kwargs):
         """
@@ -51,71 +67,92 @@ class TimeControl:
         `SamoyedRuntimeError` : 函数运行出错时抛出
         """
 
-        # 启动两个计时函数
         self.timeout.clear()
         self.can_exit.clear()
-        if self.min_wait is not None:
-            self.min_wait_timer = threading.Timer(self.min_wait, lambda: self.min_wait_handler(self.can_exit))
-            self.min_wait_timer.start()
-        else:
+        self._cancelled.clear()
+        if self.min_wait is None:
             self.can_exit.set()
-        self.max_wait_timer = threading.Timer(self.max_wait, lambda: self.max_wait_handler(self.timeout))
-        self.max_wait_timer.start()
 
-        # 给函数创建看门狗
-        @watchdog(self.timeout_interval)
-        def timeout_on_interval(*args, **kwargs):
-            return self.func(*args, *kwargs)
+        # 输入源等待输入时，最多等到下一个需要检查的时间
+        source = input_source(self.func, args, self.sleep_interval, reuse=self._source)
+        if isinstance(source, CallableSource):
+            self._source = source
+        start = time.monotonic()
+        max_deadline = start + self.max_wait
+        min_deadline = start + self.min_wait if self.min_wait is not None else None
 
         # 外层的try只用于处理KeyboardInterrupt，无其他用途
         try:
             while True:
-                # 尝试执行函数
-                result = None
+                # 还不能退出时等到min_wait，否则等到max_wait
+                if min_deadline is not None and not self.can_exit.is_set():
+                    deadline = min_deadline
+                else:
+                    deadline = max_deadline
+                wait = max(0.0, deadline - time.monotonic())
+                if self.timeout_interval is not None:
+                    wait = min(wait, self.timeout_interval)
+                self._reading = source
                 try:
-                    result = timeout_on_interval(*args, **kwargs)
-                except SamoyedTimeout:
-                    # 如果超时，返回None
-                    yield None
+                    result = source.read(wait)
                 except EOFError:
-                    yield result
+                    # 输入已经结束，只需要等待计时，cancel时提前结束
+                    result = None
+                    self._cancelled.wait(wait)
                 except Exception as e:
                     raise SamoyedRuntimeError(str(e))
-                else:
-                    # 否则，返回结果
-                    yield result
+                finally:
+                    self._reading = None
+                if self._cancelled.is_set():
+                    return
+
+                now = time.monotonic()
+                if min_deadline is not None and now >= min_deadline:
+                    self.can_exit.set()
+                if now >= max_deadline:
+                    self.timeout.set()
+
+                yield result
 
                 # 如果函数执行时间已经超时，那么退出
                 if self.timeout.is_set():
                     self.cancel()
                     return
 
-                # 睡眠，防止频繁运行
-                time.sleep(self.sleep_interval)
-
         except KeyboardInterrupt:
             self.cancel()
             raise KeyboardInterrupt
 
     def cancel(self) -> None:
-        """撤销两个定时器线程
-        """
-        self.max_wait_timer.cancel()
-        if self.min_wait is not None:
-            self.min_wait_timer.cancel()
+        """结束等待
 
-    def min_wait_handler(self, event: threading.Event):
-        """定时器将信号量置位
+        在其他线程中调用时，正在等待输入的生成器会被唤醒并结束
         """
-        if not event.is_set():
-            event.set()
+        self._cancelled.set()
+        source = self._reading
+        if source is not None:
+            source.wake()
 
-    def max_wait_handler(self, event: threading.Event):
-        """定时器将信号量置位
-        """
-        # 最大超时时间
-        if not event.is_set():
-            event.set()
+
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def compile_regex(pattern: str) -> re.Pattern:
+    """编译正则表达式，结果保存在一个有上限的LRU缓存中
+
+    程序中的正则字面量在加载时就已经编译好(见`link.compile_patterns`)，
+    这里用于加载时无法编译的表达式。`re`模块自带的缓存很小，
+    同时运行很多个程序时容易被挤出，因此单独维护一个缓存
+
+    Parameters
+    ----------
+    pattern
+        正则表达式
+
+    Raises
+    ------
+        `re.error`:
+            正则表达式有误，错误的结果不会被缓存
+    """
+    return re.compile(pattern)
 
 
 def make_arg_parser(pos_arg: List[Tuple[str, Union[str, None]]] = None,
@@ -222,37 +259,40 @@ def mock_add(a: Union[int, float, bool, str, None], b: Union[int, float, bool, s
         return None
 
 
-def sqlite_connect(conn2curosr: Dict[sqlite3.Cursor, sqlite3.Connection], db_name: str) -> sqlite3.Cursor:
+def sqlite_connect(conn2curosr: Dict[str, Database], db_name: str) -> Database:
     """
-    建立一个sql连接
+    连接到一个sql数据库。执行语句时从进程内共享的连接池(见`pool`)中取出连接
     Parameters
     ----------
     conn2curosr
-        用于绑定cursor和connection的一个字典
+        对话打开的数据库，按名字保存，同一个对话多次连接同一个数据库时返回同一个对象，对话结束时释放
     db_name
         数据库名
 
     Returns
     -------
-        一个cursor对象
+        一个数据库对象，传给`sqlite`执行语句
     """
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    conn2curosr[cursor] = conn
-    return cursor
+    database = conn2curosr.get(db_name)
+    if database is None:
+        database = Database(db_name)
+        # 与以前一样，连接时打开数据库(文件不存在时创建)，打不开时在这里出错。连接池中有空闲的连接时直接放回
+        with database.connection():
+            pass
+        conn2curosr[db_name] = database
+    return database
 
 
-def sqlite(conn2curosr: Dict[sqlite3.Cursor, sqlite3.Connection], cursor: sqlite3.Cursor, sql: str) \
-        -> Union[None, List[Any]]:
+def sqlite(conn2curosr: Dict[str, Database], cursor: Database, sql: str) -> Union[None, List[Any]]:
     """
     执行一条sql指令。
     注意，由于脚本语言不支持列表，因此这里把返回结果全部转化成了字符串
     Parameters
     ----------
     conn2curosr
-        用于绑定cursor和connection的一个字典
+        对话打开的数据库
     cursor
-        执行指令的cursor
+        `sqlite_connect`返回的数据库
     sql
         sql指令
 
@@ -261,12 +301,25 @@ def sqlite(conn2curosr: Dict[sqlite3.Cursor, sqlite3.Connection], cursor: sqlite
         sql的结果
     """
     try:
-        cursor.execute(sql)
-        conn2curosr[cursor].commit()
+        return cursor.execute(sql)
+    except SamoyedRuntimeError:
+        # 连接池中没有空闲的连接
+        raise
     except Exception as e:
         return []
-    result = cursor.fetchall()
-    return result
+
+
+def sqlite_close(conn2curosr: Dict[str, Database]) -> None:
+    """
+    释放对话打开的所有数据库
+    Parameters
+    ----------
+    conn2curosr
+        对话打开的数据库
+    """
+    for database in conn2curosr.values():
+        database.close()
+    conn2curosr.clear()
 
 # result = []
 # t = TimeControl(input,30)
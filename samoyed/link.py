@@ -0,0 +1,116 @@
+"""
+链接
+
+解释器初始化时，把每个状态包装成一个`State`对象，
+并把状态中所有的branch语句直接指向目标状态的`State`。
+执行时跳转不再需要按名字查找状态表，切换状态只是替换一个引用；
+跳转到不存在的状态会在加载时报错，而不是等到执行这条语句时。
+
+程序中所有的正则字面量(`/.../`)也在这时编译，保存在reg节点上，
+执行match时不再重复编译。
+
+`State`、链接结果和编译好的正则表达式都保存在语法树的节点上。
+它们只由语法树决定，因此使用同一棵语法树的多个解释器可以共享。
+"""
+import re
+from typing import Dict, Tuple, Union
+
+import lark
+
+from .exception import SamoyedNameError
+from .libs import compile_regex
+
+# State保存在statedef节点的这个属性上
+STATE_ATTR = "_samoyed_state"
+# 链接结果保存在branch_expr节点的这个属性上
+LINK_ATTR = "_samoyed_link"
+# 编译好的正则表达式保存在reg节点的这个属性上
+PATTERN_ATTR = "_samoyed_pattern"
+
+
+class State:
+    """
+    链接后的状态
+    """
+    __slots__ = ("name", "node", "body", "code")
+
+    def __init__(self, node: lark.Tree):
+        """
+        Parameters
+        ----------
+        node
+            statedef节点
+        """
+        self.name = str(node.children[0])  # type:str
+        self.node = node  # type:lark.Tree
+        self.body = tuple(node.children[1:])  # type:Tuple[lark.Tree,...]
+        # vm模式下编译出的指令序列
+        self.code = None
+
+    @classmethod
+    def of(cls, node: lark.Tree) -> "State":
+        """获取statedef节点对应的State，每个节点只会创建一次
+        """
+        state = getattr(node, STATE_ATTR, None)
+        if state is None:
+            state = cls(node)
+            setattr(node, STATE_ATTR, state)
+        return state
+
+    def __repr__(self):
+        return "<state {}>".format(self.name)
+
+
+def link(stage: Dict[str, State]) -> None:
+    """把状态表中每个状态里的branch语句链接到目标状态
+
+    Parameters
+    ----------
+    stage
+        状态表
+
+    Raises
+    ------
+        `SamoyedNameError`:
+            跳转的目标状态不存在
+    """
+    for state in stage.values():
+        stack = list(state.body)
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, lark.Tree):
+                continue
+            if node.data == "branch_expr":
+                name = node.children[0]
+                target = stage.get(name)  # type:Union[State,None]
+                if target is None:
+                    pos = (name.line, name.column) if getattr(name, "line", None) is not None else None
+                    raise SamoyedNameError("No such state {}".format(name), pos=pos)
+                setattr(node, LINK_ATTR, target)
+            else:
+                stack.extend(node.children)
+
+
+def compile_patterns(ast: lark.Tree) -> None:
+    """编译程序中所有的正则字面量，保存在reg节点上
+
+    错误的正则表达式不做处理，仍然在求值时报错
+
+    Parameters
+    ----------
+    ast
+        程序的语法树
+    """
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, lark.Tree):
+            continue
+        if node.data == "reg":
+            if getattr(node, PATTERN_ATTR, None) is None:
+                try:
+                    setattr(node, PATTERN_ATTR, compile_regex(node.children[0].value))
+                except re.error:
+                    pass
+        else:
+            stack.extend(node.children)
@@ -0,0 +1,239 @@
+"""
+多模式匹配
+
+带时间控制的match中，字符串case的语义是“输入中包含这个字符串”。
+case很多时，逐个调用`str.find`的代价是 case数 × 输入长度，而且每次读到新的输入都要重新匹配一遍。
+
+`KeywordMatcher`把所有字符串case构造成一个Aho–Corasick自动机，只扫描一遍输入，
+就能找到输入中出现的、声明顺序最靠前的case。
+`CaseMatcher`把自动机和其余的case(正则表达式、其他类型的值)组合起来，结果与逐个匹配一致。
+
+输入是一段一段到达的(例如语音识别的结果)。`CaseMatcher.feed`保存了扫描的状态，
+每次只扫描新到达的部分，字符串case的匹配代价与输入的总长度成正比，而不是每次都从头扫描。
+
+自动机只由case的字符串决定，保存在一个LRU缓存中，同一个match语句再次执行时不需要重新构造。
+"""
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+# 字符串case少于这个数量时，逐个查找更快
+MIN_KEYWORDS = 4
+# 自动机缓存的大小
+MATCHER_CACHE_SIZE = 256
+
+
+class KeywordMatcher:
+    """
+    Aho–Corasick自动机，查找输入中出现的关键字
+    """
+    __slots__ = ("goto", "fail", "best", "first")
+
+    def __init__(self, keywords: Tuple[Tuple[int, str], ...]):
+        """
+        Parameters
+        ----------
+        keywords
+            (case序号, 关键字)的序列
+        """
+        # 每个节点的转移表
+        self.goto = [{}]  # type:List[Dict[str,int]]
+        # 每个节点的失配指针
+        self.fail = [0]  # type:List[int]
+        # 以这个节点结尾(包括沿失配指针能到达的)的关键字中，最小的case序号
+        self.best = [None]  # type:List[Union[int,None]]
+        # 所有关键字中最小的case序号，找到它就可以提前结束
+        self.first = None  # type:Union[int,None]
+        for index, keyword in keywords:
+            node = 0
+            for ch in keyword:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.best.append(None)
+                node = nxt
+            if self.best[node] is None or index < self.best[node]:
+                self.best[node] = index
+            if self.first is None or index < self.first:
+                self.first = index
+        self._build_fail()
+
+    def _build_fail(self) -> None:
+        """按广度优先的顺序计算失配指针，并把失配节点的结果合并进来
+        """
+        goto, fail, best = self.goto, self.fail, self.best
+        queue = list(goto[0].values())
+        for node in queue:
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                state = fail[node]
+                while ch not in goto[state] and state != 0:
+                    state = fail[state]
+                target = goto[state].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                inherited = best[fail[nxt]]
+                if inherited is not None and (best[nxt] is None or inherited < best[nxt]):
+                    best[nxt] = inherited
+
+    @classmethod
+    @lru_cache(maxsize=MATCHER_CACHE_SIZE)
+    def of(cls, keywords: Tuple[Tuple[int, str], ...]) -> "KeywordMatcher":
+        """获取关键字对应的自动机，相同的关键字只会构造一次
+        """
+        return cls(keywords)
+
+    def search(self, text: str) -> Union[int, None]:
+        """扫描输入
+
+        Parameters
+        ----------
+        text
+            输入
+
+        Returns
+        -------
+            输入中出现的关键字里最小的case序号，都没有出现时返回None
+        """
+        return self.scan(text, 0, self.best[0])[1]
+
+    def scan(self, text: str, state: int, found: Union[int, None]) -> Tuple[int, Union[int, None]]:
+        """从上一次扫描结束的位置继续扫描新的输入
+
+        Parameters
+        ----------
+        text
+            新的输入
+        state
+            上一次扫描结束时所在的节点，第一次扫描时为0
+        found
+            上一次扫描的结果，第一次扫描时为`best[0]`(空字符串总是匹配)
+
+        Returns
+        -------
+            扫描结束时所在的节点，以及到目前为止出现的关键字里最小的case序号
+        """
+        goto, fail, best = self.goto, self.fail, self.best
+        first = self.first
+        if found == first:
+            return state, found
+        for ch in text:
+            while True:
+                nxt = goto[state].get(ch)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            index = best[state]
+            if index is not None and (found is None or index < found):
+                found = index
+                if found == first:
+                    break
+        return state, found
+
+
+class CaseMatcher:
+    """
+    带时间控制的match中所有case的匹配器
+
+    输入可能分多次到达，`feed`只扫描新到达的部分：
+    * 字符串case多时，自动机保存扫描到的节点，从这个节点继续扫描
+    * 字符串case少时，每个case只在上一次输入的末尾加上新的输入中查找
+    * 正则表达式从输入的开头匹配，只能对完整的输入重新匹配
+    """
+    __slots__ = ("count", "keywords", "small", "width", "others", "match_value", "state", "found", "tail",
+                 "chunks")
+
+    def __init__(self, cases: List[Any], match_value: Callable):
+        """
+        Parameters
+        ----------
+        cases
+            每个case的值，不包含silence子句
+        match_value
+            逐个匹配时使用的函数，见`core.Interpreter._match_value`
+        """
+        self.count = len(cases)
+        self.match_value = match_value
+        keywords = tuple((i, case) for i, case in enumerate(cases) if type(case) is str)
+        if len(keywords) >= MIN_KEYWORDS:
+            self.keywords = KeywordMatcher.of(keywords)  # type:Union[KeywordMatcher,None]
+            self.small = ()
+        else:
+            self.keywords = None
+            self.small = keywords
+        # 需要保留的上一次输入的末尾的长度，关键字可能跨越两次输入
+        self.width = max((len(keyword) for _, keyword in self.small), default=1) - 1
+        # 其余的case逐个匹配
+        self.others = [(i, case) for i, case in enumerate(cases) if type(case) is not str]
+        self.reset()
+
+    def reset(self) -> None:
+        """清除已经输入的内容
+        """
+        self.state = 0
+        self.found = self.keywords.best[0] if self.keywords is not None else None
+        self.tail = ""
+        self.chunks = []
+
+    def feed(self, chunk: str) -> Tuple[Union[int, None], Any]:
+        """输入新的内容，对到目前为止的全部输入，找到第一个匹配的case
+
+        Parameters
+        ----------
+        chunk
+            新的输入
+
+        Returns
+        -------
+            匹配成功的case的序号和正则匹配结果。都不匹配时返回(None,None)
+        """
+        if self.keywords is not None:
+            self.state, self.found = self.keywords.scan(chunk, self.state, self.found)
+        if self.small:
+            window = self.tail + chunk
+            offset = len(self.tail)
+            for i, keyword in self.small:
+                if self.found is not None and i >= self.found:
+                    break
+                # 只查找结束位置在新的输入中的
+                if window.find(keyword, min(max(0, offset - len(keyword) + 1), len(window))) != -1:
+                    self.found = i
+                    break
+            self.tail = window[-self.width:] if self.width else ""
+
+        limit = self.count if self.found is None else self.found
+        # 只需要检查排在找到的字符串case之前的case
+        if self.others and self.others[0][0] < limit:
+            self.chunks.append(chunk)
+            text = "".join(self.chunks)
+            self.chunks = [text]
+            for i, case in self.others:
+                if i >= limit:
+                    break
+                is_matched, result = self.match_value(text, case)
+                if is_matched:
+                    return i, result
+        elif self.others:
+            self.chunks.append(chunk)
+        if self.found is not None:
+            return self.found, None
+        return None, None
+
+    def match(self, text: str) -> Tuple[Union[int, None], Any]:
+        """对一个完整的输入匹配，会清除之前输入的内容
+
+        Parameters
+        ----------
+        text
+            输入
+
+        Returns
+        -------
+            匹配成功的case的序号和正则匹配结果。都不匹配时返回(None,None)
+        """
+        self.reset()
+        return self.feed(text)
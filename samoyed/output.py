@@ -0,0 +1,71 @@
+"""
+输出
+
+speak说出的内容先累积在`OutputSink`中，等到程序需要输入(`listen`、带时间控制的match)或者结束时
+再一次交出去。一个状态中连续的几次speak只需要一次写入；输出到管道时也不依赖`PYTHONUNBUFFERED`，
+等待输入之前说出的内容一定已经发送。
+
+* `OutputSink`把一轮的输出交给`emit`，进程内的服务用它把输出直接写入连接
+* `StreamSink`写入文件对象(默认是标准输出)，每轮一次write和flush
+"""
+import sys
+from typing import Any, Callable, List, TextIO, Union
+
+
+class OutputSink:
+    """
+    累积speak的输出，`flush`时一次交出
+    """
+
+    def __init__(self, emit: Callable[[List[str]], Any] = None):
+        """
+        Parameters
+        ----------
+        emit
+            交出一轮的输出，参数是每次speak的内容(不包含换行符)。为None时只在`flush`时返回
+        """
+        self.emit = emit
+        self.lines = []  # type:List[str]
+
+    def write(self, *values) -> None:
+        """记录一次speak，格式与print一致
+        """
+        self.lines.append(" ".join(str(value) for value in values))
+
+    __call__ = write
+
+    def flush(self) -> List[str]:
+        """交出累积的输出
+
+        Returns
+        -------
+            这一轮的输出
+        """
+        lines = self.lines
+        if not lines:
+            return lines
+        self.lines = []
+        if self.emit is not None:
+            self.emit(lines)
+        return lines
+
+
+class StreamSink(OutputSink):
+    """
+    把输出写入文件对象，每次flush只调用一次write
+    """
+
+    def __init__(self, stream: Union[TextIO, None] = None):
+        """
+        Parameters
+        ----------
+        stream
+            文件对象。为None时使用flush时的`sys.stdout`，可以被重定向
+        """
+        super().__init__(self._write)
+        self.stream = stream
+
+    def _write(self, lines: List[str]) -> None:
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write("".join(line + "\n" for line in lines))
+        stream.flush()
@@ -0,0 +1,384 @@
+"""
+sqlite连接池
+
+以前每个对话调用`sqlite_connect`都会打开一个新的连接，保存在对话的`Context`中直到进程结束。
+同时进行的对话很多、访问同一个数据库时，每次都要付出打开连接的开销，也会占用大量的文件描述符。
+
+进程内的所有对话共享`pools`，每个数据库(按绝对路径区分)一个`ConnectionPool`：
+
+* `sqlite_connect`返回一个`Database`，只是检查能否从池中取出连接，不会一直占用
+* `sqlite`执行一条语句时从池中取出一个连接，提交并取出结果之后立即放回。
+  每条语句都会提交，语句之间没有未结束的事务，所以连接不需要在对话中一直占用
+* 同一时刻一个连接只被一个线程使用，连接可以在线程之间传递(`check_same_thread=False`)
+* 每个数据库最多打开`size`个连接，都在使用时等待，超过`timeout`抛出`SamoyedRuntimeError`
+* 取出连接时检查它是否还能使用：数据库文件被删除或者替换时重新打开；
+  空闲超过`check_interval`时先执行一次`SELECT 1`
+* 对话结束时(`Context.close`)释放它打开的所有数据库
+
+内存数据库(`:memory:`和空字符串)每个连接都是一个独立的数据库，不放入池中，
+由`Database`自己持有一个连接，对话结束时关闭。fork之后子进程清空所有的池。
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple, Union
+
+from .exception import SamoyedRuntimeError
+
+# 每个数据库最多打开的连接数
+POOL_SIZE = 8
+# 连接都在使用时，等待的最长时间(秒)
+POOL_TIMEOUT = 5.0
+# 连接空闲超过这个时间(秒)时，取出前先检查
+CHECK_INTERVAL = 30.0
+
+# 不能放入池中的数据库
+MEMORY_DATABASES = (":memory:", "")
+
+
+def _file_id(path: str) -> Union[Tuple[int, int], None]:
+    """数据库文件的标识，文件不存在时返回None
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+class _Entry:
+    """
+    池中的一个连接
+    """
+    __slots__ = ("conn", "file_id", "last_used")
+
+    def __init__(self, conn: sqlite3.Connection, file_id: Union[Tuple[int, int], None]):
+        self.conn = conn
+        self.file_id = file_id
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    一个数据库的连接池
+    """
+
+    def __init__(self, database: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 check_interval: float = CHECK_INTERVAL):
+        """
+        Parameters
+        ----------
+        database
+            数据库文件的路径
+        size
+            最多打开的连接数
+        timeout
+            连接都在使用时等待的最长时间(秒)，为None时一直等待
+        check_interval
+            连接空闲超过这个时间(秒)时，取出前先执行一次`SELECT 1`
+        """
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._idle = []  # type:List[_Entry]
+        self._in_use = {}  # type:Dict[sqlite3.Connection,_Entry]
+        # 正在打开的连接数，打开时不持有锁
+        self._opening = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        # 统计
+        self.opened = 0
+        self.discarded = 0
+        self.waits = 0
+
+    def _open(self) -> _Entry:
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        self.opened += 1
+        return _Entry(conn, _file_id(self.database))
+
+    def _healthy(self, entry: _Entry) -> bool:
+        """检查空闲的连接是否还能使用
+        """
+        if entry.file_id != _file_id(self.database):
+            # 数据库文件被删除或者替换，连接看到的还是原来的文件
+            return False
+        if time.monotonic() - entry.last_used >= self.check_interval:
+            try:
+                entry.conn.execute("SELECT 1").fetchall()
+            except sqlite3.Error:
+                return False
+        return True
+
+    @staticmethod
+    def _discard(entry: _Entry) -> None:
+        """关闭连接。调用前在锁内修改discarded，关闭时不持有锁
+        """
+        try:
+            entry.conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self) -> sqlite3.Connection:
+        """取出一个连接，用完之后需要`release`
+
+        检查空闲的连接和打开新的连接时都不持有锁，不会阻塞其他线程
+
+        Raises
+        ------
+        `SamoyedRuntimeError`:
+            连接都在使用，timeout内没有放回
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise SamoyedRuntimeError("connection pool of {} is closed".format(self.database))
+                if self._idle:
+                    # 先占住这个连接，检查时其他线程不会取到它
+                    entry = self._idle.pop()
+                    self._in_use[entry.conn] = entry
+                    break
+                if len(self._in_use) + self._opening < self.size:
+                    # 先占住名额
+                    entry = None
+                    self._opening += 1
+                    break
+                if not waited:
+                    # 需要等待的次数
+                    waited = True
+                    self.waits += 1
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise SamoyedRuntimeError("no free connection to {} in {}s".format(self.database, self.timeout))
+                self._condition.wait(remaining)
+        if entry is not None:
+            try:
+                healthy = self._healthy(entry)
+            except BaseException:
+                self.release(entry.conn)
+                raise
+            if healthy:
+                return entry.conn
+            # 不能使用的连接被关闭，用它的名额打开新的连接
+            with self._condition:
+                del self._in_use[entry.conn]
+                self.discarded += 1
+                self._opening += 1
+            self._discard(entry)
+        try:
+            entry = self._open()
+        except BaseException:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opening -= 1
+            self._in_use[entry.conn] = entry
+        return entry.conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """放回连接。还有未结束的事务时先回滚，回滚失败的连接被关闭
+        """
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            healthy = False
+        with self._condition:
+            entry = self._in_use.pop(conn)
+            # 缩小了size时多出的连接被关闭
+            keep = healthy and not self._closed and len(self._idle) + len(self._in_use) + self._opening < self.size
+            if keep:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            else:
+                self.discarded += 1
+            self._condition.notify()
+        if not keep:
+            self._discard(entry)
+
+    def configure(self, size: int = None, timeout: float = None, check_interval: float = None) -> None:
+        """修改参数，参数为None时不修改
+
+        增大size时唤醒等待的线程；缩小size时关闭多出的空闲连接，使用中的连接放回时关闭
+        """
+        with self._condition:
+            if size is not None:
+                self.size = size
+            if timeout is not None:
+                self.timeout = timeout
+            if check_interval is not None:
+                self.check_interval = check_interval
+            extra = len(self._idle) + len(self._in_use) + self._opening - self.size
+            removed = []
+            while extra > 0 and self._idle:
+                # 保留最近使用的连接
+                removed.append(self._idle.pop(0))
+                extra -= 1
+            self.discarded += len(removed)
+            self._condition.notify_all()
+        for entry in removed:
+            self._discard(entry)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """取出一个连接，退出时放回
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> Dict[str, int]:
+        """连接池的状态
+        """
+        with self._condition:
+            return {"idle": len(self._idle), "in_use": len(self._in_use), "opened": self.opened,
+                    "discarded": self.discarded, "waits": self.waits}
+
+    def close(self) -> None:
+        """关闭空闲的连接，使用中的连接放回时关闭
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self.discarded += len(idle)
+            self._condition.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+
+class Pools:
+    """
+    进程内所有的连接池，按数据库的绝对路径区分
+    """
+
+    def __init__(self, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT, check_interval: float = CHECK_INTERVAL):
+        """
+        Parameters
+        ----------
+        size, timeout, check_interval
+            新建的连接池的参数，见`ConnectionPool`
+        """
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._pools = {}  # type:Dict[str,ConnectionPool]
+        self._lock = threading.Lock()
+
+    def configure(self, size: int = None, timeout: float = None, check_interval: float = None) -> None:
+        """修改连接池的参数，已经创建的连接池也会修改(见`ConnectionPool.configure`)。参数为None时不修改
+        """
+        with self._lock:
+            if size is not None:
+                self.size = size
+            if timeout is not None:
+                self.timeout = timeout
+            if check_interval is not None:
+                self.check_interval = check_interval
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.configure(size, timeout, check_interval)
+
+    def get(self, database: str) -> ConnectionPool:
+        """获取数据库的连接池，没有时创建
+        """
+        path = os.path.abspath(database)
+        pool = self._pools.get(path)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(path)
+                if pool is None:
+                    pool = ConnectionPool(path, self.size, self.timeout, self.check_interval)
+                    self._pools[path] = pool
+        return pool
+
+    def __len__(self) -> int:
+        return len(self._pools)
+
+    def close(self) -> None:
+        """关闭所有的连接池
+        """
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+    def _after_fork(self) -> None:
+        """fork之后子进程不能使用父进程的连接，丢弃所有的连接池
+        """
+        self._pools = {}
+        self._lock = threading.Lock()
+
+
+# 进程内共享的连接池
+pools = Pools()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=pools._after_fork)
+
+
+class Database:
+    """
+    `sqlite_connect`返回的数据库，`sqlite`通过它执行语句
+    """
+
+    def __init__(self, name: str, registry: Pools = None):
+        """
+        Parameters
+        ----------
+        name
+            数据库的路径
+        registry
+            连接池，为None时使用进程内共享的`pools`
+        """
+        self.name = name
+        self.memory = name in MEMORY_DATABASES
+        self.pool = None if self.memory else (registry if registry is not None else pools).get(name)
+        # 内存数据库自己持有的连接
+        self._conn = None  # type:Union[sqlite3.Connection,None]
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """取出一个连接，退出时放回
+        """
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                yield conn
+            return
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.name, check_same_thread=False)
+        yield self._conn
+
+    def execute(self, sql: str) -> List[tuple]:
+        """执行一条语句并提交
+
+        Returns
+        -------
+            语句的结果
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql)
+                conn.commit()
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    def close(self) -> None:
+        """关闭内存数据库的连接。连接池中的连接在每条语句之后已经放回
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __repr__(self):
+        return "Database({!r})".format(self.name)
@@ -0,0 +1,115 @@
+"""
+转译程序的运行时
+
+`samc gen --emit=python`生成的python代码通过这个模块访问解释器的语义：
+变量查找、函数调用、比较、匹配和带时间控制的匹配。
+生成的代码直接按下标读写`Context.frame`中的变量，这里的函数接受读出的值。
+这里的函数与树遍历解释器使用同一套实现，抛出的异常也一致。
+"""
+import re
+from typing import Any, Callable, List, Union
+
+from .core import Context, Interpreter, bind_match_groups
+from .exception import *
+from .frame import SymbolTable, UNSET
+from .libs import TimeControl
+
+__all__ = ["Context", "SymbolTable", "COMPARE", "ARITH", "load", "function", "compare", "negative", "match_value",
+           "bind_match_groups", "listen_function", "listen_match", "reduce_arith", "interpret_error",
+           "not_implemented"]
+
+# 运算符表
+COMPARE = Interpreter.compare_operator
+ARITH = Interpreter.arith_operator
+
+match_value = Interpreter._match_value
+reduce_arith = Interpreter.reduce
+
+
+def load(value: Any, name: str) -> Any:
+    """检查读出的变量，变量不存在(或者为None)时抛出SamoyedNameError
+    """
+    if value is not None and value is not UNSET:
+        return value
+    raise SamoyedNameError("No such variable {}".format(name))
+
+
+def function(value: Any, name: str) -> Callable:
+    """检查读出的函数，不存在或者不能调用时抛出SamoyedNameError
+    """
+    if value is not None and value is not UNSET and callable(value):
+        return value
+    raise SamoyedNameError("No such function {}".format(name))
+
+
+def compare(op: Callable, left: Any, right: Any) -> Any:
+    """比较两个值，类型不能比较时抛出SamoyedTypeError
+    """
+    try:
+        return op(left, right)
+    except Exception:
+        raise SamoyedTypeError("can not compare{} and {}".format(type(left), type(right)))
+
+
+def negative(value: Any) -> Any:
+    """取负
+    """
+    if isinstance(value, str):
+        raise SamoyedTypeError("can not add '-' to string")
+    return -value
+
+
+def listen_function(value: Any, name: str, args: Union[List[Any], None]) -> Callable:
+    """检查带时间控制的match的输入函数，并绑定参数
+    """
+    func = function(value, name)
+    if args is not None:
+        return lambda: func(*args)
+    return func
+
+
+def listen_match(context: Context, func: Callable, max_wait: int, min_wait: Union[int, None],
+                 cases: List[Any], site: Any = None) -> Union[int, None]:
+    """执行带时间控制的匹配
+
+    Parameters
+    ----------
+    context
+        上下文
+    func
+        输入函数
+    max_wait
+        最长等待时间
+    min_wait
+        最短等待时间，可以为None
+    cases
+        每个case的值，不包含silence子句
+    site
+        match的位置，同一个位置复用同一个输入源(见`Context.input_source`)。为None时每次使用新的输入源
+
+    Returns
+    -------
+        匹配成功的case的序号。如果超时，返回None
+    """
+    if site is not None:
+        func = context.input_source(site, func)
+    if min_wait is None:
+        control = TimeControl(func, max_wait)
+    else:
+        control = TimeControl(func, max_wait, min_wait)
+    # 等待输入之前交出speak累积的输出
+    context.output.flush()
+    index, result = Interpreter._wait_for_match(control, cases)
+    if index is not None:
+        bind_match_groups(context.names, result)
+    return index
+
+
+def interpret_error(token_type: str, line: int, column: int) -> Any:
+    """无法求值的终结符
+    """
+    raise SamoyedInterpretError(token_type, pos=(line, column))
+
+
+def not_implemented() -> Any:
+    raise SamoyedNotImplementError
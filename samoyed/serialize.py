@@ -0,0 +1,262 @@
+"""
+语法树的二进制序列化
+
+不使用pickle和marshal，而是一种紧凑的、带版本号的格式。
+格式为：魔数(4字节) + 版本号(1字节) + 一个值。每个值以1字节的标签开头：
+
+* ``N`` ``T`` ``F``  : none,true,false
+* ``I`` + 变长整数    : 整数，使用zigzag编码
+* ``D`` + 8字节       : 浮点数
+* ``S`` + 长度 + utf8 : 新的字符串，同时加入字符串表
+* ``s`` + 下标        : 引用字符串表中已有的字符串
+* ``K`` + 类型 + 值 + 行 + 列  : lark.Token
+* ``R`` + 名称 + 子节点个数 + 子节点 : lark.Tree，名称是字符串或者Token，和解析结果保持一致
+* ``L`` + 个数 + 元素 : 列表
+
+长度、下标等都使用7位一组的变长整数编码。
+
+`samc gen`生成的程序也使用这种格式，见dump_program和load_program。
+"""
+import struct
+import sys
+from numbers import Number
+from typing import Any, List, Tuple, Union
+
+from lark import Token, Tree
+
+from .exception import SamoyedFormatError
+
+MAGIC = b"SAMY"
+FORMAT_VERSION = 2
+PROGRAM_KIND = "program"  # 程序文件的第一个元素
+
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _STR_REF, _TOKEN, _TREE, _LIST = b"NTFIDSsKRL"
+_DOUBLE = struct.Struct("<d")
+
+
+class _Writer:
+    """
+    编码器
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.strings = {}  # type:dict[str,int]
+
+    def varint(self, n: int) -> None:
+        buffer = self.buffer
+        while n > 0x7f:
+            buffer.append((n & 0x7f) | 0x80)
+            n >>= 7
+        buffer.append(n)
+
+    def string(self, s: str) -> None:
+        index = self.strings.get(s)
+        if index is not None:
+            self.buffer.append(_STR_REF)
+            self.varint(index)
+        else:
+            self.strings[s] = len(self.strings)
+            data = s.encode("utf-8")
+            self.buffer.append(_STR)
+            self.varint(len(data))
+            self.buffer += data
+
+    def value(self, v: Any) -> None:
+        # Token和Tree的判断要在str之前，因为Token是str的子类
+        if isinstance(v, Tree):
+            self.buffer.append(_TREE)
+            # lark的规则名是Token('RULE', ...)，别名是str。两者的repr不同，出错信息中会用到
+            if isinstance(v.data, Token):
+                self.value(v.data)
+            else:
+                self.string(str(v.data))
+            self.varint(len(v.children))
+            for child in v.children:
+                self.value(child)
+        elif isinstance(v, Token):
+            self.buffer.append(_TOKEN)
+            self.string(str(v.type))
+            self.string(str(v.value))
+            # 行号和列号可能为None，用0表示
+            self.varint(0 if v.line is None else v.line + 1)
+            self.varint(0 if v.column is None else v.column + 1)
+        elif isinstance(v, str):
+            self.string(v)
+        elif v is None:
+            self.buffer.append(_NONE)
+        elif v is True:
+            self.buffer.append(_TRUE)
+        elif v is False:
+            self.buffer.append(_FALSE)
+        elif isinstance(v, int):
+            self.buffer.append(_INT)
+            self.varint(v << 1 if v >= 0 else ((-v) << 1) - 1)
+        elif isinstance(v, Number):
+            self.buffer.append(_FLOAT)
+            self.buffer += _DOUBLE.pack(v)
+        elif isinstance(v, (list, tuple)):
+            self.buffer.append(_LIST)
+            self.varint(len(v))
+            for item in v:
+                self.value(item)
+        else:
+            raise SamoyedFormatError("can not serialize {}".format(type(v)))
+
+
+class _Reader:
+    """
+    解码器
+    """
+
+    def __init__(self, data: bytes, pos: int = 0):
+        self.data = data
+        self.pos = pos
+        self.strings = []  # type:list[str]
+
+    def varint(self) -> int:
+        data = self.data
+        pos = self.pos
+        b = data[pos]
+        pos += 1
+        n = b & 0x7f
+        shift = 7
+        while b & 0x80:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7f) << shift
+            shift += 7
+        self.pos = pos
+        return n
+
+    def value(self) -> Any:
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == _TREE:
+            data = self.value()
+            return Tree(data, [self.value() for _ in range(self.varint())])
+        elif tag == _STR_REF:
+            return self.strings[self.varint()]
+        elif tag == _STR:
+            n = self.varint()
+            s = sys.intern(self.data[self.pos:self.pos + n].decode("utf-8"))
+            self.pos += n
+            self.strings.append(s)
+            return s
+        elif tag == _TOKEN:
+            type_ = self.value()
+            value = self.value()
+            line = self.varint()
+            column = self.varint()
+            return Token(type_, value, line=line - 1 if line else None, column=column - 1 if column else None)
+        elif tag == _INT:
+            n = self.varint()
+            return -((n + 1) >> 1) if n & 1 else n >> 1
+        elif tag == _FLOAT:
+            (v,) = _DOUBLE.unpack_from(self.data, self.pos)
+            self.pos += 8
+            return v
+        elif tag == _NONE:
+            return None
+        elif tag == _TRUE:
+            return True
+        elif tag == _FALSE:
+            return False
+        elif tag == _LIST:
+            return [self.value() for _ in range(self.varint())]
+        else:
+            raise SamoyedFormatError("unknown tag {!r} at {}".format(chr(tag), self.pos - 1))
+
+
+def dumps(obj: Any) -> bytes:
+    """将语法树（或由常量、列表组成的值）编码为二进制
+
+    Parameters
+    ----------
+    obj
+        要编码的值
+
+    Returns
+    -------
+        编码结果
+    """
+    writer = _Writer()
+    writer.buffer += MAGIC
+    writer.buffer.append(FORMAT_VERSION)
+    writer.value(obj)
+    return bytes(writer.buffer)
+
+
+def loads(data: bytes) -> Any:
+    """解码dumps的结果
+
+    Parameters
+    ----------
+    data
+        二进制数据
+
+    Returns
+    -------
+        解码出的值
+
+    Raises
+    ------
+        `SamoyedFormatError`:
+            数据不完整、魔数或版本号不匹配
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise SamoyedFormatError("bad magic number")
+    if len(data) <= len(MAGIC) or data[len(MAGIC)] != FORMAT_VERSION:
+        raise SamoyedFormatError("unsupported format version")
+    reader = _Reader(data, len(MAGIC) + 1)
+    try:
+        result = reader.value()
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise SamoyedFormatError("truncated data: {}".format(e))
+    if reader.pos != len(data):
+        raise SamoyedFormatError("trailing data")
+    return result
+
+
+def dump_program(ast: Tree, pos_arg: List[Tuple[str, Union[str, None]]],
+                 option_arg: List[Tuple[str, Union[str, None], Union[str, None]]]) -> bytes:
+    """把编译结果编码为二进制程序
+
+    Parameters
+    ----------
+    ast
+        语法树
+    pos_arg
+        脚本声明的顺序参数
+    option_arg
+        脚本声明的可选参数
+
+    Returns
+    -------
+        二进制程序
+    """
+    return dumps([PROGRAM_KIND, pos_arg, option_arg, ast])
+
+
+def load_program(data: bytes) -> Tuple[Tree, list, list]:
+    """读取dump_program生成的二进制程序
+
+    Parameters
+    ----------
+    data
+        二进制程序
+
+    Returns
+    -------
+        语法树，顺序参数和可选参数
+
+    Raises
+    ------
+        `SamoyedFormatError`:
+            不是合法的程序
+    """
+    program = loads(data)
+    if not isinstance(program, list) or len(program) != 4 or program[0] != PROGRAM_KIND:
+        raise SamoyedFormatError("not a samoyed program")
+    _, pos_arg, option_arg, ast = program
+    return ast, [tuple(arg) for arg in pos_arg], [tuple(arg) for arg in option_arg]
@@ -0,0 +1,608 @@
+"""
+对话服务
+
+在一个进程中同时服务很多个对话。每个程序只在启动时加载一次(解析、链接、编译表达式)，
+每个连接创建一个`session.Session`，所有的连接由同一个asyncio事件循环调度，不需要为每个连接启动进程或者线程。
+
+协议按行划分，使用UTF-8编码：
+
+1. 连接后客户端发送一行：程序名，以及用空格分隔的顺序参数(对应程序中的`arg_seq_add`，可以用$1、$2...访问)
+2. 服务端回复一行`OK`；程序不存在等错误时回复`ERROR <原因>`并关闭连接；
+   服务繁忙时回复`BUSY`并关闭连接，客户端可以稍后重试。一行超过`LINE_LIMIT`时回复`ERROR`并关闭连接
+3. 之后客户端的每一行都是一次输入，服务端的每一行都是一次speak的内容
+4. 对话结束时服务端关闭连接；客户端关闭连接时对话被放弃
+
+带时间控制的match在截止时间到达时由服务端推进(`Session.tick_async`)，客户端不需要发送任何内容。
+sqlite在事件循环默认的线程池中执行，一个慢的查询不会卡住其他连接。
+
+准入控制：同时进行的对话数达到`max_sessions`时，新的连接排队等待，排队的连接超过`max_queue`、
+或者等待超过`queue_timeout`时回复`BUSY`。每个连接待发送的数据超过`output_limit`时暂停这个对话，
+`drain_timeout`内客户端还没有读走时断开连接，不让读得慢的客户端占用内存。计数见`SessionServer.stats`。
+
+一个进程只能使用一个CPU核心。`PreforkServer`在主进程中加载好所有的程序后fork出多个工作进程，
+工作进程以写时复制的方式共享语法树，从同一个监听socket接受连接。
+
+`SubprocessServer`是以前的方式：每个连接启动一个进程(例如`samc gen`生成的程序)，
+第一行是命令的参数，之后socket和进程的标准输入输出之间直接转发数据，Linux上使用`os.splice`。
+"""
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+from functools import partial
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple, Union
+
+from .aio import AsyncInterpreter
+from .core import Interpreter
+from .exception import *
+from .output import OutputSink
+from .session import Session
+
+logger = logging.getLogger(__name__)
+
+ENCODING = "utf-8"
+# 同时进行的对话的默认上限
+MAX_SESSIONS = 1024
+# 一行的最大长度
+LINE_LIMIT = 64 * 1024
+# 一行超过LINE_LIMIT时的回复
+LINE_TOO_LONG = b"ERROR line too long\n"
+# 转发数据时每次读取的最大字节数
+FORWARD_SIZE = 64 * 1024
+# 排队等待的连接数的默认上限
+MAX_QUEUE = 128
+# 每个连接待发送的数据的默认上限
+OUTPUT_LIMIT = 256 * 1024
+# 待发送的数据超过上限时，等待客户端读取的默认时间
+DRAIN_TIMEOUT = 30.0
+# 回复BUSY之后，等待客户端关闭连接的时间
+REJECT_LINGER = 1.0
+# 是否可以用os.splice在socket和管道之间转发数据(Linux)
+SPLICE = hasattr(os, "splice")
+
+
+class Program:
+    """
+    加载好的程序，所有的对话共享同一棵语法树
+    """
+
+    def __init__(self, name: str, code: str, mode: str = "closure"):
+        """
+        Parameters
+        ----------
+        name
+            程序名，客户端用它选择程序
+        code
+            代码
+        mode
+            执行模式，见`aio.AsyncInterpreter.MODES`
+        """
+        interpreter = Interpreter(code, mode=mode)
+        self.name = name
+        self.mode = mode
+        self.ast = interpreter.ast
+        # 顺序参数的名字
+        self.seq_args = [name for name, _ in interpreter.context.seq_args]  # type:List[str]
+        # 预先计算保存在节点上的异步标记，执行时不再修改语法树，fork之后的进程可以一直共享它
+        AsyncInterpreter._is_async(self.ast)
+
+    @classmethod
+    def load(cls, path: str, mode: str = "closure") -> "Program":
+        """从文件加载程序，程序名是去掉扩展名的文件名
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            code = f.read()
+        return cls(os.path.splitext(os.path.basename(path))[0], code, mode=mode)
+
+    def arguments(self, values: List[str]) -> dict:
+        """把顺序参数转换成程序的参数，与编译后的程序的命令行参数一致
+
+        Raises
+        ------
+            `SamoyedRuntimeError`:
+                参数的数量不对
+        """
+        if len(values) != len(self.seq_args):
+            raise SamoyedRuntimeError("program '{}' expects {} arguments, got {}".format(
+                self.name, len(self.seq_args), len(values)))
+        args = {"PWD": os.getcwd()}
+        for i, (name, value) in enumerate(zip(self.seq_args, values)):
+            args[name] = value
+            args[str(i + 1)] = value
+        return args
+
+    def session(self, values: List[str] = (), output: OutputSink = None) -> Session:
+        """创建一个新的对话
+
+        Parameters
+        ----------
+        values
+            顺序参数
+        output
+            对话的输出，见`Session`
+        """
+        return Session(self.ast, args=self.arguments(list(values)), mode=self.mode, output=output)
+
+
+class SessionServer:
+    """
+    在一个事件循环中服务所有连接的对话
+    """
+
+    def __init__(self, programs: Iterable[Program], max_sessions: int = MAX_SESSIONS, max_queue: int = MAX_QUEUE,
+                 queue_timeout: Union[float, None] = None, output_limit: int = OUTPUT_LIMIT,
+                 drain_timeout: Union[float, None] = DRAIN_TIMEOUT):
+        """
+        Parameters
+        ----------
+        programs
+            可以使用的程序
+        max_sessions
+            同时进行的对话的上限，超过时新的连接排队等待前面的对话结束
+        max_queue
+            排队等待的连接数的上限，超过时回复BUSY
+        queue_timeout
+            排队的最长时间(秒)，超过时回复BUSY。为None时一直等待
+        output_limit
+            每个连接待发送的数据的上限(字节)，超过时暂停这个对话，等待客户端读取
+        drain_timeout
+            待发送的数据超过上限时，等待客户端读取的最长时间(秒)，超过时断开连接。为None时一直等待
+        """
+        self.programs = {program.name: program for program in programs}  # type:Dict[str,Program]
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.output_limit = output_limit
+        self.drain_timeout = drain_timeout
+        # 正在进行的对话数和排队的连接数
+        self.active = 0
+        self.queued = 0
+        # 开始对话、因为繁忙被拒绝、因为读得太慢被断开的连接数
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self._slots = None  # type:Union[asyncio.Semaphore,None]
+
+    def stats(self) -> Dict[str, int]:
+        """当前的计数。多进程服务中每个工作进程有自己的计数
+        """
+        return {"active": self.active, "queued": self.queued, "accepted": self.accepted, "rejected": self.rejected,
+                "dropped": self.dropped}
+
+    async def start(self, host: str = None, port: int = None, sock=None) -> asyncio.AbstractServer:
+        """开始监听
+
+        Parameters
+        ----------
+        host, port
+            监听的地址
+        sock
+            已经创建好的监听socket，给出时忽略host和port
+        """
+        self._slots = asyncio.Semaphore(self.max_sessions)
+        if sock is not None:
+            return await asyncio.start_server(self.handle, sock=sock, limit=LINE_LIMIT)
+        return await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+
+    async def serve_forever(self, host: str = None, port: int = None, sock=None) -> None:
+        server = await self.start(host, port, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个连接
+        """
+        try:
+            if not await self._admit():
+                self.rejected += 1
+                await self._reject(reader, writer)
+                return
+            self.accepted += 1
+            self.active += 1
+            try:
+                writer.transport.set_write_buffer_limits(high=self.output_limit)
+                await self._converse(reader, writer)
+            finally:
+                self.active -= 1
+                self._slots.release()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # 服务关闭时取消了连接，连接的任务到这里就结束了
+            pass
+        except Exception:
+            logger.exception("session failed")
+        finally:
+            writer.close()
+
+    async def _admit(self) -> bool:
+        """等待一个对话的位置
+
+        Returns
+        -------
+            是否得到了位置。排队的连接太多或者等待超时时返回False
+        """
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return True
+        if self.queued >= self.max_queue:
+            return False
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.queued -= 1
+        return True
+
+    @staticmethod
+    async def _reject(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, reply: bytes = b"BUSY\n") -> None:
+        """回复BUSY等最后一行
+
+        客户端发送的数据没有读完就关闭连接会发送RST，客户端可能收不到回复。
+        先关闭写的一端，在很短的时间内读完客户端发送的数据
+        """
+        writer.write(reply)
+        writer.write_eof()
+        try:
+            await asyncio.wait_for(reader.read(LINE_LIMIT), REJECT_LINGER)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _drain(self, writer: asyncio.StreamWriter) -> None:
+        """等待待发送的数据降到上限以下
+
+        Raises
+        ------
+            `ConnectionAbortedError`:
+                超过drain_timeout时断开连接
+        """
+        try:
+            await asyncio.wait_for(writer.drain(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            writer.transport.abort()
+            raise ConnectionAbortedError("client does not read")
+
+    @staticmethod
+    async def _readline(reader: asyncio.StreamReader) -> Union[bytes, None]:
+        """读取一行
+
+        Returns
+        -------
+            读到的一行，连接关闭时是空的。一行超过`LINE_LIMIT`时返回None
+        """
+        try:
+            return await reader.readline()
+        except ValueError:
+            # StreamReader把LimitOverrunError转换成了ValueError，超出的部分已经丢掉
+            return None
+
+    async def _converse(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        line = await self._readline(reader)
+        if line is None:
+            await self._reject(reader, writer, LINE_TOO_LONG)
+            return
+        if not line:
+            return
+        name, *values = line.decode(ENCODING).split() or [""]
+        program = self.programs.get(name)
+        try:
+            if program is None:
+                raise SamoyedNameError("no such program '{}'".format(name))
+            # 每一步的输出直接写入连接，一步只写一次
+            session = program.session(values, OutputSink(partial(self._send, writer)))
+        except SamoyedException as e:
+            writer.write("ERROR {}\n".format(e).encode(ENCODING))
+            await writer.drain()
+            return
+        writer.write(b"OK\n")
+
+        reply = await session.start_async()
+        while True:
+            await self._drain(writer)
+            if reply.finished:
+                return
+            timeout = None if reply.deadline is None else max(0.0, reply.deadline - session.clock())
+            try:
+                line = await asyncio.wait_for(self._readline(reader), timeout)
+            except asyncio.TimeoutError:
+                reply = await session.tick_async()
+                continue
+            if line is None:
+                await self._reject(reader, writer, LINE_TOO_LONG)
+                return
+            if not line:
+                # 客户端关闭了连接
+                return
+            reply = await session.feed_async(line.decode(ENCODING).rstrip("\r\n"))
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, outputs: List[str]) -> None:
+        writer.write("".join(output + "\n" for output in outputs).encode(ENCODING))
+
+
+class SubprocessServer(SessionServer):
+    """
+    每个连接启动一个进程，在socket和进程的标准输入输出之间转发数据
+
+    转发由事件循环驱动，两个方向各自在有数据时立即转发，不等待整行，也没有固定的停顿。
+    Linux上用`os.splice`在socket和管道之间直接移动数据，数据不进入Python；
+    没有`os.splice`时在Python中复制
+    """
+
+    def __init__(self, command: List[str], splice: bool = SPLICE, **kwargs):
+        """
+        Parameters
+        ----------
+        command
+            启动进程的命令，连接发送的第一行按空格分隔后追加在后面
+        splice
+            是否用`os.splice`转发，只在有`os.splice`的系统上可以使用
+        kwargs
+            准入控制的参数，见`SessionServer`。max_sessions是同时运行的进程的上限
+        """
+        super().__init__((), **kwargs)
+        self.command = command
+        self.splice = splice and SPLICE
+
+    async def _converse(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        line = await self._readline(reader)
+        if line is None:
+            await self._reject(reader, writer, LINE_TOO_LONG)
+            return
+        if not line:
+            return
+        # 进程的标准输入和标准输出，splice时由这里创建，需要直接使用文件描述符
+        stdin, stdout = (os.pipe(), os.pipe()) if self.splice else (None, None)
+        # 结束时需要关闭的文件描述符
+        fds = [*stdin, *stdout] if self.splice else []
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self.command, *line.decode(ENCODING).split(), stdin=stdin[0] if stdin else asyncio.subprocess.PIPE,
+                stdout=stdout[1] if stdout else asyncio.subprocess.PIPE, env=dict(os.environ, PYTHONUNBUFFERED="1"))
+        except OSError as e:
+            for fd in fds:
+                os.close(fd)
+            writer.write("ERROR {}\n".format(e).encode(ENCODING))
+            await writer.drain()
+            return
+        writer.write(b"OK\n")
+        # 两个方向的转发任务
+        pumps = ()
+        try:
+            if self.splice:
+                # 子进程已经有了自己的副本
+                for fd in (stdin[0], stdout[1]):
+                    fds.remove(fd)
+                    os.close(fd)
+                sock, buffered = await self._detach(reader, writer)
+                fds.append(sock)
+                pumps = (asyncio.ensure_future(_splice(sock, stdin[1], data=buffered)),
+                         asyncio.ensure_future(_splice(stdout[0], sock, self.drain_timeout,
+                                                       partial(self._drop, writer.transport))))
+            else:
+                # 客户端读得慢时停止读取进程的输出，进程写满管道后会阻塞
+                pumps = (asyncio.ensure_future(self._forward(reader, process.stdin, process.stdin.drain)),
+                         asyncio.ensure_future(self._forward(process.stdout, writer, partial(self._drain, writer))))
+            # 进程关闭了输出(对话结束)，或者客户端关闭了连接(对话被放弃)
+            await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pumps:
+                task.cancel()
+            if process.returncode is None:
+                # Popen.kill会先调用poll回收进程，与事件循环等待进程的线程冲突；
+                # 进程被回收之前pid不会被复用，直接发送信号是安全的
+                try:
+                    os.kill(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            if pumps:
+                # 转发的任务结束之后才能关闭文件描述符、读取进程剩下的输出
+                await asyncio.wait(pumps)
+            for task in pumps:
+                # 客户端或者进程关闭了连接时不需要处理，其他的错误记录下来
+                if not task.cancelled() and task.exception() is not None:
+                    if not isinstance(task.exception(), ConnectionError):
+                        logger.error("forwarding failed", exc_info=task.exception())
+            for fd in fds:
+                os.close(fd)
+            if not self.splice:
+                # 丢弃没有转发的输出，输出管道关闭之后才能等到进程结束
+                while await process.stdout.read(FORWARD_SIZE):
+                    pass
+            await process.wait()
+
+    @staticmethod
+    async def _forward(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                       drain: Callable[[], Awaitable[None]]) -> None:
+        """把reader读到的数据写入writer，直到reader结束
+        """
+        while True:
+            data = await reader.read(FORWARD_SIZE)
+            if not data:
+                return
+            writer.write(data)
+            await drain()
+
+    @staticmethod
+    async def _detach(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Tuple[int, bytes]:
+        """停止transport的读写，之后直接读写socket
+
+        Returns
+        -------
+            socket的文件描述符的副本，以及StreamReader中已经缓冲、还没有读取的数据
+        """
+        transport = writer.transport
+        transport.pause_reading()
+        # transport暂停之后不会再有数据，取出已经缓冲的部分
+        reader.feed_eof()
+        buffered = await reader.read()
+        # 等待OK发送完，之后transport不再写入
+        transport.set_write_buffer_limits(high=0)
+        await writer.drain()
+        # 事件循环不允许直接监听transport使用的文件描述符，使用一个副本
+        return os.dup(transport.get_extra_info("socket").fileno()), buffered
+
+    def _drop(self, transport: asyncio.Transport) -> None:
+        """客户端在drain_timeout内没有读取，断开连接
+        """
+        self.dropped += 1
+        transport.abort()
+        raise ConnectionAbortedError("client does not read")
+
+
+async def _wait_fd(fd: int, write: bool = False, timeout: Union[float, None] = None) -> bool:
+    """等待文件描述符可读或者可写
+
+    Returns
+    -------
+        是否可读或者可写，超过timeout时返回False
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    add, remove = (loop.add_writer, loop.remove_writer) if write else (loop.add_reader, loop.remove_reader)
+    add(fd, lambda: future.done() or future.set_result(True))
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        remove(fd)
+
+
+async def _write_all(fd: int, data: bytes) -> None:
+    """把数据全部写入非阻塞的文件描述符
+    """
+    view = memoryview(data)
+    while view:
+        try:
+            view = view[os.write(fd, view):]
+        except BlockingIOError:
+            await _wait_fd(fd, write=True)
+
+
+async def _splice(src: int, dst: int, timeout: Union[float, None] = None, on_timeout: Callable[[], None] = None,
+                  data: bytes = b"") -> None:
+    """用`os.splice`把src的数据移动到dst，直到src结束。src和dst至少有一个是管道
+
+    Parameters
+    ----------
+    src, dst
+        非阻塞的文件描述符
+    timeout
+        dst一直不可写的最长时间(秒)，超过时调用on_timeout
+    on_timeout
+        超时时调用
+    data
+        先写入dst的数据
+    """
+    os.set_blocking(src, False)
+    os.set_blocking(dst, False)
+    if data:
+        await _write_all(dst, data)
+    # src已经可读，这时不能移动数据说明dst写满了
+    readable = False
+    while True:
+        try:
+            n = os.splice(src, dst, FORWARD_SIZE, flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+        except BlockingIOError:
+            if not readable:
+                readable = await _wait_fd(src)
+            elif not await _wait_fd(dst, write=True, timeout=timeout) and on_timeout is not None:
+                on_timeout()
+            continue
+        if not n:
+            return
+        readable = False
+
+
+class PreforkServer:
+    """
+    多进程服务：主进程加载程序并监听，fork出的工作进程各自运行一个`SessionServer`
+
+    fork之前调用`gc.freeze`，把已经加载的对象移出垃圾回收的范围，
+    工作进程中的垃圾回收不会访问(从而复制)这些对象所在的内存页。
+    工作进程意外退出时，主进程会启动一个新的工作进程
+    """
+
+    def __init__(self, server: SessionServer, workers: int = None):
+        """
+        Parameters
+        ----------
+        server
+            每个工作进程运行的服务
+        workers
+            工作进程数，默认为CPU核心数
+        """
+        self.server = server
+        self.workers = workers or os.cpu_count() or 1
+        self.pids = {}  # type:Dict[int,int]
+        self.sock = None  # type:Union[socket.socket,None]
+        self._stopping = False
+
+    def start(self, host: str, port: int) -> Tuple[str, int]:
+        """监听并启动所有的工作进程
+
+        Returns
+        -------
+            监听的地址，port为0时可以从这里得到实际的端口
+        """
+        self.sock = socket.create_server((host, port), backlog=socket.SOMAXCONN)
+        gc.collect()
+        gc.freeze()
+        for index in range(self.workers):
+            self._spawn(index)
+        return self.sock.getsockname()[:2]
+
+    def _spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = index
+            return
+        # 工作进程
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            asyncio.run(self.server.serve_forever(sock=self.sock))
+        except KeyboardInterrupt:
+            pass
+        except BaseException:
+            logger.exception("worker %d failed", index)
+            status = 1
+        finally:
+            os._exit(status)
+
+    def serve_forever(self) -> None:
+        """等待工作进程退出，直到`stop`。SIGTERM和SIGINT会调用`stop`
+        """
+        handlers = {signum: signal.signal(signum, lambda *_: self.stop())
+                    for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            while self.pids:
+                try:
+                    pid, _ = os.wait()
+                except ChildProcessError:
+                    break
+                index = self.pids.pop(pid, None)
+                if index is not None and not self._stopping:
+                    logger.warning("worker %d exited, restarting", index)
+                    self._spawn(index)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            self.sock.close()
+
+    def stop(self) -> None:
+        """结束所有的工作进程
+        """
+        self._stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
@@ -0,0 +1,325 @@
+"""
+会话
+
+`Session`把一个对话变成可以逐步推进的过程，不需要线程、信号，也不需要事件循环：
+
+```python
+session = Session(code)
+reply = session.start()            # 执行到第一次需要输入的地方
+reply = session.feed("我的账单")    # 输入一句话，执行到下一次需要输入的地方
+if reply.deadline is not None and session.clock() >= reply.deadline:
+    reply = session.tick()         # 到了截止时间，继续执行(例如执行silence块)
+```
+
+每次返回的`Reply`包含这一步说出的内容(speak)、会话的状态(等待输入或者已经结束)，
+以及等待输入时的截止时间。截止时间由调用者负责，到了截止时间后调用`tick`。
+一个线程就可以调度很多个会话。
+
+会话基于`aio.AsyncInterpreter`：执行到需要输入的地方时，协程把控制权交还给`Session`，
+输入到达或者截止时间到了再继续执行。因此程序中调用的函数应当是普通的函数，
+或者是不依赖事件循环的协程函数。
+
+`sqlite_connect`、`sqlite`会阻塞(连接池都在使用时最多等待`pool.POOL_TIMEOUT`秒)。
+在事件循环中推进会话时使用`start_async`、`feed_async`、`tick_async`，它们在事件循环默认的线程池中执行，
+不阻塞其他会话；`start`、`feed`、`tick`直接在当前线程中执行
+"""
+import asyncio
+import time
+from functools import partial
+from typing import Any, Callable, List, Tuple, Union
+
+import lark
+
+from .aio import AsyncInterpreter
+from .core import Context, Interpreter
+from .exception import *
+from .libs import sqlite, sqlite_connect
+from .matcher import CaseMatcher
+from .output import OutputSink
+
+WAITING = "waiting"
+FINISHED = "finished"
+
+
+class Reply:
+    """
+    会话每一步的结果
+    """
+    __slots__ = ("outputs", "status", "deadline")
+
+    def __init__(self, outputs: List[str], status: str, deadline: Union[float, None]):
+        """
+        Parameters
+        ----------
+        outputs
+            这一步说出的内容
+        status
+            `WAITING`等待输入，或者`FINISHED`已经结束
+        deadline
+            等待输入时的截止时间，与`Session.clock`的时间一致。为None时没有截止时间
+        """
+        self.outputs = outputs
+        self.status = status
+        self.deadline = deadline
+
+    @property
+    def finished(self) -> bool:
+        return self.status == FINISHED
+
+    def __repr__(self):
+        return "Reply(outputs={!r}, status={!r}, deadline={!r})".format(self.outputs, self.status, self.deadline)
+
+
+class _Suspend:
+    """
+    等待输入，执行到这里时协程把控制权交还给`Session`
+    """
+    __slots__ = ()
+
+    def __await__(self):
+        return (yield self)
+
+
+_SUSPEND = _Suspend()
+
+
+class _Blocking:
+    """
+    会阻塞的调用，由推进会话的方法决定在当前线程还是在线程池中执行
+    """
+    __slots__ = ("func",)
+
+    def __init__(self, func: Callable[[], Any]):
+        self.func = func
+
+    def __await__(self):
+        return (yield self)
+
+
+class SessionContext(Context):
+    """
+    会话的上下文，内置的sqlite_connect、sqlite交给推进会话的方法执行
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.names["sqlite_connect"] = self.sqlite_connect
+        self.names["sqlite"] = self.sqlite
+
+    async def sqlite_connect(self, db_name: str):
+        return await _Blocking(partial(sqlite_connect, self.conn2curosr, db_name))
+
+    async def sqlite(self, cursor, sql: str):
+        return await _Blocking(partial(sqlite, self.conn2curosr, cursor, sql))
+
+
+class Session(AsyncInterpreter):
+    """
+    可以逐步推进的会话
+
+    带时间控制的match从`feed`读取输入，@后的函数只用于检查是否存在；
+    程序中调用`listen()`同样等待`feed`的输入
+    """
+    context_class = SessionContext
+
+    def __init__(self, code: Union[str, lark.Tree], context: dict = None, args: dict = None, cache=True,
+                 mode: str = "tree", clock: Callable[[], float] = time.monotonic, output: OutputSink = None):
+        """
+        Parameters
+        ----------
+        code
+            代码
+        context
+            额外的上下文
+        args
+            命令行等特殊参数
+        cache
+            语法树缓存，见`Interpreter`
+        mode
+            执行模式，见MODES
+        clock
+            时钟，截止时间按这个时钟计算
+        output
+            这个会话的输出，每一步结束时交出一次(`OutputSink.flush`)，交出的内容也放在`Reply.outputs`中。
+            进程内的服务可以用它把输出直接写入连接。为None时只放在`Reply.outputs`中
+        """
+        super().__init__(code, context=context, args=args, cache=cache, mode=mode)
+        self.clock = clock
+        self.deadline = None  # type:Union[float,None]
+        self.output = self.context.output = output if output is not None else OutputSink()
+        self.__coroutine = None
+        self.__started = False
+        self.context.names["speak"] = self.speak
+        self.context.names["listen"] = self.listen
+
+    def speak(self, *values) -> None:
+        """记录说出的内容，与print的格式一致
+        """
+        self.output.write(*values)
+
+    async def listen(self) -> Union[str, None]:
+        """等待输入
+
+        Returns
+        -------
+            `feed`输入的内容，因为到了截止时间而继续执行时返回None
+        """
+        return await _SUSPEND
+
+    @property
+    def finished(self) -> bool:
+        """会话是否已经结束
+        """
+        return self.__started and self.__coroutine is None
+
+    def start(self) -> Reply:
+        """开始执行，直到第一次需要输入或者结束
+
+        Raises
+        ------
+            `SamoyedInterpretError`:
+                会话已经开始
+        """
+        return self.__resume(self.__start())
+
+    async def start_async(self) -> Reply:
+        """与`start`相同，会阻塞的调用在事件循环默认的线程池中执行
+        """
+        return await self.__resume_async(self.__start())
+
+    def feed(self, text: str) -> Reply:
+        """输入一句话，执行到下一次需要输入或者结束
+
+        Parameters
+        ----------
+        text
+            输入的内容
+        """
+        if not self.__started:
+            # 没有调用start时先开始执行，开始时说出的内容放在这次回复的前面
+            outputs = self.start().outputs
+            reply = self.__resume(text)
+            reply.outputs = outputs + reply.outputs
+            return reply
+        return self.__resume(text)
+
+    async def feed_async(self, text: str) -> Reply:
+        """与`feed`相同，会阻塞的调用在事件循环默认的线程池中执行
+        """
+        if not self.__started:
+            outputs = (await self.start_async()).outputs
+            reply = await self.__resume_async(text)
+            reply.outputs = outputs + reply.outputs
+            return reply
+        return await self.__resume_async(text)
+
+    def tick(self) -> Reply:
+        """检查截止时间，到了截止时间时继续执行，否则什么也不做
+        """
+        if not self.__expired():
+            return self.__reply()
+        return self.__resume(None)
+
+    async def tick_async(self) -> Reply:
+        """与`tick`相同，会阻塞的调用在事件循环默认的线程池中执行
+        """
+        if not self.__expired():
+            return self.__reply()
+        return await self.__resume_async(None)
+
+    def _flush_output(self) -> None:
+        # 输出在每一步结束时交出，见__reply
+        pass
+
+    def __start(self) -> None:
+        if self.__started:
+            raise SamoyedInterpretError("session already started")
+        self.__started = True
+        self.__coroutine = self.exec()
+
+    def __expired(self) -> bool:
+        return self.__coroutine is not None and self.deadline is not None and self.clock() >= self.deadline
+
+    def __reply(self) -> Reply:
+        outputs = self.output.flush()
+        if self.__coroutine is None:
+            return Reply(outputs, FINISHED, None)
+        return Reply(outputs, WAITING, self.deadline)
+
+    def __send(self, value: Any, error: BaseException = None) -> Union[_Suspend, _Blocking, None]:
+        """把输入、调用的结果或者异常交给协程
+
+        Returns
+        -------
+            协程等待的东西，执行结束时返回None
+        """
+        try:
+            request = self.__coroutine.send(value) if error is None else self.__coroutine.throw(error)
+        except StopIteration:
+            self.__coroutine = None
+            return None
+        except BaseException:
+            self.__coroutine = None
+            raise
+        if request is not _SUSPEND and not isinstance(request, _Blocking):
+            # 程序中的协程依赖事件循环
+            self.__coroutine.close()
+            self.__coroutine = None
+            raise SamoyedInterpretError("session can not await {!r}".format(request))
+        return request
+
+    def __resume(self, value: Union[str, None]) -> Reply:
+        """把输入交给协程，执行到下一次需要输入或者结束。会阻塞的调用在当前线程中执行
+        """
+        if self.__coroutine is None:
+            return self.__reply()
+        request = self.__send(value)
+        while isinstance(request, _Blocking):
+            try:
+                result = request.func()
+            except Exception as e:
+                request = self.__send(None, e)
+            else:
+                request = self.__send(result)
+        return self.__reply()
+
+    async def __resume_async(self, value: Union[str, None]) -> Reply:
+        """与`__resume`相同，会阻塞的调用在事件循环默认的线程池中执行
+        """
+        if self.__coroutine is None:
+            return self.__reply()
+        request = self.__send(value)
+        while isinstance(request, _Blocking):
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(None, request.func)
+            except Exception as e:
+                request = self.__send(None, e)
+            else:
+                request = self.__send(result)
+        return self.__reply()
+
+    async def _wait_for_match(self, func: Callable, max_wait: Union[int, float], min_wait: Union[int, float, None],
+                              cases: List[Any]) -> Tuple[Union[int, None], Any]:
+        """等待`feed`的输入直到匹配，或者`tick`时超过了截止时间
+
+        语义与`aio.wait_for_match`一致，截止时间通过`Reply.deadline`交给调用者
+        """
+        matcher = CaseMatcher(cases, Interpreter._match_value)
+        index, result = matcher.feed("")
+        start = self.clock()
+        deadline = start + max_wait
+        can_exit = start + (min_wait if min_wait is not None else 0)
+        try:
+            while True:
+                now = self.clock()
+                if index is not None and now >= can_exit:
+                    return index, result
+                if now >= deadline:
+                    return None, None
+                # 已经匹配时只需要等到允许退出，否则等到超时
+                self.deadline = can_exit if index is not None else deadline
+                chunk = await self.listen()
+                if chunk is not None:
+                    index, result = matcher.feed(chunk)
+        finally:
+            self.deadline = None
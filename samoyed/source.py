@@ -0,0 +1,373 @@
+"""
+输入源
+
+带时间控制的match需要“最多等待到某个时间”的读取。`InputSource.read(timeout)`在有输入时立即返回一行，
+到了timeout还没有输入、或者被`wake`唤醒时返回None，输入结束时抛出`EOFError`：
+
+* `FileSource`用`selectors`等待文件描述符可读(标准输入、管道、socket)，不使用信号，也不需要轮询，
+  用`utils.PipeReader`读取和解码
+* `QueueSource`从队列中读取，用于在进程内提供输入
+* `CallableSource`用于任意的输入函数：函数在一个后台线程中调用，调用没有结束时输入留到下一次读取
+
+`input_source`根据`listen`绑定的值选择输入源。默认的`listen`(见`listen`)和带时间控制的match
+共用同一个标准输入的`FileSource`，读到但还没有用到的输入不会丢失。
+`CallableSource`由使用它的地方保存(一个`libs.TimeControl`，或者上下文中的一个match，见`core.Context.input_source`)，
+没有结束的调用留给同一个地方的下一次读取，不会每次都启动一个新的线程。
+"""
+import abc
+import builtins
+import os
+import queue
+import selectors
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple, Union
+
+from .utils import READ_SIZE, PipeReader
+
+# 输入函数没有返回内容时，再次调用前等待的时间
+POLL_INTERVAL = 0.1
+
+
+class InputSource(abc.ABC):
+    """
+    输入源的基类
+    """
+
+    @abc.abstractmethod
+    def read(self, timeout: Union[float, None] = None) -> Union[str, None]:
+        """读取一行输入
+
+        Parameters
+        ----------
+        timeout
+            最长等待时间(秒)，为None时一直等待
+
+        Returns
+        -------
+            一行输入，不包含换行符。超时返回None
+
+        Raises
+        ------
+            `EOFError`:
+                输入已经结束
+        """
+
+    def wake(self) -> None:
+        """唤醒正在等待输入的`read`，使它返回None。不支持唤醒的输入源只能等到timeout
+        """
+
+    def readline(self) -> str:
+        """一直等待，直到读到一行输入，与`input()`相同
+        """
+        while True:
+            line = self.read(None)
+            if line is not None:
+                return line
+
+    def __call__(self) -> str:
+        return self.readline()
+
+
+class FileSource(InputSource):
+    """
+    从文件描述符读取输入，用`selectors`等待可读
+    """
+    _sources = {}  # type:Dict[int,FileSource]
+    _sources_lock = threading.Lock()
+
+    def __init__(self, file: Any):
+        """
+        Parameters
+        ----------
+        file
+            文件对象、文件描述符或者`utils.PipeReader`，不会被关闭。
+            给出`PipeReader`时使用它已经读到的输入
+        """
+        self.reader = file if isinstance(file, PipeReader) else PipeReader(_fileno(file))
+        self.fd = self.reader.fd
+        self._lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()  # type:Union[selectors.BaseSelector,None]
+        try:
+            self.selector.register(self.fd, selectors.EVENT_READ)
+        except (OSError, ValueError):
+            # 普通文件不能使用epoll，但总是可读的
+            self.selector.close()
+            self.selector = None
+            self._waker = None
+        else:
+            # 用于唤醒的管道，写入一个字节就能唤醒select
+            self._waker = os.pipe()
+            os.set_blocking(self._waker[0], False)
+            os.set_blocking(self._waker[1], False)
+            self.selector.register(self._waker[0], selectors.EVENT_READ)
+
+    @classmethod
+    def of(cls, file: Any) -> "FileSource":
+        """获取文件描述符对应的输入源，同一个文件描述符只有一个输入源，保证缓冲的输入不会丢失
+        """
+        fd = _fileno(file)
+        source = cls._sources.get(fd)
+        if source is None:
+            with cls._sources_lock:
+                source = cls._sources.get(fd)
+                if source is None:
+                    source = cls._sources[fd] = cls(file if isinstance(file, PipeReader) else fd)
+        return source
+
+    def read(self, timeout: Union[float, None] = None) -> Union[str, None]:
+        with self._lock:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            reader = self.reader
+            while not reader.lines:
+                if reader.eof:
+                    raise EOFError
+                if self.selector is not None:
+                    wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+                    events = self.selector.select(wait)
+                    if not events:
+                        return None
+                    if any(key.fd == self._waker[0] for key, _ in events):
+                        self._drain()
+                        return None
+                try:
+                    reader.fill()
+                except (BlockingIOError, InterruptedError):
+                    continue
+            return reader.lines.popleft()
+
+    def wake(self) -> None:
+        if self._waker is not None:
+            try:
+                os.write(self._waker[1], b"\0")
+            except BlockingIOError:
+                # 管道已满，已经有足够的唤醒
+                pass
+
+    def close(self) -> None:
+        """释放selector和唤醒管道，不会关闭文件描述符本身
+        """
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+        if self._waker is not None:
+            for fd in self._waker:
+                os.close(fd)
+            self._waker = None
+
+    def _drain(self) -> None:
+        """清空唤醒管道
+        """
+        try:
+            while os.read(self._waker[0], READ_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+
+
+class QueueSource(InputSource):
+    """
+    从队列中读取输入，`queue.Queue`和`multiprocessing.Queue`都可以。不支持唤醒
+    """
+
+    def __init__(self, q: Any):
+        self.queue = q
+
+    def read(self, timeout: Union[float, None] = None) -> Union[str, None]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class CallableSource(InputSource):
+    """
+    在后台线程中调用输入函数
+
+    函数可能一直阻塞，所以不在当前线程中调用。到了timeout还没有返回时，这次调用保留下来，
+    下一次读取时继续等待它的结果。函数没有返回内容(None或空字符串)时，等待`interval`之后再调用。
+
+    每次调用都在一个新的线程中进行，同一时刻最多只有一个。调用没有结束时丢掉输入源，线程会一直阻塞到函数返回，
+    所以应当由使用它的地方保存并复用(`rebind`)，而不是每次读取都创建一个新的
+    """
+
+    def __init__(self, func: Callable, args: Tuple = (), interval: float = POLL_INTERVAL):
+        """
+        Parameters
+        ----------
+        func
+            输入函数
+        args
+            调用时的参数
+        interval
+            函数没有返回内容时，再次调用前等待的时间
+        """
+        self.func = func
+        self.args = args
+        self.interval = interval
+        self._call = None  # type:Union[Future,None]
+        self._idle_until = 0.0
+        self._lock = threading.Lock()
+        # 调用结束或者被唤醒时置位
+        self._wakeup = threading.Event()
+
+    def rebind(self, func: Callable, args: Tuple = (), interval: float = POLL_INTERVAL) -> None:
+        """之后的调用使用新的函数和参数，没有结束的调用仍然留给下一次读取
+        """
+        self.func = func
+        self.args = args
+        self.interval = interval
+
+    def close(self) -> None:
+        """丢弃没有结束的调用，它的结果不会再被读取。正在等待的读取被唤醒
+        """
+        self._call = None
+        self.wake()
+
+    def read(self, timeout: Union[float, None] = None) -> Union[str, None]:
+        with self._lock:
+            wait = self._idle_until - time.monotonic()
+            if wait > 0:
+                if timeout is not None and timeout < wait:
+                    self._wait(timeout)
+                    return None
+                if self._wait(wait):
+                    return None
+                if timeout is not None:
+                    timeout -= wait
+            if self._call is None:
+                self._call = self._start()
+            call = self._call
+            if not call.done():
+                self._wait(timeout)
+                if not call.done():
+                    return None
+            self._call = None
+            result = call.result()
+            if not result:
+                self._idle_until = time.monotonic() + self.interval
+            return result
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def _wait(self, timeout: Union[float, None]) -> bool:
+        """等待调用结束或者被唤醒
+
+        Returns
+        -------
+            是否是被唤醒或者调用结束，而不是到了timeout
+        """
+        woken = self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        return woken
+
+    def _start(self) -> Future:
+        self._wakeup.clear()
+        call = Future()
+        call.add_done_callback(lambda _: self._wakeup.set())
+
+        def run():
+            if not call.set_running_or_notify_cancel():
+                return
+            try:
+                call.set_result(self.func(*self.args))
+            except BaseException as e:
+                call.set_exception(e)
+
+        threading.Thread(target=run, name="samoyed-input", daemon=True).start()
+        return call
+
+
+class FlushingSource(InputSource):
+    """
+    读取之前先交出累积的输出(见`output.OutputSink`)，等待输入之前说出的内容一定已经发送
+
+    `core.Context`把它绑定为默认的listen
+    """
+
+    def __init__(self, flush: Callable[[], Any], source: Callable[[], InputSource] = None):
+        """
+        Parameters
+        ----------
+        flush
+            交出输出的函数
+        source
+            返回实际的输入源的函数，默认为标准输入。读取时才获取，没有读取时不会打开标准输入
+        """
+        self.flush = flush
+        self.source = source if source is not None else stdin
+
+    def read(self, timeout: Union[float, None] = None) -> Union[str, None]:
+        self.flush()
+        return self.source().read(timeout)
+
+    def wake(self) -> None:
+        self.source().wake()
+
+
+def _fileno(file: Any) -> int:
+    if isinstance(file, int):
+        return file
+    if isinstance(file, PipeReader):
+        return file.fd
+    return file.fileno()
+
+
+if hasattr(os, "register_at_fork"):
+    # fork之后不共享唤醒管道
+    os.register_at_fork(after_in_child=FileSource._sources.clear)
+
+
+def stdin() -> FileSource:
+    """标准输入对应的输入源
+    """
+    return FileSource.of(sys.stdin)
+
+
+def listen() -> str:
+    """默认的listen，从标准输入读取一行，与`input()`相同
+
+    和带时间控制的match共用标准输入的缓冲
+
+    Raises
+    ------
+        `EOFError`:
+            输入已经结束
+    """
+    return stdin().readline()
+
+
+def input_source(func: Callable, args: Tuple = (), interval: float = POLL_INTERVAL,
+                 reuse: CallableSource = None) -> InputSource:
+    """根据输入函数选择输入源
+
+    * 输入源本身直接使用
+    * 默认的`listen`和`input`使用标准输入的`FileSource`
+    * `utils.PipeReader`(例如`utils.get_pipe_read_end`返回的读取函数)使用对应的`FileSource`
+    * 其他函数使用`CallableSource`
+
+    Parameters
+    ----------
+    func
+        输入函数
+    args
+        调用时的参数
+    interval
+        `CallableSource`的函数没有返回内容时，再次调用前等待的时间
+    reuse
+        同一个地方上一次使用的`CallableSource`，需要`CallableSource`时复用它，没有结束的调用不会丢失
+    """
+    if not args:
+        if isinstance(func, InputSource):
+            return func
+        if func is listen or func is builtins.input:
+            return stdin()
+        if isinstance(func, PipeReader):
+            return FileSource.of(func)
+    if reuse is not None:
+        reuse.rebind(func, args, interval)
+        return reuse
+    return CallableSource(func, args, interval)
@@ -0,0 +1,151 @@
+"""
+计时服务
+
+很多个截止时间需要在到期时调用回调。每个都创建一个`threading.Timer`，
+数量很多时就会有成千上万个短命的线程。
+
+`TimerService`用一个最小堆保存所有的截止时间，只用一个后台线程等待最早的截止时间：
+
+* `call_later`向堆中插入一个计时器，O(log n)
+* `Timer.cancel`只把计时器标记为取消，均摊O(1)；取消的计时器到期时被丢弃，数量过多时重建堆
+* 回调在后台线程中执行，应当很快地返回(例如置位一个`threading.Event`)
+
+进程内共享的服务是`timers`，fork之后子进程会重新启动后台线程。
+`libs.TimeControl`在读取输入之后自己按截止时间置位事件，不使用计时服务。
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Callable, List, Tuple
+
+# 取消的计时器超过堆大小的这个比例时，重建堆
+COMPACT_RATIO = 0.5
+
+
+class Timer:
+    """
+    一个计时器，到期时调用回调
+    """
+    __slots__ = ("deadline", "callback", "cancelled", "_service")
+
+    def __init__(self, deadline: float, callback: Callable[[], None], service: "TimerService"):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+        self._service = service
+
+    def cancel(self) -> None:
+        """取消计时器，已经到期的计时器取消时什么也不做
+        """
+        self._service._cancel(self)
+
+
+class TimerService:
+    """
+    用一个后台线程管理所有的计时器
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """
+        Parameters
+        ----------
+        clock
+            时钟，截止时间按这个时钟计算
+        """
+        self.clock = clock
+        self._heap = []  # type:List[Tuple[float,int,Timer]]
+        self._counter = itertools.count()
+        self._cancelled_count = 0
+        self._condition = threading.Condition()
+        self._thread = None  # type:threading.Thread
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> Timer:
+        """delay秒之后调用回调
+
+        Parameters
+        ----------
+        delay
+            等待的秒数
+        callback
+            回调，在后台线程中执行
+
+        Returns
+        -------
+            计时器，可以取消
+        """
+        timer = Timer(self.clock() + delay, callback, self)
+        with self._condition:
+            heapq.heappush(self._heap, (timer.deadline, next(self._counter), timer))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="samoyed-timer", daemon=True)
+                self._thread.start()
+            elif self._heap[0][2] is timer:
+                # 新的计时器最早到期，唤醒后台线程重新计算等待时间
+                self._condition.notify()
+        return timer
+
+    def __len__(self) -> int:
+        """还没有到期也没有取消的计时器的数量
+        """
+        with self._condition:
+            return len(self._heap) - self._cancelled_count
+
+    def _cancel(self, timer: Timer) -> None:
+        """标记计时器已经取消，取消的计时器过多时重建堆
+        """
+        with self._condition:
+            if timer.cancelled:
+                return
+            timer.cancelled = True
+            self._cancelled_count += 1
+            if self._cancelled_count > len(self._heap) * COMPACT_RATIO:
+                # 原地修改，后台线程持有的是同一个列表
+                self._heap[:] = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled_count = 0
+
+    def _pop_expired(self) -> List[Timer]:
+        """取出所有到期的计时器，没有时等待最早的截止时间。调用时持有锁
+        """
+        heap = self._heap
+        while True:
+            now = self.clock()
+            expired = []
+            while heap and heap[0][0] <= now:
+                timer = heapq.heappop(heap)[2]
+                if timer.cancelled:
+                    self._cancelled_count -= 1
+                else:
+                    # 到期的计时器不能再取消
+                    timer.cancelled = True
+                    expired.append(timer)
+            if expired:
+                return expired
+            self._condition.wait(heap[0][0] - now if heap else None)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                expired = self._pop_expired()
+            for timer in expired:
+                try:
+                    timer.callback()
+                except Exception:
+                    pass
+
+    def _after_fork(self) -> None:
+        """fork之后子进程中没有后台线程，清除所有的计时器
+        """
+        self._heap = []
+        self._cancelled_count = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+
+# 进程内共享的计时服务
+timers = TimerService()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=timers._after_fork)
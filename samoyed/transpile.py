@@ -0,0 +1,505 @@
+"""
+转译器
+
+把语法树翻译成等价的python源代码，由CPython自己的字节码编译器执行。
+
+* 每个状态是一个python函数
+* match是if/elif链
+* branch把下一个状态的函数保存到上下文中，由run函数中的循环（蹦床）依次调用
+* 会抛出异常的加法、乘法和函数调用被提升为独立的函数，与解释器一样转换异常
+* 变量在生成时就确定了下标，生成的代码直接读写`Context.frame`中的数组；
+  变量检查、匹配等使用`runtime`模块
+
+执行结果与树遍历解释器一致，包括以下细节：
+
+* 块（if、match的子块）中执行了branch后，会跳过块中剩余的语句；
+  但是状态顶层的语句仍然会继续执行。
+  需要检查的块被生成为内部函数，用return跳过剩余的语句
+* 普通match的case块不检查branch，正则分组在块执行完以后才绑定
+* or和and会对所有子句求值，没有短路
+"""
+import math
+import re
+from typing import Any, Dict, List, Tuple, Union
+
+import lark
+
+from .frame import BUILTIN_NAMES, resolve
+
+# 生成的代码中使用的运行时函数
+_RUNTIME_NAMES = ["Context", "SymbolTable", "COMPARE", "ARITH", "load", "function", "compare", "negative", "match_value",
+                  "bind_match_groups", "listen_function", "listen_match", "reduce_arith", "interpret_error",
+                  "not_implemented"]
+
+_RUNTIME_IMPORT = ",\n    ".join(", ".join(_RUNTIME_NAMES[i:i + 6]) for i in range(0, len(_RUNTIME_NAMES), 6))
+
+_HEADER = '''{interpreter}
+"""
+由samc从{source}生成，不要手动修改
+"""
+import os
+from functools import reduce
+from operator import or_, and_
+
+from samoyed.exception import SamoyedNameError, SamoyedNotFoundEntrance, SamoyedNotImplementError, \\
+    SamoyedRuntimeError
+from samoyed.libs import compile_regex, make_arg_parser
+from samoyed.runtime import ({runtime})
+
+POS_ARG = {pos_arg!r}
+OPTION_ARG = {option_arg!r}
+
+# 符号表，变量的下标
+SYMBOLS = SymbolTable([{symbols}])
+'''
+
+_FOOTER = '''
+
+def run(ctx: Context) -> None:
+    """执行程序
+
+    Parameters
+    ----------
+    ctx
+        上下文
+    """
+    ctx.use_symbols(SYMBOLS)
+    try:
+        _init(ctx)
+        stage = ctx.stage = {entrance}
+        while True:
+            stage(ctx)
+            if ctx.is_exit() or ctx.next is None:
+                return
+            stage = ctx.stage = ctx.next
+            ctx.next = None
+    finally:
+        # 结束时交出speak累积的输出，释放数据库
+        ctx.output.flush()
+        ctx.close()
+
+
+def main(argv=None) -> None:
+    """解析命令行参数并执行程序
+    """
+    parser = make_arg_parser(pos_arg=POS_ARG, option_arg=OPTION_ARG)
+    args = vars(parser.parse_args(argv))
+    for key in args:
+        value = args[key]
+        if isinstance(value, list):
+            args[key] = value[0]
+    for i, arg in enumerate(POS_ARG):
+        args[str(i + 1)] = args[arg[0]]
+    args["PWD"] = os.getcwd()
+    run(Context(dollar_names=args))
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+
+def _wrap(items: List[Any]) -> str:
+    """把列表的元素写成多行"""
+    lines = [[]]
+    width = 0
+    for item in items:
+        text = repr(item)
+        if lines[-1] and width + len(text) > 80:
+            lines.append([])
+            width = 0
+        lines[-1].append(text)
+        width += len(text) + 2
+    return ",\n    ".join(", ".join(line) for line in lines)
+
+
+def _has_branch(node: Any) -> bool:
+    """语句中是否含有branch"""
+    if not isinstance(node, lark.Tree):
+        return False
+    if node.data == "branch_expr":
+        return True
+    return any(_has_branch(child) for child in node.children)
+
+
+class Transpiler:
+    """
+    把语法树翻译成python源代码
+    """
+
+    def __init__(self, ast: lark.Tree):
+        """
+        Parameters
+        ----------
+        ast
+            程序的语法树
+        """
+        self.ast = ast
+        self.lines = []  # type:List[str]
+        self.expressions = []  # type:List[str]
+        self.patterns = {}  # type:Dict[str,str]
+        self.states = {}  # type:Dict[str,str]
+        self.counter = 0
+        self.symbols = list(BUILTIN_NAMES) + [name for name in resolve(ast) if name not in BUILTIN_NAMES]
+        self.slots = {name: i for i, name in enumerate(self.symbols)}  # type:Dict[str,int]
+        # 当前位置之前是否可能执行过branch。如果是，块中的每个语句之后都要检查
+        self.maybe_next = False
+
+    def _name(self, prefix: str) -> str:
+        self.counter += 1
+        return "{}{}".format(prefix, self.counter)
+
+    def _slot(self, name: str) -> str:
+        """读写变量的表达式"""
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.symbols)
+            self.symbols.append(name)
+        return "s[{}]".format(slot)
+
+    def _emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def transpile(self, pos_arg: list, option_arg: list, interpreter: str = "", source: str = "") -> str:
+        """生成python源代码
+
+        Parameters
+        ----------
+        pos_arg
+            脚本声明的顺序参数
+        option_arg
+            脚本声明的可选参数
+        interpreter
+            第一行，一般是#!python解释器
+        source
+            源文件名，只用于注释
+
+        Returns
+        -------
+            python源代码
+        """
+        statedefs = [(i, node) for i, node in enumerate(self.ast.children) if node.data == "statedef"]
+        for i, node in statedefs:
+            # 与解释器一致，同名的状态以最后一个为准
+            self.states[str(node.children[0])] = "_state_{}".format(i)
+
+        # 顶层语句
+        defined = {}  # 执行到某个顶层语句时已经定义了的状态
+        init_has_branch = False
+        self._emit(0, "")
+        self._emit(0, "")
+        self._emit(0, "def _init(ctx: Context) -> None:")
+        self._emit(1, '"""执行顶层的语句"""')
+        self._emit(1, "s = ctx.frame.slots")
+        for i, node in enumerate(self.ast.children):
+            if node.data == "statedef":
+                defined[str(node.children[0])] = "_state_{}".format(i)
+                continue
+            self._statement(node, 1, states=defined)
+            init_has_branch = init_has_branch or _has_branch(node)
+        if "main" not in self.states:
+            self._emit(1, "raise SamoyedNotFoundEntrance")
+
+        # 状态
+        for i, node in statedefs:
+            name = "_state_{}".format(i)
+            self.maybe_next = init_has_branch and self.states.get("main") == name
+            self._emit(0, "")
+            self._emit(0, "")
+            self._emit(0, "def {}(ctx: Context) -> None:".format(name))
+            self._emit(1, '"""state {}"""'.format(node.children[0]))
+            self._emit(1, "s = ctx.frame.slots")
+            statements = node.children[1:]
+            for j, stat in enumerate(statements):
+                self._statement(stat, 1, states=self.states)
+                if j != len(statements) - 1:
+                    # 如果调用了exit，直接退出
+                    self._emit(1, "if ctx.is_exit():")
+                    self._emit(2, "return")
+
+        parts = [_HEADER.format(interpreter=interpreter, source=source, runtime=_RUNTIME_IMPORT,
+                                pos_arg=list(pos_arg), option_arg=list(option_arg), symbols=_wrap(self.symbols))]
+        for pattern, name in self.patterns.items():
+            parts.append("{} = compile_regex({!r})\n".format(name, pattern))
+        parts.extend(self.expressions)
+        parts.append("\n".join(self.lines) + "\n")
+        parts.append("\n\nSTATES = {{{}}}\n".format(", ".join("{!r}: {}".format(key, value)
+                                                             for key, value in self.states.items())))
+        parts.append(_FOOTER.format(entrance=self.states.get("main", "None")))
+        return "".join(parts)
+
+    # 语句
+
+    def _block(self, statements: list, indent: int, checked: bool, states: Dict[str, str]) -> None:
+        """生成一个块
+
+        Parameters
+        ----------
+        statements
+            块中的语句
+        indent
+            缩进层数
+        checked
+            每个语句执行后是否检查branch
+        states
+            branch可以跳转的状态
+        """
+        start = len(self.lines)
+        if checked and len(statements) > 1 and \
+                (self.maybe_next or any(_has_branch(stat) for stat in statements[:-1])):
+            # 执行了branch后需要跳过剩余的语句，生成一个内部函数，用return跳出
+            name = self._name("_block")
+            self._emit(indent, "def {}():".format(name))
+            body = len(self.lines)
+            for i, stat in enumerate(statements):
+                self._statement(stat, indent + 1, states)
+                if self.maybe_next and i != len(statements) - 1:
+                    self._emit(indent + 1, "if ctx.next is not None:")
+                    self._emit(indent + 2, "return")
+            if len(self.lines) == body:
+                self._emit(indent + 1, "pass")
+            self._emit(indent, "{}()".format(name))
+        else:
+            for stat in statements:
+                self._statement(stat, indent, states)
+        if len(self.lines) == start:
+            self._emit(indent, "pass")
+
+    def _statement(self, stat: lark.Tree, indent: int, states: Dict[str, str]) -> None:
+        if stat.data == "simple_stmt":
+            simple_stmt = stat.children[0]
+            # 如果是终结符，那么不需要再处理了
+            if isinstance(simple_stmt, lark.Tree):
+                simple_stmt_type = simple_stmt.data
+                if simple_stmt_type == "branch_expr":
+                    target = states.get(str(simple_stmt.children[0]))
+                    if target is not None:
+                        self._emit(indent, "ctx.next = {}".format(target))
+                    else:
+                        self._emit(indent, "raise SamoyedNameError")
+                elif simple_stmt_type == "assign_expr":
+                    name = str(simple_stmt.children[0].value)
+                    value = self._expr(simple_stmt.children[2])
+                    self._emit(indent, "{} = {}  # {}".format(self._slot(name), value, name))
+                elif simple_stmt_type != "pass_expr":
+                    self._emit(indent, self._expr(simple_stmt))
+        elif stat.data == "match_stmt":
+            expr = stat.children[0]
+            if isinstance(expr, lark.Tree) and expr.data == "at_expr":
+                self._time_control_match(stat, indent, states)
+            else:
+                self._normal_match(stat, indent, states)
+        elif stat.data == "if_stmt":
+            entry = self.maybe_next
+            self._emit(indent, "if {}:".format(self._expr(stat.children[0])))
+            self._block(stat.children[1].children, indent + 1, True, states)
+            if len(stat.children) == 3:
+                self.maybe_next = entry
+                self._emit(indent, "else:")
+                self._block(stat.children[2].children, indent + 1, True, states)
+        else:
+            self._emit(indent, "not_implemented()")
+        if _has_branch(stat):
+            self.maybe_next = True
+
+    def _normal_match(self, stat: lark.Tree, indent: int, states: Dict[str, str]) -> None:
+        subject = self._name("_subject")
+        result = self._name("_result")
+        self._emit(indent, "{} = {}".format(subject, self._expr(stat.children[0])))
+        keyword = "if"
+        entry = self.maybe_next
+        for case_statment in stat.children[1:]:
+            # 各个子块互斥，都从进入match时的状态开始
+            self.maybe_next = entry
+            if case_statment.data == "default_stmt":
+                if keyword == "if":
+                    self._block(case_statment.children, indent, True, states)
+                else:
+                    self._emit(indent, "else:")
+                    self._block(case_statment.children, indent + 1, True, states)
+                break
+            # 与解释器一致，case的值在前，match的值在后
+            self._emit(indent, "{} ({} := match_value({}, {}))[0]:".format(
+                keyword, result, self._expr(case_statment.children[0]), subject))
+            self._block(case_statment.children[1:], indent + 1, False, states)
+            self._emit(indent + 1, "bind_match_groups(ctx.names, {}[1])".format(result))
+            keyword = "elif"
+
+    def _time_control_match(self, stat: lark.Tree, indent: int, states: Dict[str, str]) -> None:
+        expr = stat.children[0]
+        times = list(expr.children[0].children)
+        max_wait, min_wait = times[0], times[1] if len(times) > 1 else None
+        args = "None"
+        if expr.children[2] is not None:
+            args = "[{}]".format(", ".join(self._expr(arg) for arg in expr.children[2].children))
+        cases = [case_statment for case_statment in stat.children[1:] if case_statment.data != "silence_stmt"]
+        index = self._name("_index")
+        name = str(expr.children[1])
+        # 用结果变量的名字作为match的位置，同一个match复用同一个输入源
+        self._emit(indent, "{} = listen_match(ctx, listen_function({}, {!r}, {}), {!r}, {!r}, [{}], {!r})".format(
+            index, self._slot(name), name, args, max_wait, min_wait,
+            ", ".join(self._expr(case_statment.children[0]) for case_statment in cases), index))
+        entry = self.maybe_next
+        for i, case_statment in enumerate(cases):
+            # 各个子块互斥，都从进入match时的状态开始
+            self.maybe_next = entry
+            self._emit(indent, "{} {} == {}:".format("if" if i == 0 else "elif", index, i))
+            self._block(case_statment.children[1:], indent + 1, True, states)
+        if stat.children[-1].data == "silence_stmt":
+            self.maybe_next = entry
+            self._emit(indent, "else:")
+            self._block(stat.children[-1].children, indent + 1, True, states)
+
+    # 表达式
+
+    def _expr(self, expr: Any) -> str:
+        """生成表达式
+
+        Parameters
+        ----------
+        expr
+            表达式树、终结符或者常量
+
+        Returns
+        -------
+            python表达式，变量数组的名字为s
+        """
+        if isinstance(expr, lark.Tree):
+            return self._tree(expr)
+        elif isinstance(expr, lark.Token):
+            if expr.type == "STR" or expr.type == 'none' or \
+                    expr.type == "true" or expr.type == "false" or \
+                    expr.type == "SIGNED_INT" or expr.type == "SIGNED_FLOAT":
+                return repr(str(expr))
+            elif expr.type == "NAME" or expr.type == "DOLLAR_VAR":
+                return "load({}, {!r})".format(self._slot(str(expr.value)), str(expr.value))
+            else:
+                return "interpret_error({!r}, {!r}, {!r})".format(expr.type, expr.line, expr.column)
+        elif expr is None or isinstance(expr, (bool, int, str)):
+            return repr(expr)
+        elif isinstance(expr, float):
+            return repr(expr) if math.isfinite(expr) else "float({!r})".format(repr(expr))
+        else:
+            return "not_implemented()"
+
+    def _tree(self, expr: lark.Tree) -> str:
+        data = expr.data
+        children = expr.children
+        if data == "add_op" or data == "mul_op":
+            return "ARITH[{!r}]".format(str(children[0]))
+        elif data == "conditional_expr":
+            test, first, second = (self._expr(child) for child in children)
+            return "({} if {} else {})".format(first, test, second)
+        elif data == "compare_expr":
+            return "compare(COMPARE[{!r}], {}, {})".format(str(children[1].children[0]), self._expr(children[0]),
+                                                           self._expr(children[2]))
+        elif data == "not_test":
+            return "(not {})".format(self._expr(children[0]))
+        elif data == "or_test" or data == "and_test":
+            # 与解释器一致：所有子句都会被求值，没有短路
+            return "bool(reduce({}, [{}]))".format("or_" if data == "or_test" else "and_",
+                                                   ", ".join(self._expr(child) for child in children))
+        elif data == "plus_expr" or data == "mul_expr":
+            return self._arith(expr)
+        elif data == "factor":
+            operand = self._expr(children[1])
+            return "negative({})".format(operand) if children[0] == '-' else operand
+        elif data == "funccall":
+            return self._funccall(expr)
+        elif data == "reg":
+            pattern = children[0].value
+            try:
+                re.compile(pattern)
+            except re.error:
+                # 错误的正则表达式在求值时才报错
+                return "compile_regex({!r})".format(pattern)
+            if pattern not in self.patterns:
+                self.patterns[pattern] = "_PATTERN{}".format(len(self.patterns))
+            return self.patterns[pattern]
+        else:
+            return "not_implemented()"
+
+    def _hoist(self, lines: List[str]) -> str:
+        """把表达式提升为独立的函数，返回调用它的表达式"""
+        name = self._name("_expr")
+        lines[0] = lines[0].format(name=name)
+        self.expressions.append("\n\n" + "\n".join(lines) + "\n")
+        return "{}(s)".format(name)
+
+    def _arith(self, expr: lark.Tree) -> str:
+        """
+        加法或乘法，形如[1,+,2,-,3]
+        所有操作数先全部求值，再从左到右计算。任何错误都会转换为SamoyedRuntimeError
+        """
+        children = expr.children
+        error = "raise SamoyedRuntimeError({!r})".format("can not compute {}".format(expr))
+        ops = []
+        for child in children[1::2]:
+            if not isinstance(child, lark.Tree) or child.data not in ("add_op", "mul_op"):
+                ops = None
+                break
+            ops.append(str(child.children[0]))
+        if ops is None or len(children) % 2 == 0:
+            # 不规范的树，按解释器的方式逐项计算
+            return self._hoist(["def {name}(s):",
+                                "    try:",
+                                "        return reduce_arith([{}])".format(
+                                    ", ".join(self._expr(child) for child in children)),
+                                "    except Exception:",
+                                "        " + error])
+        operands = [self._expr(child) for child in children[0::2]]
+        defaults = "".join(", _op{}=ARITH[{!r}]".format(i, op) for i, op in enumerate(ops))
+        lines = ["def {{name}}(s{}):".format(defaults), "    try:"]
+        if len(operands) == 2:
+            lines.append("        return _op0({}, {})".format(*operands))
+        else:
+            # 先对所有操作数求值
+            for i, operand in enumerate(operands):
+                lines.append("        _v{} = {}".format(i, operand))
+            result = "_v0"
+            for i in range(len(ops)):
+                result = "_op{}({}, _v{})".format(i, result, i + 1)
+            lines.append("        return " + result)
+        lines.extend(["    except Exception:", "        " + error])
+        return self._hoist(lines)
+
+    def _funccall(self, expr: lark.Tree) -> str:
+        args = ""
+        if expr.children[1] is not None:
+            args = ", ".join(self._expr(child) for child in expr.children[1].children)
+        name = str(expr.children[0])
+        return self._hoist(["def {name}(s):",
+                            "    func = function({}, {!r})".format(self._slot(name), name),
+                            "    try:",
+                            "        return func({})".format(args),
+                            "    except Exception as e:",
+                            "        # 函数可能会崩溃",
+                            "        raise SamoyedRuntimeError(str(e))"])
+
+
+def transpile(ast: lark.Tree, pos_arg: List[Tuple[str, Union[str, None]]],
+              option_arg: List[Tuple[str, Union[str, None], Union[str, None]]], interpreter: str = "",
+              source: str = "") -> str:
+    """把语法树翻译成python源代码
+
+    生成的代码是一个普通的python模块：直接运行时解析命令行参数并执行；
+    也可以被导入，调用其中的run(context)或者main(argv)，这时CPython会缓存它的.pyc
+
+    Parameters
+    ----------
+    ast
+        语法树
+    pos_arg
+        脚本声明的顺序参数
+    option_arg
+        脚本声明的可选参数
+    interpreter
+        第一行，一般是#!python解释器
+    source
+        源文件名，只用于注释
+
+    Returns
+    -------
+        python源代码
+    """
+    return Transpiler(ast).transpile(pos_arg, option_arg, interpreter=interpreter, source=source)
@@ -0,0 +1,210 @@
+"""
+传输
+
+`Transport`是一个对话的输入和输出：`source`是`source.InputSource`，`output`是`output.OutputSink`。
+解释器的`listen`从`source`读取(带时间控制的match也一样)，`speak`写入`output`，
+等待输入之前交出累积的输出。创建解释器时传入(`Interpreter(code, transport=...)`)，默认是标准输入输出。
+
+* `StdioTransport`标准输入输出
+* `FifoTransport`一对具名管道(见`utils.make_pipe`)
+* `UnixTransport`一个已经连接的Unix domain socket
+* `MemoryTransport`进程内的队列，不需要子进程和管道，用于测试和嵌入到其他程序中
+
+根据部署的方式选择开销最小的一种。
+"""
+import os
+import queue
+import socket
+from typing import Any, List, Union
+
+from .output import OutputSink, StreamSink
+from .source import FileSource, InputSource, QueueSource, stdin
+from .utils import PipeReader
+
+ENCODING = "utf-8"
+
+
+class Transport:
+    """
+    传输的基类
+    """
+    source = None  # type:InputSource
+    output = None  # type:OutputSink
+
+    def close(self) -> None:
+        """释放传输占用的资源
+        """
+
+    def __enter__(self) -> "Transport":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class StdioTransport(Transport):
+    """
+    标准输入输出，与`source.listen`共用标准输入的缓冲
+    """
+
+    def __init__(self):
+        self.output = StreamSink()
+
+    @property
+    def source(self) -> InputSource:
+        # 读取时才获取，没有读取时不会打开标准输入
+        return stdin()
+
+
+class FdTransport(Transport):
+    """
+    从一个文件描述符读取输入，把输出写入另一个文件描述符
+    """
+
+    def __init__(self, read_fd: int, write_fd: int, close_fds: bool = False):
+        """
+        Parameters
+        ----------
+        read_fd
+            读取输入的文件描述符
+        write_fd
+            写入输出的文件描述符，可以与read_fd相同
+        close_fds
+            `close`时是否关闭文件描述符
+        """
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.close_fds = close_fds
+        self.source = FileSource(PipeReader(read_fd))
+        self.output = OutputSink(self._write)
+
+    def _write(self, lines: List[str]) -> None:
+        data = memoryview("".join(line + "\n" for line in lines).encode(ENCODING))
+        while data:
+            data = data[os.write(self.write_fd, data):]
+
+    def close(self) -> None:
+        self.source.close()
+        if self.close_fds:
+            for fd in {self.read_fd, self.write_fd}:
+                os.close(fd)
+            self.close_fds = False
+
+
+class FifoTransport(FdTransport):
+    """
+    从一个具名管道读取输入，把输出写入另一个具名管道
+    """
+
+    def __init__(self, read_path: str, write_path: str):
+        """
+        Parameters
+        ----------
+        read_path
+            输入的管道
+        write_path
+            输出的管道
+
+        两端都以读写方式打开，与`utils.get_pipe_read_end`一致：打开时不需要等待另一端，
+        另一端关闭时也不会读到输入结束
+        """
+        read_fd = os.open(read_path, os.O_RDWR)
+        try:
+            write_fd = os.open(write_path, os.O_RDWR)
+        except OSError:
+            os.close(read_fd)
+            raise
+        super().__init__(read_fd, write_fd, close_fds=True)
+
+
+class UnixTransport(FdTransport):
+    """
+    通过一个已经连接的Unix domain socket读取输入和写入输出
+    """
+
+    def __init__(self, sock: socket.socket):
+        """
+        Parameters
+        ----------
+        sock
+            已经连接的socket，`close`时关闭
+        """
+        self.sock = sock
+        super().__init__(sock.fileno(), sock.fileno())
+
+    @classmethod
+    def connect(cls, path: str) -> "UnixTransport":
+        """连接到path上监听的服务
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            raise
+        return cls(sock)
+
+    def close(self) -> None:
+        super().close()
+        self.sock.close()
+
+
+class MemoryTransport(Transport):
+    """
+    进程内的队列
+
+    `send`放入输入，`receive`取出输出。解释器可以在另一个线程中执行
+    """
+
+    def __init__(self):
+        self.inputs = queue.Queue()  # type:queue.Queue[str]
+        self.outputs = queue.Queue()  # type:queue.Queue[str]
+        self.source = QueueSource(self.inputs)
+        self.output = OutputSink(self._put)
+
+    def _put(self, lines: List[str]) -> None:
+        for line in lines:
+            self.outputs.put(line)
+
+    def send(self, *lines: str) -> None:
+        """输入几行
+        """
+        for line in lines:
+            self.inputs.put(line)
+
+    def receive(self, timeout: Union[float, None] = None) -> str:
+        """取出一次speak的内容
+
+        Raises
+        ------
+            `queue.Empty`:
+                timeout内没有输出
+        """
+        return self.outputs.get(timeout=timeout)
+
+    def received(self) -> List[str]:
+        """取出已经交出的所有输出，不等待
+        """
+        lines = []
+        while True:
+            try:
+                lines.append(self.outputs.get_nowait())
+            except queue.Empty:
+                return lines
+
+
+def open_transport(fifo: Any = None, unix: str = None) -> Transport:
+    """根据命令行参数创建传输
+
+    Parameters
+    ----------
+    fifo
+        输入和输出的具名管道的路径
+    unix
+        Unix domain socket的路径
+    """
+    if fifo is not None:
+        return FifoTransport(*fifo)
+    if unix is not None:
+        return UnixTransport.connect(unix)
+    return StdioTransport()
@@ -1,9 +1,11 @@
+import codecs
+import collections
 import fcntl
 import os
 import platform
 import signal
 from functools import wraps
-from typing import Callable
+from typing import Callable, Deque, List, Tuple, Union
 
 from .exception import SamoyedTimeout
 
@@ -17,6 +19,10 @@ else:
 FLAG_SET_PIPE_BUFFER_SIZE = 1031  # 设置管道缓冲区的标志
 FLAG_GET_PIPE_BUFFER_SIZE = 1032  # 读取管道缓冲区的标志
 
+CACHE_DIR_ENV = "SAMOYED_CACHE_DIR"  # 指定缓存目录的环境变量
+
+READ_SIZE = 65536  # 每次从文件描述符读取的最大字节数
+
 
 def watchdog(seconds=0.1):
     """看门狗装饰器
@@ -53,6 +59,27 @@ def watchdog(seconds=0.1):
     return decorator
 
 
+def get_cache_dir() -> Union[str, None]:
+    """获取缓存目录
+
+    优先使用环境变量SAMOYED_CACHE_DIR指定的目录；
+    否则使用$XDG_CACHE_HOME/samoyed，默认为~/.cache/samoyed
+
+    Returns
+    -------
+        缓存目录。如果目录无法创建，返回None
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        cache_dir = os.path.join(base, "samoyed")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return None
+    return cache_dir
+
+
 def make_pipe(name: str, buffer_size=8192) -> None:
     """
     生成一个具名管道
@@ -90,14 +117,136 @@ def delete_pipe(name: str) -> None:
         pass
 
 
-def get_pipe_read_end(name: str) -> (int, Callable):
+class PipeReader:
+    """
+    从文件描述符读取文本
+
+    每次读取都写入同一个`bytearray`(`os.readv`)，不为每次读取分配新的bytes；用增量解码器解码，
+    一个汉字的几个字节被分到两次读取中时，前面的字节留到下一次一起解码，不会出错或者变成乱码。
+    无法解码的字节替换成U+FFFD。
+
+    可以按块读取(`read`)，也可以按行读取(`fill`、`readline`)。
+    `source.FileSource`用它切分输入，作为带时间控制的match的输入源
+    """
+
+    def __init__(self, fd: int, size: int = READ_SIZE, encoding: str = "utf-8"):
+        """
+        Parameters
+        ----------
+        fd
+            文件描述符，不会被关闭
+        size
+            每次读取的最大字节数
+        encoding
+            编码
+        """
+        self.fd = fd
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        # 完整的行，不包含换行符
+        self.lines = collections.deque()  # type:Deque[str]
+        # 最后一行还没有读到换行符的部分
+        self._partial = []  # type:List[str]
+        self.eof = False
+
+    def read(self, num: int = None) -> str:
+        """读取一次，返回解码后的文本
+
+        先返回已经按行切分、还没有取走的文本。读到的字节只有不完整的字符时继续读取，
+        直到至少解码出一个字符或者输入结束。只有输入结束时才返回空字符串，并且`eof`为True
+
+        Parameters
+        ----------
+        num
+            最多读取的字节数，默认为缓冲区的大小
+        """
+        if self.lines or self._partial:
+            text = "".join(line + "\n" for line in self.lines) + "".join(self._partial)
+            self.lines.clear()
+            self._partial.clear()
+            return text
+        while True:
+            # 调用者把空字符串当作输入结束
+            n, text = self._readinto(num)
+            if text or not n:
+                return text
+
+    __call__ = read
+
+    def fill(self) -> int:
+        """读取一次，把文本切分成行放入`lines`
+
+        Returns
+        -------
+            读到的字节数，为0时输入已经结束，最后一行没有换行符时也放入`lines`
+
+        Raises
+        ------
+            `BlockingIOError`:
+                非阻塞的文件描述符暂时没有数据
+        """
+        n, text = self._readinto()
+        if text:
+            *lines, rest = text.split("\n")
+            if lines:
+                self._partial.append(lines[0])
+                lines[0] = "".join(self._partial)
+                self._partial.clear()
+                self.lines.extend(lines)
+            if rest:
+                self._partial.append(rest)
+        if not n and self._partial:
+            self.lines.append("".join(self._partial))
+            self._partial.clear()
+        return n
+
+    def readline(self) -> str:
+        """读取一行，不包含换行符。文件描述符需要是阻塞的
+
+        Raises
+        ------
+            `EOFError`:
+                输入已经结束
+        """
+        while not self.lines:
+            if self.eof:
+                raise EOFError
+            self.fill()
+        return self.lines.popleft()
+
+    def _readinto(self, num: int = None) -> Tuple[int, str]:
+        """读取一次并解码，返回读到的字节数和解码后的文本
+        """
+        if self.eof:
+            return 0, ""
+        view = self._view if num is None or num >= len(self._buffer) else self._view[:num]
+        n = _readinto(self.fd, view)
+        if not n:
+            self.eof = True
+            return 0, self._decoder.decode(b"", final=True)
+        return n, self._decoder.decode(view[:n])
+
+
+if hasattr(os, "readv"):
+    def _readinto(fd: int, view: memoryview) -> int:
+        return os.readv(fd, [view])
+else:
+    def _readinto(fd: int, view: memoryview) -> int:
+        data = os.read(fd, len(view))
+        view[:len(data)] = data
+        return len(data)
+
+
+def get_pipe_read_end(name: str) -> Tuple[int, PipeReader]:
     """
     获取管道的读取端函数
     :param name: 管道名
-    :return: 读取函数
+    :return: 文件描述符和读取函数，读取函数是一个`PipeReader`，`reader(num)`返回解码后的文本，
+        也可以作为listen传给带时间控制的match
     """
     fd = os.open(name, os.O_RDWR)
-    return fd, lambda num: os.read(fd, num).decode("utf-8")
+    return fd, PipeReader(fd)
 
 
 def get_pipe_write_end(name: str) -> Callable:
@@ -0,0 +1,341 @@
+"""
+字节码虚拟机
+
+把每个状态的语句编译成一个线性的指令序列，由一个循环执行，
+代替`Interpreter.exec_statement`的递归分派。
+
+* if和match被编译成条件跳转和跳转表
+* 跳转语句是一条显式的BRANCH指令。链接过的跳转是BRANCH_STATE，直接保存目标状态
+* match的匹配值和正则匹配结果保存在一个小的操作数栈上
+* 表达式使用`compiler.ExpressionCompiler`编译好的闭包
+
+执行结果与树遍历解释器一致，包括以下细节：
+
+* 块（if、match的子块）中执行了branch后，会跳过块中剩余的语句；
+  但是状态顶层的语句仍然会继续执行
+* 普通match的case块不检查branch，正则分组在块执行完以后才绑定
+"""
+from typing import Any, Callable, List, Tuple
+
+import lark
+
+from .exception import *
+from .frame import SymbolTable
+from .link import LINK_ATTR
+
+# 操作码
+EVAL = 0  # arg=闭包。求值并丢弃结果
+ASSIGN = 1  # arg=(变量名,闭包,下标,符号表)
+JUMP_IF_FALSE = 2  # arg=(闭包,目标)。求值，结果为假时跳转
+JUMP = 3  # arg=目标
+JUMP_IF_NEXT = 4  # arg=目标。如果已经执行了branch，跳转
+BRANCH = 5  # arg=状态名
+PUSH = 6  # arg=闭包。求值并压栈
+POP = 7  # 弹出栈顶
+CASE = 8  # arg=(闭包,目标)。和栈顶比较，匹配时把匹配结果压栈，否则跳转
+BIND = 9  # 弹出匹配结果，绑定正则分组
+LISTEN = 10  # arg=match语句。执行带时间控制的匹配，把匹配到的case序号(超时为None)压栈
+JUMP_TABLE = 11  # arg=(目标列表,默认目标)。弹出序号并跳转
+RETURN_IF_EXIT = 12  # 如果程序已经退出，结束执行
+RAISE = 13  # arg=异常类型
+BRANCH_STATE = 14  # arg=已经链接好的目标状态(`link.State`)
+
+OPNAMES = ["EVAL", "ASSIGN", "JUMP_IF_FALSE", "JUMP", "JUMP_IF_NEXT", "BRANCH", "PUSH", "POP", "CASE", "BIND",
+           "LISTEN", "JUMP_TABLE", "RETURN_IF_EXIT", "RAISE", "BRANCH_STATE"]
+
+Instruction = Tuple[int, Any]
+
+# 编译结果保存在语句节点的这个属性上
+CODE_ATTR = "_samoyed_code"
+
+
+class BytecodeCompiler:
+    """
+    把语句编译成指令序列
+    """
+
+    def __init__(self, expression_compiler):
+        """
+        Parameters
+        ----------
+        expression_compiler
+            表达式编译器，`compiler.ExpressionCompiler`
+        """
+        self.expression_compiler = expression_compiler
+
+    def compile_state(self, state: lark.Tree, symbols: SymbolTable) -> Tuple[Instruction, ...]:
+        """编译一个状态
+
+        Parameters
+        ----------
+        state
+            statedef节点
+        symbols
+            程序的符号表
+
+        Returns
+        -------
+            指令序列
+        """
+        code = getattr(state, CODE_ATTR, None)
+        if code is None:
+            code = []
+            for stat in state.children[1:]:
+                self._statement(stat, code, symbols)
+                # 如果调用了exit，直接退出
+                code.append([RETURN_IF_EXIT, None])
+            code = self._finish(code)
+            setattr(state, CODE_ATTR, code)
+        return code
+
+    def compile_statement(self, stat: lark.Tree, symbols: SymbolTable) -> Tuple[Instruction, ...]:
+        """编译单个语句
+
+        Parameters
+        ----------
+        stat
+            语句节点
+        symbols
+            程序的符号表
+
+        Returns
+        -------
+            指令序列
+        """
+        code = getattr(stat, CODE_ATTR, None)
+        if code is None:
+            code = []
+            self._statement(stat, code, symbols)
+            code = self._finish(code)
+            setattr(stat, CODE_ATTR, code)
+        return code
+
+    @staticmethod
+    def _finish(code: List[list]) -> Tuple[Instruction, ...]:
+        return tuple((op, tuple(arg) if isinstance(arg, list) else arg) for op, arg in code)
+
+    def _expr(self, expr: Any, symbols: SymbolTable) -> Callable:
+        return self.expression_compiler.compile(expr, symbols)
+
+    def _block(self, statements: list, code: List[list], checked: bool, symbols: SymbolTable) -> None:
+        """编译一个块
+
+        Parameters
+        ----------
+        statements
+            块中的语句
+        code
+            指令序列
+        checked
+            每个语句执行后是否检查branch
+        symbols
+            程序的符号表
+        """
+        jumps = []
+        for i, stat in enumerate(statements):
+            self._statement(stat, code, symbols)
+            if checked and i != len(statements) - 1:
+                jumps.append(len(code))
+                code.append([JUMP_IF_NEXT, None])
+        for index in jumps:
+            code[index][1] = len(code)
+
+    def _statement(self, stat: lark.Tree, code: List[list], symbols: SymbolTable) -> None:
+        if stat.data == "simple_stmt":
+            simple_stmt = stat.children[0]
+            # 如果是终结符，那么不需要再处理了
+            if not isinstance(simple_stmt, lark.Tree): return
+            simple_stmt_type = simple_stmt.data
+            if simple_stmt_type == "branch_expr":
+                target = getattr(simple_stmt, LINK_ATTR, None)
+                if target is not None:
+                    code.append([BRANCH_STATE, target])
+                else:
+                    code.append([BRANCH, simple_stmt.children[0]])
+            elif simple_stmt_type == "assign_expr":
+                name = simple_stmt.children[0].value
+                code.append([ASSIGN, [name, self._expr(simple_stmt.children[2], symbols), symbols.slot(name),
+                                      symbols]])
+            elif simple_stmt_type == "pass_expr":
+                return
+            else:
+                code.append([EVAL, self._expr(simple_stmt, symbols)])
+        elif stat.data == "match_stmt":
+            expr = stat.children[0]
+            if isinstance(expr, lark.Tree) and expr.data == "at_expr":
+                self._time_control_match(stat, code, symbols)
+            else:
+                self._normal_match(stat, code, symbols)
+        elif stat.data == "if_stmt":
+            """
+                 JUMP_IF_FALSE expr,else
+                 true_st
+                 JUMP end
+            else:
+                 false_st
+            end:
+            """
+            jump_if_false = [JUMP_IF_FALSE, [self._expr(stat.children[0], symbols), None]]
+            code.append(jump_if_false)
+            self._block(stat.children[1].children, code, checked=True, symbols=symbols)
+            if len(stat.children) == 3:
+                jump = [JUMP, None]
+                code.append(jump)
+                jump_if_false[1][1] = len(code)
+                self._block(stat.children[2].children, code, checked=True, symbols=symbols)
+                jump[1] = len(code)
+            else:
+                jump_if_false[1][1] = len(code)
+        else:
+            code.append([RAISE, SamoyedNotImplementError])
+
+    def _normal_match(self, stat: lark.Tree, code: List[list], symbols: SymbolTable) -> None:
+        """
+                PUSH expr0
+                CASE expr1,case2
+                case1块
+                BIND
+                JUMP end
+        case2:  CASE expr2,default
+                ...
+        default:
+                default块
+        end:    POP
+        """
+        code.append([PUSH, self._expr(stat.children[0], symbols)])
+        jumps = []
+        for case_statment in stat.children[1:]:
+            if case_statment.data == "default_stmt":
+                self._block(case_statment.children, code, checked=True, symbols=symbols)
+                break
+            case = [CASE, [self._expr(case_statment.children[0], symbols), None]]
+            code.append(case)
+            self._block(case_statment.children[1:], code, checked=False, symbols=symbols)
+            code.append([BIND, None])
+            jumps.append([JUMP, None])
+            code.append(jumps[-1])
+            case[1][1] = len(code)
+        for jump in jumps:
+            jump[1] = len(code)
+        code.append([POP, None])
+
+    def _time_control_match(self, stat: lark.Tree, code: List[list], symbols: SymbolTable) -> None:
+        """
+                LISTEN stat
+                JUMP_TABLE [case1,case2...],silence
+        case1:  case1块
+                JUMP end
+                ...
+        silence:
+                silence块
+        end:
+        """
+        code.append([LISTEN, stat])
+        table = [JUMP_TABLE, [[], None]]
+        code.append(table)
+        jumps = []
+        for case_statment in stat.children[1:]:
+            if case_statment.data == "silence_stmt":
+                continue
+            table[1][0].append(len(code))
+            self._block(case_statment.children[1:], code, checked=True, symbols=symbols)
+            jumps.append([JUMP, None])
+            code.append(jumps[-1])
+        table[1][1] = len(code)
+        if stat.children[-1].data == "silence_stmt":
+            self._block(stat.children[-1].children, code, checked=True, symbols=symbols)
+        for jump in jumps:
+            jump[1] = len(code)
+
+
+def run(code: Tuple[Instruction, ...], interpreter) -> None:
+    """执行指令序列
+
+    Parameters
+    ----------
+    code
+        指令序列
+    interpreter
+        解释器，提供上下文、状态表和匹配的实现
+    """
+    context = interpreter.context
+    stack = []
+    pc = 0
+    n = len(code)
+    while pc < n:
+        op, arg = code[pc]
+        pc += 1
+        if op == EVAL:
+            arg(context)
+        elif op == ASSIGN:
+            value = arg[1](context)
+            frame = context.frame
+            if frame.symbols is arg[3] and arg[2] < len(frame.slots):
+                frame.slots[arg[2]] = value
+            else:
+                frame.set(arg[0], value)
+        elif op == RETURN_IF_EXIT:
+            if context.is_exit():
+                return
+        elif op == JUMP_IF_FALSE:
+            if not arg[0](context):
+                pc = arg[1]
+        elif op == JUMP_IF_NEXT:
+            if context.next is not None:
+                pc = arg
+        elif op == JUMP:
+            pc = arg
+        elif op == BRANCH_STATE:
+            context.next = arg
+        elif op == BRANCH:
+            if arg in interpreter.stage:
+                context.next = interpreter.stage[arg]
+            else:
+                raise SamoyedNameError
+        elif op == CASE:
+            is_matched, result = interpreter._match_value(arg[0](context), stack[-1])
+            if is_matched:
+                stack.append(result)
+            else:
+                pc = arg[1]
+        elif op == BIND:
+            interpreter._bind_match_groups(stack.pop())
+        elif op == PUSH:
+            stack.append(arg(context))
+        elif op == POP:
+            stack.pop()
+        elif op == LISTEN:
+            stack.append(interpreter._listen_match(arg))
+        elif op == JUMP_TABLE:
+            index = stack.pop()
+            pc = arg[1] if index is None else arg[0][index]
+        elif op == RAISE:
+            raise arg()
+        else:
+            raise SamoyedNotImplementError
+
+
+def disassemble(code: Tuple[Instruction, ...]) -> str:
+    """把指令序列转换成可读的文本，用于调试
+
+    Parameters
+    ----------
+    code
+        指令序列
+
+    Returns
+    -------
+        每行一条指令
+    """
+    lines = []
+    for i, (op, arg) in enumerate(code):
+        if op in (EVAL, PUSH):
+            arg = "<expr>"
+        elif op == ASSIGN:
+            arg = "{}, <expr>".format(arg[0])
+        elif op in (JUMP_IF_FALSE, CASE):
+            arg = ", ".join(str(a) if not callable(a) else "<expr>" for a in arg)
+        elif op == LISTEN:
+            arg = "<match>"
+        lines.append("{:>4} {:<15}{}".format(i, OPNAMES[op], "" if arg is None else arg))
+    return "\n".join(lines)
@@ -1,43 +1,69 @@
-import os
-import socket
-import subprocess
-import sys
-import time
-
-from samoyed.utils import make_pipe,get_pipe_read_end
-import threading
+"""
+对话服务
+
+每个连接在进程内创建一个对话，程序只在启动时加载一次，协议见`samoyed.server`::
+
+    python server.py test/script/simple.sam [更多的程序...] [--port 65431] [--max-sessions 1024]
+
+客户端发送`simple 张三 100`选择程序并传入参数，之后按行输入、按行接收speak的内容。
+
+`--workers N`在加载程序之后fork出N个工作进程，共享程序的内存和监听socket，可以使用多个CPU核心。
+
+`--subprocess`使用旧的方式：每个连接启动一个进程执行给出的命令(例如`samc gen`生成的程序)，
+连接发送的第一行按空格分隔后作为命令的参数，之后socket和进程的标准输入输出之间直接转发数据::
+
+    python server.py --subprocess "python simple.sam.py"
+"""
+import argparse
+import asyncio
+import shlex
+
+from samoyed.aio import AsyncInterpreter
+from samoyed.pool import POOL_SIZE, pools
+from samoyed.server import DRAIN_TIMEOUT, MAX_QUEUE, MAX_SESSIONS, OUTPUT_LIMIT, PreforkServer, Program, \
+    SessionServer, SubprocessServer
+
 HOST = '127.0.0.1'
 PORT = 65431
 
-def handle_request(conn):
-    username = conn.recv(11)
-    username = username.decode()
-    command = ["./venv/bin/python","simple2.sam.py", username]
-    fd = os.open("/tmp/test_pipe", os.O_RDWR)
-    sproc = subprocess.Popen(command,stdin=fd,stdout=subprocess.PIPE)
-    conn.sendall("ok".encode())
-    while sproc.poll() is None:
-        print(f"check={sproc.poll()}")
-        data = conn.recv(128)
-        data = data.decode()
-        os.write(fd,data.encode())
-        data = sproc.stdout.read(1024)
-        conn.sendall(data)
-        time.sleep(0.2)
-
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-    s.bind((HOST, PORT))
-    s.listen()
-    while True:
-        conn, addr = s.accept()
-        print('Connected by', addr)
-        t = threading.Thread(target=handle_request,args=(conn,))
-        t.start()
-
-# # command = ["./venv/bin/python","simple2.sam.py", "ruiqurm"]
-# fd = os.open("/tmp/test_pipe", )
-# # sproc = subprocess.Popen(command,stdin=fd)
-# time.sleep(0.1)
-# os.write(fd,"查询".encode())
-# # sproc.wait()
 
+def main():
+    parser = argparse.ArgumentParser(description="samoyed对话服务")
+    parser.add_argument("programs", nargs="*", help="程序文件，程序名是去掉扩展名的文件名")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS, help="同时进行的对话的上限")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE, help="排队等待的连接数的上限，超过时回复BUSY")
+    parser.add_argument("--queue-timeout", type=float, help="排队的最长时间(秒)，超过时回复BUSY")
+    parser.add_argument("--output-limit", type=int, default=OUTPUT_LIMIT, help="每个连接待发送的数据的上限(字节)")
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT,
+                        help="待发送的数据超过上限时等待客户端读取的时间(秒)，超过时断开连接")
+    parser.add_argument("--db-pool-size", type=int, default=POOL_SIZE, help="每个sqlite数据库最多打开的连接数")
+    parser.add_argument("--exec-mode", choices=AsyncInterpreter.MODES, default="closure", help="执行方式")
+    parser.add_argument("--workers", type=int, default=0, help="工作进程数，为0时不fork")
+    parser.add_argument("--subprocess", help="每个连接启动一个进程执行这个命令")
+    parser.add_argument("--no-splice", action="store_true", help="子进程方式不使用os.splice，在Python中复制数据")
+    args = parser.parse_args()
+    pools.configure(size=args.db_pool_size)
+
+    limits = {"max_sessions": args.max_sessions, "max_queue": args.max_queue, "queue_timeout": args.queue_timeout,
+              "output_limit": args.output_limit, "drain_timeout": args.drain_timeout}
+    if args.subprocess is not None:
+        server = SubprocessServer(shlex.split(args.subprocess), splice=not args.no_splice, **limits)
+        print("Serving '{}' on {}:{}".format(args.subprocess, args.host, args.port))
+    elif args.programs:
+        programs = [Program.load(path, mode=args.exec_mode) for path in args.programs]
+        server = SessionServer(programs, **limits)
+        print("Serving {} on {}:{}".format(", ".join(p.name for p in programs), args.host, args.port))
+    else:
+        parser.error("no program")
+    if args.workers > 0:
+        prefork = PreforkServer(server, workers=args.workers)
+        prefork.start(args.host, args.port)
+        prefork.serve_forever()
+    else:
+        asyncio.run(server.serve_forever(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
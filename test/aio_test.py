@@ -0,0 +1,372 @@
+"""
+异步解释器测试
+"""
+import asyncio
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from samoyed.aio import AsyncInterpreter, StdinReader, wait_for_match
+from samoyed.exception import *
+from test.transpile_test import run_interpreter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BRANCH_CODE = """
+cnt = 0
+state main:
+    speak("main")
+    if cnt > 1:
+        exit()
+        speak("never")
+    match cnt:
+        0 =>
+            speak("zero")
+            branch a
+            speak("after branch in case")
+        default =>
+            branch b
+            speak("never")
+    speak("after if")
+state a:
+    speak("a")
+    cnt = cnt + 1
+    branch main
+state b:
+    speak("b" + cnt)
+    cnt = cnt + 1
+    branch main
+    speak("still in b")
+"""
+
+EXPRESSION_CODE = """
+x = 3
+state main:
+    speak(x * 2 + 1 - 4 // 3 % 2)
+    speak(-x)
+    speak(x > 2 ? "big" : "small")
+    speak(not x)
+    speak(x > 1 or x > 5 and false)
+    speak("a" + 1 + 2.5)
+    speak(len("hello") + len("a"))
+    speak({})
+"""
+
+
+def run_async(code: str, names: dict, mode: str = "tree") -> list:
+    """
+    用异步解释器执行，返回speak的内容
+    """
+    output = []
+
+    async def speak(value):
+        await asyncio.sleep(0)
+        output.append(value)
+
+    async def run():
+        i = AsyncInterpreter(code, cache=False, mode=mode)
+        i.context.names.update(names)
+        i.context.names["speak"] = speak
+        try:
+            await i.exec()
+        except SamoyedException as e:
+            output.append((type(e), str(e)))
+        if i.context.is_exit():
+            output.append("<exit>")
+
+    asyncio.run(run())
+    return output
+
+
+def queue_input(q: asyncio.Queue):
+    """
+    从队列中读取输入的协程函数
+    """
+    return q.get
+
+
+class AsyncInterpreterTest(unittest.TestCase):
+    mode = "tree"
+
+    def test_same_result(self):
+        """
+        测试执行结果与同步的解释器一致
+        """
+        print("[测试异步解释器]", end=" ")
+        self.assertEqual(run_interpreter(BRANCH_CODE, {}), run_async(BRANCH_CODE, {}, self.mode))
+        for tail, names in [("1", {}), ("-\"a\"", {}), ("y", {}), ("1 / 0", {}), ("f()", {}),
+                            ("f(1)", {"f": lambda: 1}), ("1 < \"a\"", {}), ("(1 + \"a\") * 2", {})]:
+            code = EXPRESSION_CODE.format(tail)
+            names = dict(names, len=len)
+            self.assertEqual(run_interpreter(code, names), run_async(code, names, self.mode), tail)
+        print("pass")
+
+    def test_same_exception(self):
+        """
+        测试包含函数调用的表达式出错时，异常与同步的解释器一致
+        """
+        print("[测试异步解释器的异常]", end=" ")
+        names = {"x": 3, "f": lambda a: a * 2}
+        for expr in ['undefined + f(1)', 'f(1) + undefined', 'x // 0 + f(1)', 'f(1) * "s" - f(2)', '-f("s")',
+                     'f("s") < 1', 'undefined()', 'f(1, 2)', 'f(undefined)', 'not undefined or f(1)',
+                     'f(1) > 1 ? undefined : 0']:
+            code = "state main:\n    speak({})\n".format(expr)
+            expected = run_interpreter(code, names)
+            self.assertIsInstance(expected[-1], tuple, expr)
+            self.assertEqual(expected, run_async(code, names, self.mode), expr)
+        print("pass")
+
+    def test_coroutine(self):
+        """
+        测试在表达式中调用协程函数
+        """
+        print("[测试协程函数]", end=" ")
+
+        async def double(x):
+            await asyncio.sleep(0.01)
+            return x * 2
+
+        async def fail():
+            raise ValueError("bad")
+
+        code = """
+y = double(1)
+state main:
+    speak(double(y) + 1 > 4 ? double(3) : "small")
+    speak(fail())
+"""
+        self.assertEqual([6, (SamoyedRuntimeError, "bad")], run_async(code, {"double": double, "fail": fail}, self.mode))
+        print("pass")
+
+    def test_time_control(self):
+        """
+        测试带时间控制的match
+        """
+        code = """
+state main:
+    match @(2,1)listen():
+        /投诉(.*)/ =>
+            speak("投诉" + $mg1)
+        "账单" =>
+            speak("账单")
+        silence =>
+            speak("沉默")
+"""
+        for plan, expected in [({0: "账", 0.3: "单"}, ["账单"]), ({0: "投诉网络"}, ["投诉网络"]), ({}, ["沉默"])]:
+            print("[测试异步时间控制 {}]".format(expected[0]), end=" ")
+
+            async def run():
+                q = asyncio.Queue()
+                for delay, value in plan.items():
+                    asyncio.get_running_loop().call_later(delay, q.put_nowait, value)
+                output = []
+                i = AsyncInterpreter(code, cache=False, mode=self.mode)
+                i.context.names["listen"] = queue_input(q)
+                i.context.names["speak"] = output.append
+                start = time.time()
+                await i.exec()
+                # 至少等待1秒
+                self.assertGreaterEqual(time.time() - start, 1)
+                return output
+
+            self.assertEqual(expected, asyncio.run(run()))
+            print("pass")
+
+    def test_many_conversations(self):
+        """
+        测试一个事件循环中同时进行很多个对话，exit只结束自己的对话
+        """
+        print("[测试多个对话]", end=" ")
+        code = """
+state main:
+    speak("你好")
+    match @(3)listen():
+        "再见" =>
+            exit()
+            speak("never")
+        "账单" =>
+            speak("账单" + $id)
+            branch main
+        silence =>
+            speak("沉默")
+"""
+        count = 1000
+
+        async def conversation(n: int, q: asyncio.Queue) -> list:
+            output = []
+            i = AsyncInterpreter(code, args={"id": n}, mode=self.mode)
+            i.context.names["listen"] = queue_input(q)
+            i.context.names["speak"] = output.append
+            await i.exec()
+            return output
+
+        async def run():
+            queues = [asyncio.Queue() for _ in range(count)]
+            tasks = [asyncio.create_task(conversation(n, q)) for n, q in enumerate(queues)]
+            for q in queues:
+                q.put_nowait("查账单")
+            await asyncio.sleep(0.2)
+            for q in queues:
+                q.put_nowait("再见")
+            return await asyncio.gather(*tasks)
+
+        start = time.time()
+        results = asyncio.run(run())
+        # 所有的对话同时等待，总时间远小于逐个执行
+        self.assertLess(time.time() - start, 3)
+        for n, output in enumerate(results):
+            self.assertEqual(["你好", "账单{}".format(n), "你好"], output)
+        print("pass")
+
+    def test_sqlite(self):
+        """
+        测试异步的sqlite函数
+        """
+        print("[测试异步sqlite]", end=" ")
+        code = """
+state main:
+    cursor = sqlite_connect("./aio_test.db")
+    sqlite(cursor, "CREATE TABLE T(A INT PRIMARY KEY,B INT);")
+    sqlite(cursor, "INSERT INTO T(A,B) VALUES (1,2);")
+    result = sqlite(cursor, "SELECT * FROM T;")
+    speak(eval("result[0][1]"))
+"""
+        try:
+            self.assertEqual([2], run_async(code, {}, self.mode))
+        finally:
+            if os.path.exists("./aio_test.db"):
+                os.remove("./aio_test.db")
+        print("pass")
+
+    def test_wait_for_match(self):
+        """
+        测试超时和最短等待时间
+        """
+        print("[测试wait_for_match]", end=" ")
+
+        async def run():
+            q = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.1, q.put_nowait, "单")
+            loop.call_later(0.2, q.put_nowait, "账单")
+            start = loop.time()
+            # 0.1秒时已经匹配了第二个case，但是要等到1秒，这期间第一个case也匹配了
+            result = await wait_for_match(q.get, 2, 1, ["账单", "单"])
+            self.assertGreaterEqual(loop.time() - start, 1)
+            self.assertEqual((0, None), result)
+            # 超时
+            start = loop.time()
+            self.assertEqual((None, None), await wait_for_match(q.get, 1, None, ["账单"]))
+            self.assertLess(loop.time() - start, 1.5)
+
+        async def idle():
+            calls = []
+
+            async def ended():
+                calls.append(loop.time())
+                raise EOFError
+
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            # 输入结束之后不再调用输入函数，直接等到超时
+            self.assertEqual((None, None), await wait_for_match(ended, 0.5, None, ["账单"]))
+            self.assertGreaterEqual(loop.time() - start, 0.5)
+            self.assertEqual(1, len(calls))
+            # 已经匹配时等到最短等待时间
+            calls.clear()
+            q = asyncio.Queue()
+            q.put_nowait("账单")
+
+            async def once():
+                if q.empty():
+                    return await ended()
+                return q.get_nowait()
+
+            start = loop.time()
+            self.assertEqual((0, None), await wait_for_match(once, 5, 0.3, ["账单"]))
+            self.assertLess(loop.time() - start, 1)
+            self.assertEqual(1, len(calls))
+            # 空行也是输入，之后立即继续读取
+            for line in ("", "账单"):
+                q.put_nowait(line)
+            start = loop.time()
+            self.assertEqual((0, None), await wait_for_match(q.get, 5, None, ["账单"]))
+            self.assertLess(loop.time() - start, 0.05)
+
+        asyncio.run(run())
+        asyncio.run(idle())
+        with self.assertRaises(SamoyedInterpretError):
+            AsyncInterpreter("state main:\n    pass\n", mode="vm")
+        print("pass")
+
+    def test_stdin_timeout(self):
+        """
+        测试在线程中读取标准输入时，超时不会丢掉之后读到的行
+        """
+        print("[测试标准输入超时]", end=" ")
+
+        class Stdin:
+            """普通文件不能注册到事件循环，readline会阻塞"""
+
+            def __init__(self, file):
+                self.file = file
+                self.lines = queue.Queue()
+
+            def fileno(self):
+                return self.file.fileno()
+
+            def readline(self):
+                return self.lines.get()
+
+        async def run():
+            try:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(StdinReader.readline(), 0.1)
+                stdin.lines.put("账单\n")
+                self.assertEqual("账单", await asyncio.wait_for(StdinReader.readline(), 1))
+                stdin.lines.put("")
+                with self.assertRaises(EOFError):
+                    await asyncio.wait_for(StdinReader.readline(), 1)
+            finally:
+                # 放出没有取到结果的读取线程，事件循环关闭时要等待线程池
+                stdin.lines.put("")
+
+        with tempfile.TemporaryFile() as file:
+            stdin = Stdin(file)
+            old = sys.stdin
+            sys.stdin = stdin
+            try:
+                asyncio.run(run())
+            finally:
+                sys.stdin = old
+                StdinReader._pending = None
+        print("pass")
+
+    def test_samc_exec_mode(self):
+        """
+        测试samc run --async不接受异步解释器不支持的执行方式
+        """
+        print("[测试samc run --async --exec-mode]", end=" ")
+        result = subprocess.run([sys.executable, os.path.join(ROOT, "samc"), "run",
+                                 os.path.join(ROOT, "test", "script", "example.sam"),
+                                 "--async", "--exec-mode", "vm"],
+                                stdin=subprocess.DEVNULL, capture_output=True, timeout=30)
+        self.assertEqual(2, result.returncode)
+        self.assertIn(b"--async", result.stderr)
+        self.assertNotIn(b"Traceback", result.stderr)
+        print("pass")
+
+
+class ClosureAsyncInterpreterTest(AsyncInterpreterTest):
+    """
+    用closure模式执行同样的测试
+    """
+    mode = "closure"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+语法树序列化和缓存测试
+"""
+import os
+import tempfile
+import time
+import unittest
+
+from lark import Token, Tree
+
+from samoyed.cache import ASTCache
+from samoyed.core import Interpreter, grammar_hash
+from samoyed.exception import SamoyedFormatError, SamoyedRuntimeError
+from samoyed.serialize import dumps, loads, dump_program, load_program
+
+SCRIPT_DIR = "{}/script".format(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SerializeTest(unittest.TestCase):
+    def test_values(self):
+        """
+        测试常量的编码
+        """
+        values = [None, True, False, 0, 1, -1, 12345678901234567, -2 ** 70, 3.14, -1e5, "", "hello", "中文",
+                  [1, ["a", None]], Token("NAME", "x"), Tree("funccall", [Token("NAME", "speak"), None])]
+        for value in values:
+            self.assertEqual(value, loads(dumps(value)))
+        # bool不能被还原成int
+        self.assertIs(loads(dumps(True)), True)
+        token = loads(dumps(Token("DOLLAR_VAR", "$1", line=3, column=7)))
+        self.assertEqual(("DOLLAR_VAR", "$1", 3, 7), (token.type, token.value, token.line, token.column))
+
+    def test_scripts(self):
+        """
+        测试脚本的语法树能够完整还原
+        """
+        for name in sorted(os.listdir(SCRIPT_DIR)):
+            with open(os.path.join(SCRIPT_DIR, name), encoding="utf-8") as f:
+                ast = Interpreter(f.read(), dont_init=True, cache=False).ast
+            loaded = loads(dumps(ast))
+            self.assertEqual(ast, loaded, name)
+            # Token和str比较时相等，repr不同
+            self.assertEqual(repr(ast), repr(loaded), name)
+
+    def test_program(self):
+        """
+        测试二进制程序
+        """
+        with open(os.path.join(SCRIPT_DIR, "simple.sam"), encoding="utf-8") as f:
+            i = Interpreter(f.read(), cache=False)
+        ast, pos_arg, option_arg = load_program(dump_program(i.ast, i.context.seq_args, i.context.option_args))
+        self.assertEqual(i.ast, ast)
+        self.assertEqual([("名字", "用户名"), ("剩余金额", "用户剩余金额")], pos_arg)
+        self.assertEqual([("测试", "t", None)], option_arg)
+        with self.assertRaises(SamoyedFormatError):
+            load_program(dumps([1, 2]))
+
+    def test_bad_data(self):
+        """
+        测试损坏的数据
+        """
+        data = dumps(Tree("start", ["hello"]))
+        with self.assertRaises(SamoyedFormatError):
+            loads(b"XXXX" + data[4:])
+        with self.assertRaises(SamoyedFormatError):
+            loads(data[:-2])
+        with self.assertRaises(SamoyedFormatError):
+            loads(data + b"N")
+
+
+class ASTCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = ASTCache(self.dir.name, salt=grammar_hash())
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_hit(self):
+        """
+        测试命中缓存
+        """
+        code = "x = $1\nstate main:\n    speak($名字)\n"
+        i = Interpreter(code, dont_init=True, cache=self.cache)
+        self.assertEqual(1, len(os.listdir(self.dir.name)))
+        cached = Interpreter(code, dont_init=True, cache=self.cache)
+        self.assertEqual(i.ast, cached.ast)
+        self.assertEqual({"$1", "$名字"}, cached.dollar_symbol)
+        self.assertIsNone(self.cache.get(code + "\n"))
+
+    def test_error_message(self):
+        """
+        测试从缓存读取的语法树和直接解析的出错信息相同
+        """
+        code = 'x = 1\nstate main:\n    y = x - "s" * x\n'
+        Interpreter(code, dont_init=True, cache=self.cache)
+        for mode in Interpreter.MODES:
+            messages = []
+            for cache in (False, self.cache):
+                i = Interpreter(code, cache=cache, mode=mode)
+                with self.assertRaises(SamoyedRuntimeError) as cm:
+                    i.exec()
+                messages.append(str(cm.exception))
+            self.assertIn("can not compute", messages[0])
+            self.assertEqual(messages[0], messages[1], mode)
+
+    def test_corrupted(self):
+        """
+        测试缓存文件损坏时当作未命中
+        """
+        code = "state main:\n    pass\n"
+        Interpreter(code, dont_init=True, cache=self.cache)
+        with open(self.cache.path(code), "wb") as f:
+            f.write(b"SAMY")
+        self.assertIsNone(self.cache.get(code))
+        self.assertEqual("statedef", Interpreter(code, dont_init=True, cache=self.cache).ast.children[0].data)
+
+    def test_evict(self):
+        """
+        测试超过上限时删除最久未使用的文件
+        """
+        codes = ["x = {}\n".format(i) for i in range(3)]
+        Interpreter(codes[0], dont_init=True, cache=self.cache)
+        size = os.path.getsize(self.cache.path(codes[0]))
+        self.cache.max_size = size * 2
+        for i, code in enumerate(codes):
+            Interpreter(code, dont_init=True, cache=self.cache)
+            # 保证修改时间不同
+            os.utime(self.cache.path(code), (time.time() + i, time.time() + i))
+        self.cache.evict()
+        self.assertIsNone(self.cache.get(codes[0]))
+        self.assertIsNotNone(self.cache.get(codes[1]))
+        self.assertIsNotNone(self.cache.get(codes[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
+import os
+import tempfile
 import unittest
+from samoyed import core
 from samoyed.core import Interpreter,SamoyedInterpretError
 import lark
 class GrammarTest(unittest.TestCase):
@@ -339,6 +342,33 @@ state hello:
         self.assertEqual("case_stmt", stmt.children[3].data)
         self.assertEqual("default_stmt", stmt.children[4].data)
         print("pass")
+
+    def test_parser_cache(self):
+        """
+        测试分析表缓存
+        """
+        print("[测试分析表缓存]", end=" ")
+        code = "state main:\n    x = 1 + 2\n"
+        expected = Interpreter(code, dont_init=True).ast
+        old_parser, old_env = core._parser, os.environ.get("SAMOYED_CACHE_DIR")
+        try:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                os.environ["SAMOYED_CACHE_DIR"] = cache_dir
+                for _ in range(2):
+                    # 第一次生成缓存，第二次读取缓存
+                    core._parser = None
+                    self.assertEqual(expected, Interpreter(code, dont_init=True, cache=False).ast)
+                    self.assertTrue(os.path.exists(
+                        os.path.join(cache_dir, "parser-{}.lark".format(core.grammar_hash()))))
+                self.assertIs(core.get_parser(), core.get_parser())
+        finally:
+            core._parser = old_parser
+            if old_env is None:
+                os.environ.pop("SAMOYED_CACHE_DIR", None)
+            else:
+                os.environ["SAMOYED_CACHE_DIR"] = old_env
+        print("pass")
+
 if __name__ == '__main__':
     unittest.main()
     print("通过grammar_test\n")
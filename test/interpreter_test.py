@@ -1,21 +1,45 @@
 """
 解释器测试
 """
+import re
+import time
 import unittest
 from functools import partial
 from operator import add, mul, sub, truediv, mod
 from queue import Queue
+import threading
 from threading import Thread
 from typing import Callable
 
 from lark import Tree
 
+from samoyed import vm
 from samoyed.core import Interpreter, Context, mock_add
+from samoyed.link import PATTERN_ATTR
+from samoyed.frame import DictFrame
 from samoyed.exception import *
+from samoyed.source import QueueSource
 from test.libs_test import mock_input
 
 
+LISTEN_SITE_CODE = """
+n = 0
+state main:
+    n = n + 1
+    match @(1)get(n):
+        "x" =>
+            speak("x")
+        silence =>
+            speak("silence")
+            if n < 3:
+                branch main
+"""
+
+
 class InterpreterTest(unittest.TestCase):
+    # 执行模式，子类会用其他模式重新执行所有测试
+    mode = "tree"
+
     def test_reduce(self):
         """
         测试reduce函数是否正确
@@ -37,7 +61,7 @@ class InterpreterTest(unittest.TestCase):
         测试计算表达式是否正确
         """
         # 哑解释器不需要内容，只需要计算即可
-        dumb_interpreter = Interpreter("\n", dont_init=True)
+        dumb_interpreter = Interpreter("\n", dont_init=True, mode=self.mode)
         context = Context()
         dumb_interpreter.context = context
         # 测试常量
@@ -164,7 +188,7 @@ class InterpreterTest(unittest.TestCase):
         """
         测试语句的执行
         """
-        dumb_interpreter = Interpreter("\n", dont_init=True)
+        dumb_interpreter = Interpreter("\n", dont_init=True, mode=self.mode)
         context = Context()
         dumb_interpreter.context = context
         dumb_interpreter.stage = dict()
@@ -277,7 +301,7 @@ else:
         :return:
         """
         # 建立哑解释器
-        dumb_interpreter = Interpreter("\n", dont_init=True)
+        dumb_interpreter = Interpreter("\n", dont_init=True, mode=self.mode)
         context = Context()
         dumb_interpreter.context = context
         # 重新绑定input函数
@@ -459,7 +483,7 @@ else:
         测试带正则表达式的匹配
         """
         # 建立哑解释器
-        dumb_interpreter = Interpreter("\n", dont_init=True)
+        dumb_interpreter = Interpreter("\n", dont_init=True, mode=self.mode)
         context = Context()
         dumb_interpreter.context = context
         # 重新绑定input函数
@@ -544,6 +568,312 @@ else:
         thread.join()
         print("pass")
 
+    def test_link(self):
+        """
+        测试初始化时链接跳转目标
+        """
+        print("[测试链接]", end=" ")
+        # 跳转到不存在的状态，即使不会执行也在加载时报错
+        with self.assertRaises(SamoyedNameError):
+            Interpreter("state main:\n    if false:\n        branch nowhere\n", mode=self.mode, cache=False)
+
+        code = """
+state main:
+    match x:
+        1 =>
+            branch a
+    branch b
+state a:
+    pass
+state b:
+    pass
+"""
+        i = Interpreter(code, dont_init=True, mode=self.mode, cache=False)
+        i.context.names["x"] = 1
+        i.init()
+        self.assertIs(i.entrance, i.context.stage)
+        self.assertEqual({"main", "a", "b"}, set(i.stage))
+        # 执行main中的语句后，下一个状态直接是链接好的State
+        for stat in i.entrance.body:
+            i.exec_statement(stat)
+        self.assertIs(i.stage["b"], i.context.next)
+        i.context.next = None
+        i.exec()
+        self.assertEqual("b", i.context.stage.name)
+        print("pass")
+
+    def test_frame(self):
+        """
+        测试按下标保存的变量，以及names的字典视图
+        """
+        print("[测试变量存储]", end=" ")
+        code = """
+x = 1
+state main:
+    y = x + z
+    match "投诉ab":
+        /(a)(b)/ =>
+            pass
+    speak(y)
+"""
+        i = Interpreter(code, dont_init=True, mode=self.mode, cache=False)
+        symbols = i.symbols
+        # 程序中出现的名字在加载时就分配好了下标，branch目标和状态名不在其中
+        for name in ("x", "y", "z", "speak", "$mg0", "$mg2"):
+            self.assertIn(name, symbols.index)
+        self.assertNotIn("main", symbols.index)
+        if self.mode == "tree":
+            # 树遍历模式按名字保存变量
+            self.assertIsInstance(i.context.frame, DictFrame)
+        else:
+            self.assertIs(i.context.frame.symbols, symbols)
+
+        output = []
+        i.context.names["z"] = 2
+        i.context.names["speak"] = output.append
+        # 外部传入的新名字只保存在这个会话中，共享的符号表不变
+        size = len(symbols)
+        i.context.names["extra"] = "e"
+        self.assertEqual(size, len(symbols))
+        self.assertNotIn("extra", symbols.index)
+        self.assertIsNone(Interpreter(code, dont_init=True, mode=self.mode, cache=False).context.names.get("extra"))
+        i.init()
+        i.exec()
+        self.assertEqual([3], output)
+
+        names = i.context.names
+        self.assertEqual(3, names["y"])
+        self.assertEqual("e", names.get("extra"))
+        self.assertNotIn("$mg1", names)
+        self.assertIsNone(names.get("undefined"))
+        with self.assertRaises(KeyError):
+            _ = names["undefined"]
+        del names["y"]
+        self.assertNotIn("y", names)
+        with self.assertRaises(KeyError):
+            del names["y"]
+        # eval得到的是一个普通的字典
+        copied = names.copy()
+        self.assertIsInstance(copied, dict)
+        self.assertEqual({"x": 1, "z": 2, "extra": "e"}, {k: copied[k] for k in ("x", "z", "extra")})
+
+        # 给names赋值会清空原有的变量
+        i.context.names = {"a": 1}
+        self.assertEqual({"a": 1}, dict(i.context.names))
+        # 换一个符号表时保留所有的值，数组对象不变
+        context = Context()
+        context.names["b"] = 2
+        context.names["x"] = 1
+        context.use_symbols(symbols)
+        self.assertIs(symbols, context.frame.symbols)
+        self.assertEqual({"b": 2, "x": 1}, {k: context.names[k] for k in ("b", "x")})
+        self.assertEqual({"b": 2}, context.frame.extra)
+        slots = context.frame.slots
+        context.use_symbols(symbols)
+        self.assertIs(slots, context.frame.slots)
+        del context.names["b"]
+        self.assertNotIn("b", context.names)
+        print("pass")
+
+
+    def test_compile_patterns(self):
+        """
+        测试加载时编译正则字面量
+        """
+        print("[测试预编译正则表达式]", end=" ")
+        code = """
+state main:
+    match @(1,0)listen():
+        /投诉(.*)/ =>
+            speak($mg1)
+        /([a-z]+)/ =>
+            speak("字母" + $mg1)
+"""
+        i = Interpreter(code, mode=self.mode, cache=False)
+        regs = list(i.ast.find_data("reg"))
+        self.assertEqual(2, len(regs))
+        for reg in regs:
+            pattern = getattr(reg, PATTERN_ATTR)
+            self.assertEqual(reg.children[0].value, pattern.pattern)
+            # 求值时直接返回编译好的对象
+            self.assertIs(pattern, i.get_expression(reg))
+
+        output = []
+        i.context.names["listen"] = lambda: "abc"
+        i.context.names["speak"] = output.append
+        i.exec()
+        self.assertEqual(["字母abc"], output)
+
+        # 错误的正则表达式仍然在求值时报错
+        i = Interpreter("state main:\n    match \"x\":\n        /(/ =>\n            pass\n", mode=self.mode,
+                        cache=False)
+        with self.assertRaises(re.error):
+            i.exec()
+        print("pass")
+
+    def test_match_empty_input(self):
+        """
+        测试与空输入匹配的case不需要等待输入
+        """
+        print("[测试与空输入匹配]", end=" ")
+        code = """
+state main:
+    match @({})listen():
+        "账单" =>
+            speak("账单")
+        /^.*$/ =>
+            speak("任意")
+        silence =>
+            speak("超时")
+"""
+        for times, least, most in (("3", 0, 1), ("3,1", 1, 2.5)):
+            i = Interpreter(code.format(times), mode=self.mode, cache=False)
+            output = []
+            # 一直没有输入
+            i.context.names["listen"] = QueueSource(Queue())
+            i.context.names["speak"] = output.append
+            start = time.time()
+            i.exec()
+            self.assertGreaterEqual(time.time() - start, least)
+            self.assertLess(time.time() - start, most)
+            self.assertEqual(["任意"], output)
+        print("pass")
+
+    def test_listen_site(self):
+        """
+        测试同一个match复用输入函数的调用，没有结束的调用留给下一次
+        """
+        print("[测试match复用输入源]", end=" ")
+        i = Interpreter(LISTEN_SITE_CODE, dont_init=True, mode=self.mode, cache=False)
+        output, calls, q = [], [], Queue()
+        # 每次执行match都会绑定新的参数
+        i.context.names["get"] = lambda n: calls.append(n) or q.get()
+        i.context.names["speak"] = output.append
+        i.init()
+        threading.Timer(1.3, q.put, ("x",)).start()
+        i.exec()
+        self.assertEqual(["silence", "x"], output)
+        self.assertEqual([1], calls)
+        self.assertEqual({}, i.context.input_sources)
+        print("pass")
+
+
+class ClosureInterpreterTest(InterpreterTest):
+    """
+    用closure模式执行同样的测试
+    """
+    mode = "closure"
+
+    def test_same_exception(self):
+        """
+        测试编译结果和树遍历的结果、异常一致
+        """
+        codes = ['1 + 2 * 3 - 4 / 2', '"a" + 1 + 2.5', '1 > 2 ? "x" : "y"', 'not (1 == 1) or 2 and 0',
+                 '-x', '-"s"', 'x + "s" * y', '1 / 0', '"a" < 1', 'f(1, 2)', 'undefined_var', 'undefined()',
+                 '(1 or "s")', 'x // 0 + f(1)']
+        for code in codes:
+            results = []
+            for mode in ("tree", "closure"):
+                i = Interpreter("{}\n".format(code), dont_init=True, mode=mode, cache=False)
+                i.context = Context(names={"x": 3, "y": 2, "f": lambda a, b: a * b})
+                try:
+                    results.append(("value", i.get_expression(i.ast.children[0].children[0])))
+                except BaseException as e:
+                    results.append((type(e), str(e)))
+            self.assertEqual(results[0], results[1], code)
+
+    def test_token_closure(self):
+        """
+        测试常量和变量的编译结果被重复使用
+        """
+        print("[测试终结符的编译缓存]", end=" ")
+        code = 'x = 1\nstate main:\n    y = x\n    match y:\n        "a" =>\n            pass\n'
+        i = Interpreter(code, mode=self.mode, cache=False)
+        # 赋值的右边(常量1和变量x)、case的值("a")
+        values = [i.ast.children[0].children[0].children[2], next(i.ast.find_data("case_stmt")).children[0]]
+        x = [token for token in i.ast.scan_values(lambda v: v == "x")]
+        self.assertEqual([1, "a"], values)
+        self.assertEqual(2, len(x))
+        for value in values + x:
+            self.assertIs(i.compiler.compile(value, i.symbols), i.compiler.compile(value, i.symbols), value)
+        # 同一棵语法树的其他解释器共享编译结果，值相同的终结符也是
+        other = Interpreter(i.ast, mode=self.mode)
+        self.assertIs(i.compiler.compile(x[0], i.symbols), i.compiler.compile(x[1], other.symbols))
+        # 类型不同的常量不会共用
+        self.assertIs(True, i.compiler.compile(True, i.symbols)(i.context))
+        self.assertEqual(1, i.get_expression(x[0]))
+        print("pass")
+
+
+class VMInterpreterTest(InterpreterTest):
+    """
+    用vm模式执行同样的测试
+    """
+    mode = "vm"
+
+    def run_script(self, code: str, mode: str) -> list:
+        """
+        执行脚本，返回speak的内容
+        """
+        output = []
+        i = Interpreter(code, dont_init=True, mode=mode, cache=False)
+        i.context.names["speak"] = output.append
+        i.init()
+        try:
+            i.exec()
+        except SystemExit:
+            output.append("<exit>")
+        return output
+
+    def test_same_result(self):
+        """
+        测试虚拟机和树遍历的执行结果一致
+        """
+        code = """
+cnt = 0
+state main:
+    speak("main")
+    if cnt > 1:
+        exit()
+    match cnt:
+        0 =>
+            speak("zero")
+            branch a
+            speak("after branch in case")
+        default =>
+            branch b
+            speak("never")
+    if cnt == 0:
+        if true:
+            branch a
+            speak("never")
+        speak("never")
+    speak("after if")
+state a:
+    speak("a")
+    cnt = cnt + 1
+    branch main
+state b:
+    speak("b" + cnt)
+    cnt = cnt + 1
+    branch main
+    speak("still in b")
+"""
+        expected = self.run_script(code, "tree")
+        self.assertEqual(["main", "zero", "after branch in case", "after if", "a", "main", "after if", "b1",
+                          "still in b", "main", "<exit>"], expected)
+        self.assertEqual(expected, self.run_script(code, "vm"))
+
+    def test_disassemble(self):
+        """
+        测试指令序列
+        """
+        i = Interpreter("state main:\n    if x:\n        branch a\n    else:\n        y = 1\n",
+                        dont_init=True, mode=self.mode, cache=False)
+        code = i.bytecode.compile_state(i.ast.children[0], i.symbols)
+        self.assertEqual(["JUMP_IF_FALSE", "BRANCH", "JUMP", "ASSIGN", "RETURN_IF_EXIT"],
+                         [line.split()[1] for line in vm.disassemble(code).splitlines()])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,8 +1,10 @@
 import multiprocessing
+import queue
 import unittest
 import os
 
 from samoyed.libs import *
+from samoyed.source import FileSource, QueueSource
 
 
 def mock_input(q: multiprocessing.Queue, plan: dict) -> None:
@@ -156,6 +158,92 @@ class TimeControlTest(unittest.TestCase):
         timer_pre.join()
         timer_after.cancel()
 
+    def test_intervals(self):
+        """
+        测试timeout_interval和sleep_interval
+        """
+        print("[测试TimeControl的间隔参数]", end=" ")
+        # timeout_interval: 没有输入时也定期返回None
+        q = queue.Queue()
+        calls = []
+        t = TimeControl(lambda: calls.append(1) or q.get(), 0.5, timeout_interval=0.1)
+        results = list(t())
+        self.assertTrue(4 <= len(results) <= 6)
+        self.assertEqual({None}, set(results))
+        # 默认只在到期时返回
+        t.timeout_interval = None
+        t.max_wait = 0.3
+        self.assertEqual([None], list(t()))
+        # 再次调用时复用没有结束的调用，不会留下阻塞的线程
+        q.put("x")
+        start = time.monotonic()
+        self.assertEqual("x", next(t()))
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertEqual(1, len(calls))
+
+        # sleep_interval: 函数没有返回内容时，再次调用前等待的时间
+        calls = []
+        t = TimeControl(lambda: calls.append(1), 0.5, sleep_interval=0.2)
+        list(t())
+        self.assertTrue(2 <= len(calls) <= 4)
+        print("pass")
+
+    def test_cancel_from_thread(self):
+        """
+        测试在其他线程中撤销等待输入的TimeControl
+        """
+        print("[测试从其他线程撤销]", end=" ")
+        r, w = os.pipe()
+        try:
+            t = TimeControl(FileSource(r), 5)
+            threading.Timer(0.1, t.cancel).start()
+            start = time.monotonic()
+            self.assertEqual([], list(t()))
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertFalse(t.timeout.is_set())
+        finally:
+            os.close(r)
+            os.close(w)
+        print("pass")
+
+    def test_deadlines(self):
+        """
+        测试按截止时间置位can_exit和timeout，不创建计时线程
+        """
+        print("[测试TimeControl计时]", end=" ")
+        q = queue.Queue()
+        for _ in range(50):
+            q.put("x")
+        controls = [TimeControl(QueueSource(q), 0.3, 0.1) for _ in range(50)]
+        before = threading.active_count()
+        generators = [control() for control in controls]
+        for control, g in zip(controls, generators):
+            self.assertEqual("x", next(g))
+            # 还没有到min_wait
+            self.assertFalse(control.can_exit.is_set())
+        self.assertEqual(before, threading.active_count())
+        start = time.monotonic()
+        for control, g in zip(controls, generators):
+            # 后面的match的截止时间已经过了，只会再产生一次结果
+            self.assertIn(list(g), ([None, None], [None]))
+            self.assertTrue(control.can_exit.is_set())
+            self.assertTrue(control.timeout.is_set())
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(before, threading.active_count())
+
+        # 输入结束之后等待计时时也可以撤销
+        r, w = os.pipe()
+        os.close(w)
+        try:
+            t = TimeControl(FileSource(r), 5)
+            threading.Timer(0.1, t.cancel).start()
+            start = time.monotonic()
+            self.assertEqual([], list(t()))
+            self.assertLess(time.monotonic() - start, 1)
+        finally:
+            os.close(r)
+        print("pass")
+
     def test_sqlite_function(self):
         """
         测试内置sqlite3函数
@@ -176,6 +264,27 @@ class TimeControlTest(unittest.TestCase):
             if os.path.exists("./a.db"):
                 os.remove("./a.db")
 
+    def test_compile_regex(self):
+        """
+        测试正则表达式缓存
+        """
+        print("[测试正则表达式缓存]", end="")
+        compile_regex.cache_clear()
+        pattern = compile_regex("投诉(.*)")
+        self.assertIs(pattern, compile_regex("投诉(.*)"))
+        self.assertEqual("网络", pattern.match("投诉网络").group(1))
+        # 错误的正则表达式每次都报错，不会被缓存
+        for _ in range(2):
+            with self.assertRaises(re.error):
+                compile_regex("(")
+        # 缓存有上限，最久没有使用的会被挤出
+        for i in range(REGEX_CACHE_SIZE):
+            compile_regex("p{}".format(i))
+        self.assertEqual(REGEX_CACHE_SIZE, compile_regex.cache_info().currsize)
+        self.assertIsNot(pattern, compile_regex("投诉(.*)"))
+        print("pass")
+
+
 if __name__ == '__main__':
     unittest.main()
     print("通过libs_test\n")
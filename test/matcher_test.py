@@ -0,0 +1,124 @@
+"""
+多模式匹配测试
+"""
+import random
+import re
+import unittest
+
+from samoyed.core import Interpreter
+from samoyed.matcher import CaseMatcher, KeywordMatcher, MIN_KEYWORDS
+
+
+def match_one_by_one(text: str, cases: list):
+    """
+    逐个匹配，作为对照
+    """
+    for i, case in enumerate(cases):
+        is_matched, result = Interpreter._match_value(text, case)
+        if is_matched:
+            return i, result
+    return None, None
+
+
+class MatcherTest(unittest.TestCase):
+
+    def test_keyword_matcher(self):
+        """
+        测试自动机
+        """
+        print("[测试关键字自动机]", end=" ")
+        matcher = KeywordMatcher(((0, "he"), (1, "she"), (2, "his"), (3, "hers"), (4, "账单")))
+        # ushers中同时出现了she、he和hers
+        self.assertEqual(0, matcher.search("ushers"))
+        self.assertEqual(2, matcher.search("this"))
+        self.assertEqual(1, KeywordMatcher(((1, "she"), (3, "hers"))).search("ushers"))
+        self.assertEqual(3, KeywordMatcher(((3, "hers"), (5, "s"))).search("hhers"))
+        self.assertEqual(4, matcher.search("查一下账单"))
+        self.assertIsNone(matcher.search("账 单"))
+        self.assertIsNone(matcher.search(""))
+        # 声明顺序靠前的case优先，而不是在输入中先出现的
+        matcher = KeywordMatcher(((0, "单"), (1, "账")))
+        self.assertEqual(0, matcher.search("账单"))
+        # 空字符串总是匹配
+        self.assertEqual(1, KeywordMatcher(((2, "a"), (1, ""))).search("x"))
+        # 相同的关键字只会构造一次自动机
+        keywords = ((0, "a"), (1, "b"))
+        self.assertIs(KeywordMatcher.of(keywords), KeywordMatcher.of(keywords))
+        print("pass")
+
+    def test_case_matcher(self):
+        """
+        测试混合字符串、正则表达式和其他值的case，结果与逐个匹配一致
+        """
+        print("[测试case匹配]", end=" ")
+        keywords = ["关键字{}".format(i) for i in range(MIN_KEYWORDS * 2)]
+        cases = [1, None] + keywords[:3] + [re.compile("投诉(.*)")] + keywords[3:]
+        matcher = CaseMatcher(cases, Interpreter._match_value)
+        self.assertIsNotNone(matcher.keywords)
+        for text in ["", "关键字1", "投诉关键字1", "关键字1投诉", "...关键字15", "关键字", "投诉网络"]:
+            index, result = matcher.match(text)
+            expected_index, expected_result = match_one_by_one(text, cases)
+            self.assertEqual(expected_index, index, text)
+            if expected_result is not None:
+                self.assertEqual(expected_result.groups(), result.groups())
+
+        # case很少时逐个匹配
+        self.assertIsNone(CaseMatcher(["a", "b"], Interpreter._match_value).keywords)
+
+        random.seed(0)
+        alphabet = "ab账单"
+        for _ in range(2000):
+            cases = []
+            for _ in range(random.randint(0, MIN_KEYWORDS * 3)):
+                kind = random.random()
+                if kind < 0.8:
+                    cases.append("".join(random.choice(alphabet) for _ in range(random.randint(0, 4))))
+                elif kind < 0.9:
+                    cases.append(re.compile(random.choice(["a(b)", "b+", "账"])))
+                else:
+                    cases.append(random.choice([1, None, True]))
+            text = "".join(random.choice(alphabet) for _ in range(random.randint(0, 12)))
+            self.assertEqual(match_one_by_one(text, cases)[0], CaseMatcher(cases, Interpreter._match_value).match(text)[0])
+        print("pass")
+
+    def test_feed(self):
+        """
+        测试分段输入：每次只扫描新的输入，结果与对全部输入逐个匹配一致
+        """
+        print("[测试分段输入]", end=" ")
+        for keywords in (["账单", "话费"], ["关键字{}".format(i) for i in range(MIN_KEYWORDS * 2)]):
+            cases = keywords + [re.compile("投诉(.*)")]
+            matcher = CaseMatcher(cases, Interpreter._match_value)
+            self.assertEqual((None, None), matcher.feed(""))
+            # 关键字跨越两次输入
+            self.assertEqual((None, None), matcher.feed("查询" + keywords[1][:1]))
+            self.assertEqual((1, None), matcher.feed(keywords[1][1:]))
+            # 已经找到的结果不会丢失，但排在前面的case仍然可以匹配
+            self.assertEqual((1, None), matcher.feed("。"))
+            self.assertEqual((0, None), matcher.feed(keywords[0]))
+
+            # 正则表达式对全部输入匹配
+            matcher.reset()
+            matcher.feed("投诉")
+            index, result = matcher.feed("网络")
+            self.assertEqual(len(keywords), index)
+            self.assertEqual("网络", result.group(1))
+
+        random.seed(1)
+        alphabet = "ab账单"
+        for _ in range(1000):
+            cases = [re.compile("a(.*)b$") if random.random() < 0.1 else
+                     "".join(random.choice(alphabet) for _ in range(random.randint(0, 4)))
+                     for _ in range(random.randint(0, MIN_KEYWORDS * 3))]
+            matcher = CaseMatcher(cases, Interpreter._match_value)
+            text = ""
+            self.assertEqual(match_one_by_one(text, cases)[0], matcher.feed(text)[0])
+            for _ in range(random.randint(0, 6)):
+                chunk = "".join(random.choice(alphabet) for _ in range(random.randint(0, 4)))
+                text += chunk
+                self.assertEqual(match_one_by_one(text, cases)[0], matcher.feed(chunk)[0])
+        print("pass")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import asyncio
+import io
+import os
+import queue
+import select
+import subprocess
+import sys
+import unittest
+from contextlib import redirect_stdout
+
+from samoyed.aio import AsyncInterpreter
+from samoyed.core import Interpreter
+from samoyed.output import *
+from samoyed.session import Session
+from samoyed.source import QueueSource
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TURN_CODE = """
+state main:
+    speak("您好")
+    speak("请问有什么可以帮您")
+    match @(5)listen():
+        "账单" =>
+            speak("您的本月账单是", 100, "元")
+            speak("再见")
+"""
+
+
+class CountingIO(io.StringIO):
+    """
+    记录每次write的内容
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, s):
+        self.writes.append(s)
+        return super().write(s)
+
+
+class OutputTest(unittest.TestCase):
+
+    def test_sink(self):
+        """
+        测试输出的累积和交出
+        """
+        print("[测试OutputSink]", end=" ")
+        emitted = []
+        sink = OutputSink(emitted.append)
+        sink("你好", 1)
+        sink.write("再见")
+        self.assertEqual([], emitted)
+        self.assertEqual(["你好 1", "再见"], sink.flush())
+        self.assertEqual([["你好 1", "再见"]], emitted)
+        # 没有输出时不交出
+        self.assertEqual([], sink.flush())
+        self.assertEqual(1, len(emitted))
+
+        stream = CountingIO()
+        sink = StreamSink(stream)
+        sink("a")
+        sink("b")
+        sink.flush()
+        self.assertEqual(["a\nb\n"], stream.writes)
+        # 默认写入flush时的标准输出
+        sink = StreamSink()
+        sink("c")
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            sink.flush()
+        self.assertEqual("c\n", stdout.getvalue())
+        print("pass")
+
+    def test_flush_on_input(self):
+        """
+        测试等待输入之前和结束时各写入一次
+        """
+        print("[测试输出在输入时写入]", end=" ")
+        for mode in Interpreter.MODES:
+            i = Interpreter(TURN_CODE, mode=mode)
+            stream = CountingIO()
+            i.context.output.stream = stream
+            q = queue.Queue()
+            q.put("账单")
+            seen = []
+
+            def listen():
+                seen.append(list(stream.writes))
+                return q.get()
+
+            i.context.names["listen"] = listen
+            i.exec()
+            # 等待输入时前两句已经一次写入
+            self.assertEqual(["您好\n请问有什么可以帮您\n"], seen[0])
+            self.assertEqual(["您好\n请问有什么可以帮您\n", "您的本月账单是 100 元\n再见\n"], stream.writes)
+
+        # 默认的listen在读取之前写入
+        i = Interpreter('state main:\n    speak("a")\n    speak("b")\n    x = listen()\n', mode="closure")
+        stream = CountingIO()
+        i.context.output.stream = stream
+        q = queue.Queue()
+        q.put("x")
+        seen = []
+        i.context.names["listen"].source = lambda: seen.append(list(stream.writes)) or QueueSource(q)
+        i.exec()
+        self.assertEqual([["a\nb\n"]], seen)
+        self.assertEqual("x", i.context.names["x"])
+        print("pass")
+
+    def test_async(self):
+        """
+        测试异步解释器的输出
+        """
+        print("[测试异步解释器的输出]", end=" ")
+        i = AsyncInterpreter(TURN_CODE, mode="closure")
+        stream = CountingIO()
+        i.context.output.stream = stream
+        seen = []
+
+        async def listen():
+            seen.append(list(stream.writes))
+            return "账单"
+
+        i.context.names["listen"] = listen
+        asyncio.run(i.exec())
+        self.assertEqual([["您好\n请问有什么可以帮您\n"]], seen)
+        self.assertEqual(2, len(stream.writes))
+        print("pass")
+
+    def test_session_output(self):
+        """
+        测试会话的输出
+        """
+        print("[测试会话的输出]", end=" ")
+        emitted = []
+        session = Session(TURN_CODE, output=OutputSink(emitted.append))
+        reply = session.start()
+        self.assertEqual(["您好", "请问有什么可以帮您"], reply.outputs)
+        reply = session.feed("账单")
+        self.assertEqual(["您的本月账单是 100 元", "再见"], reply.outputs)
+        self.assertTrue(reply.finished)
+        self.assertEqual([["您好", "请问有什么可以帮您"], ["您的本月账单是 100 元", "再见"]], emitted)
+        print("pass")
+
+    def test_pipe(self):
+        """
+        测试输出到管道时，不设置PYTHONUNBUFFERED也能在等待输入之前收到输出
+        """
+        print("[测试输出到管道]", end=" ")
+        env = dict(os.environ)
+        env.pop("PYTHONUNBUFFERED", None)
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "samc"), "run",
+                                 os.path.join(ROOT, "test", "script", "example.sam")],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+        try:
+            ready, _, _ = select.select([proc.stdout], [], [], 10)
+            self.assertTrue(ready)
+            self.assertEqual(b"hello\n", proc.stdout.readline())
+            proc.stdin.write(b"hello\n")
+            proc.stdin.close()
+            self.assertEqual(b"hello world\n", proc.stdout.readline())
+        finally:
+            proc.kill()
+            proc.wait()
+            proc.stdout.close()
+        print("pass")
+
+
+if __name__ == '__main__':
+    unittest.main()
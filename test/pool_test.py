@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from samoyed.core import Interpreter
+from samoyed.exception import SamoyedRuntimeError
+from samoyed.libs import sqlite, sqlite_close, sqlite_connect
+from samoyed.pool import *
+
+CODE = """
+state main:
+    cursor = sqlite_connect("{db}")
+    again = sqlite_connect("{db}")
+    sqlite(cursor, "INSERT INTO T(A,B) VALUES ({n},{n});")
+    result = sqlite(again, "SELECT COUNT(*) FROM T;")
+    speak(eval("result[0][0]"))
+"""
+
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.workdir.name, "pool.db")
+        conn = sqlite3.connect(self.db)
+        conn.execute("CREATE TABLE T(A INT PRIMARY KEY,B INT);")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_reuse(self):
+        """
+        测试连接放回之后被重复使用
+        """
+        print("[测试连接池复用连接]", end=" ")
+        pool = ConnectionPool(self.db, size=2)
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO T(A,B) VALUES (1,2);")
+            # 没有提交的事务在放回时回滚
+        with pool.connection() as again:
+            self.assertIs(conn, again)
+            self.assertEqual([], again.execute("SELECT * FROM T;").fetchall())
+        self.assertEqual({"idle": 1, "in_use": 0, "opened": 1, "discarded": 0, "waits": 0}, pool.stats())
+        pool.close()
+        self.assertEqual(1, pool.stats()["discarded"])
+        with self.assertRaises(SamoyedRuntimeError):
+            pool.acquire()
+        print("pass")
+
+    def test_size(self):
+        """
+        测试连接数的上限和等待
+        """
+        print("[测试连接池的大小]", end=" ")
+        pool = ConnectionPool(self.db, size=1, timeout=0.1)
+        conn = pool.acquire()
+        with self.assertRaises(SamoyedRuntimeError):
+            pool.acquire()
+        # 另一个线程放回之后取得连接
+        threading.Timer(0.1, pool.release, (conn,)).start()
+        pool.timeout = 5
+        self.assertIs(conn, pool.acquire())
+        self.assertEqual(2, pool.stats()["waits"])
+        pool.release(conn)
+        pool.close()
+        print("pass")
+
+    def test_threads(self):
+        """
+        测试多个线程同时使用，连接可以在线程之间传递
+        """
+        print("[测试多线程使用连接池]", end=" ")
+        pool = ConnectionPool(self.db, size=3)
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(20):
+                    with pool.connection() as conn:
+                        conn.execute("INSERT INTO T(A,B) VALUES (?,?);", (n * 100 + i, n))
+                        conn.commit()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        with pool.connection() as conn:
+            self.assertEqual(160, conn.execute("SELECT COUNT(*) FROM T;").fetchone()[0])
+        self.assertLessEqual(pool.stats()["opened"], 3)
+        pool.close()
+        print("pass")
+
+    def test_health_check(self):
+        """
+        测试数据库文件被替换和连接不可用时重新打开
+        """
+        print("[测试连接的检查]", end=" ")
+        pool = ConnectionPool(self.db, size=2)
+        with pool.connection() as conn:
+            pass
+        os.remove(self.db)
+        fresh = sqlite3.connect(self.db)
+        fresh.execute("CREATE TABLE U(X INT);")
+        fresh.commit()
+        fresh.close()
+        with pool.connection() as again:
+            self.assertIsNot(conn, again)
+            again.execute("SELECT * FROM U;")
+        # 空闲超过check_interval时执行SELECT 1，失败时丢弃
+        pool.check_interval = 0
+        again.close()
+        with pool.connection() as third:
+            self.assertIsNot(again, third)
+            third.execute("SELECT * FROM U;")
+        self.assertEqual(2, pool.stats()["discarded"])
+        pool.close()
+        print("pass")
+
+    def test_configure(self):
+        """
+        测试修改参数时唤醒等待的线程，检查连接时不持有锁
+        """
+        print("[测试修改连接池的参数]", end=" ")
+        registry = Pools(size=1, timeout=5)
+        pool = registry.get(self.db)
+        conn = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        waiter.start()
+        while pool.stats()["waits"] == 0:
+            time.sleep(0.01)
+        # 增大size之后等待的线程立即取得新的连接，不用等到timeout
+        registry.configure(size=2)
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        self.assertIsNot(conn, acquired[0])
+        pool.release(acquired[0])
+
+        # 检查空闲的连接时，其他线程可以使用连接池
+        blocked = []
+        original = pool._healthy
+
+        def healthy(entry):
+            thread = threading.Thread(target=pool.stats)
+            thread.start()
+            thread.join(1)
+            blocked.append(thread.is_alive())
+            return original(entry)
+
+        pool._healthy = healthy
+        with pool.connection():
+            pass
+        self.assertEqual([False], blocked)
+
+        # 缩小size时关闭多出的空闲连接
+        pool.release(conn)
+        self.assertEqual(2, pool.stats()["idle"])
+        registry.configure(size=1)
+        self.assertEqual({"idle": 1, "in_use": 0, "opened": 2, "discarded": 1, "waits": 1}, pool.stats())
+        registry.close()
+        print("pass")
+
+    def test_builtins(self):
+        """
+        测试内置函数使用共享的连接池，对话结束时释放
+        """
+        print("[测试sqlite内置函数使用连接池]", end=" ")
+        registry = Pools()
+        d = {}
+        database = sqlite_connect(d, self.db)
+        self.assertIs(database, sqlite_connect(d, self.db))
+        sqlite(d, database, "INSERT INTO T(A,B) VALUES (1,2);")
+        self.assertEqual([(1, 2)], sqlite(d, database, "SELECT * FROM T;"))
+        # 出错时返回空列表，连接仍然放回
+        self.assertEqual([], sqlite(d, database, "SELECT * FROM NOPE;"))
+        self.assertEqual(0, database.pool.stats()["in_use"])
+        sqlite_close(d)
+        self.assertEqual({}, d)
+
+        # 内存数据库不放入连接池，关闭之后是一个新的数据库
+        memory = Database(":memory:", registry)
+        self.assertIsNone(memory.pool)
+        memory.execute("CREATE TABLE M(X INT);")
+        memory.execute("INSERT INTO M VALUES (1);")
+        self.assertEqual([(1,)], memory.execute("SELECT * FROM M;"))
+        memory.close()
+        with self.assertRaises(sqlite3.OperationalError):
+            memory.execute("SELECT * FROM M;")
+        memory.close()
+        self.assertEqual(0, len(registry))
+
+        # 两个对话共享同一个连接池
+        for mode in Interpreter.MODES:
+            for n in (10, 11):
+                i = Interpreter(CODE.format(db=self.db, n=n), mode=mode)
+                outputs = []
+                i.context.output.emit = outputs.append
+                i.exec()
+                self.assertEqual({}, i.context.conn2curosr)
+                self.assertEqual([[str(n - 8)]], outputs)
+            sqlite_connect(d, self.db).execute("DELETE FROM T WHERE A>=10;")
+        stats = pools.get(self.db).stats()
+        self.assertEqual(0, stats["in_use"])
+        self.assertEqual(1, stats["opened"])
+        print("pass")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,8 +17,9 @@ from typing import Callable, Tuple
 
 class MockTerminal:
 
-    def __init__(self, filename, *args):
+    def __init__(self, filename, *args, emit="program"):
         self.arg = args
+        self.emit = emit
         self.command = [sys.executable, "tmp.py", *args]
         self.fd = os.open("/tmp/test_pipe", os.O_RDWR | os.O_NONBLOCK)
         self.filename = filename
@@ -35,7 +36,7 @@ class MockTerminal:
 
     def compile(self, file, output="tmp.py"):
         samc = "{}/samc".format("/".join(__file__.split("/")[:-2]))
-        command = [sys.executable, samc, "gen", file, "-o", output]
+        command = [sys.executable, samc, "gen", file, "-o", output, "--emit", self.emit]
         subprocess.run(command)
 
     def clean_compile(self, output="tmp.py"):
@@ -44,6 +45,9 @@ class MockTerminal:
 
 
 class ScriptTest(unittest.TestCase):
+    # samc gen的输出格式
+    emit = "program"
+
     @classmethod
     def setUpClass(cls):
         warnings.simplefilter("ignore")
@@ -54,7 +58,7 @@ class ScriptTest(unittest.TestCase):
         """
         print("[测试print.sam] ", end="")
         path = "{}/script/print.sam".format("/".join(__file__.split("/")[:-1]))
-        with MockTerminal(path) as (_, proc):
+        with MockTerminal(path, emit=self.emit) as (_, proc):
             proc.wait()
             result = proc.stdout.read()
         self.assertEqual(result.replace("\n", ""), "mainabmain")
@@ -67,14 +71,14 @@ class ScriptTest(unittest.TestCase):
         path = "{}/script/example.sam".format("/".join(__file__.split("/")[:-1]))
         print("[example脚本测试]")
         print("    [发送hello]",end='')
-        with MockTerminal(path) as (write, proc):
+        with MockTerminal(path, emit=self.emit) as (write, proc):
             write("hello\n")
             proc.wait()
             result = proc.stdout.read()
         self.assertTrue(str(result).find("hello world")!=-1)
         print("pass")
         print("    [不发送]",end='')
-        with MockTerminal(path) as (write, proc):
+        with MockTerminal(path, emit=self.emit) as (write, proc):
             proc.wait()
             result = proc.stdout.read()
         self.assertTrue(str(result).find("超时") != -1)
@@ -105,35 +109,35 @@ class ScriptTest(unittest.TestCase):
             print("[数据库脚本测试]")
             print("   [测试'3月账单']", end='')
             path = "{}/script/database.sam".format("/".join(__file__.split("/")[:-1]))
-            with MockTerminal(path, "ruiqurm") as (write, proc):
+            with MockTerminal(path, "ruiqurm", emit=self.emit) as (write, proc):
                 write("3月账单\n")
                 proc.wait()
                 result = proc.stdout.read()
             self.assertTrue(str(result).find("300") != -1)
 
             print("pass\n   [测试'4月账单']", end='')
-            with MockTerminal(path, "ruiqurm") as (write, proc):
+            with MockTerminal(path, "ruiqurm", emit=self.emit) as (write, proc):
                 write("4月账单\n")
                 proc.wait()
                 result = proc.stdout.read()
             self.assertTrue(str(result).find("400") != -1)
 
             print("pass\n   [测试'5月账单']", end='')
-            with MockTerminal(path, "ruiqurm") as (write, proc):
+            with MockTerminal(path, "ruiqurm", emit=self.emit) as (write, proc):
                 write("5月账单\n")
                 proc.wait()
                 result = proc.stdout.read()
             self.assertTrue(str(result).find("没有找到") != -1)
 
             print("pass\n   [测试'查询a的id']", end='')
-            with MockTerminal(path, "a") as (write, proc):
+            with MockTerminal(path, "a", emit=self.emit) as (write, proc):
                 write("id\n")
                 proc.wait()
                 result = proc.stdout.read()
             self.assertTrue(str(result).find("2") != -1)
 
             print("pass\n   [测试'超时']", end='')
-            with MockTerminal(path, "ruiqurm") as (write, proc):
+            with MockTerminal(path, "ruiqurm", emit=self.emit) as (write, proc):
                 proc.wait()
                 result = proc.stdout.read()
             self.assertTrue(str(result).find("听不清楚。结束通话") != -1)
@@ -149,7 +153,7 @@ class ScriptTest(unittest.TestCase):
         print("[simple脚本测试]")
         # 测试账单
         print("   [测试输入'我的账单']", end='')
-        with MockTerminal(path, "ruiqurm","100") as (write, proc):
+        with MockTerminal(path, "ruiqurm", "100", emit=self.emit) as (write, proc):
             write("我的账单\n")
             proc.wait()
             result = proc.stdout.read()
@@ -157,12 +161,21 @@ class ScriptTest(unittest.TestCase):
         self.assertTrue(str(result).find("100") != -1)
 
         print("pass\n   [测试'投诉']", end='')
-        with MockTerminal(path, "ruiqurm","100") as (write, proc):
+        with MockTerminal(path, "ruiqurm", "100", emit=self.emit) as (write, proc):
             write("投诉aaaaaaaaaaaaaa\n")
             time.sleep(1)
             proc.wait()
             result = proc.stdout.read()
         self.assertTrue(str(result).find("您的投诉为") != -1)
         print("pass\n", end='')
+
+
+class PythonScriptTest(ScriptTest):
+    """
+    把脚本翻译成python代码后执行同样的测试
+    """
+    emit = "python"
+
+
 if __name__ == '__main__':
     unittest.main()
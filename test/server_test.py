@@ -0,0 +1,309 @@
+import asyncio
+import gc
+import os
+import sys
+import time
+import unittest
+
+from samoyed.server import *
+
+SCRIPT_DIR = "{}/script".format(os.path.dirname(os.path.abspath(__file__)))
+
+QUICK_CODE = """
+state main:
+    speak("你好")
+    match @(1)listen():
+        "账单" =>
+            speak("账单")
+        silence =>
+            speak("超时")
+"""
+
+# 子进程方式的两种转发
+SPLICE_MODES = (False, True) if SPLICE else (False,)
+
+
+async def connect(server: asyncio.AbstractServer, first_line: str):
+    """连接服务端，发送第一行，返回回复的第一行
+    """
+    host, port = server.sockets[0].getsockname()[:2]
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((first_line + "\n").encode())
+    await writer.drain()
+    return reader, writer, await readline(reader)
+
+
+async def readline(reader: asyncio.StreamReader) -> str:
+    return (await asyncio.wait_for(reader.readline(), 5)).decode().rstrip("\n")
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.programs = [Program.load("{}/simple.sam".format(SCRIPT_DIR)), Program("quick", QUICK_CODE)]
+
+    def run_server(self, client, **kwargs):
+        async def main():
+            session_server = SessionServer(self.programs, **kwargs)
+            server = await session_server.start("127.0.0.1", 0)
+            async with server:
+                result = await client(server, session_server)
+                # 等待服务端的对话都结束
+                for _ in range(500):
+                    if not session_server.active:
+                        break
+                    await asyncio.sleep(0.01)
+                return result
+
+        return asyncio.run(main())
+
+    def test_conversation(self):
+        """
+        测试在进程内进行对话
+        """
+        print("[测试对话服务]", end=" ")
+
+        async def client(server, _):
+            reader, writer, ok = await connect(server, "simple 张三 100")
+            self.assertEqual("OK", ok)
+            self.assertEqual("张三，请问有什么可以帮您", await readline(reader))
+            writer.write("账单\n".encode())
+            await writer.drain()
+            self.assertEqual("您的本月账单是100元", await readline(reader))
+            self.assertEqual("感谢您的来电", await readline(reader))
+            # 对话结束时关闭连接
+            self.assertEqual(b"", await reader.read())
+            writer.close()
+
+            # 截止时间到了由服务端推进
+            reader, writer, ok = await connect(server, "quick")
+            self.assertEqual("你好", await readline(reader))
+            start = time.monotonic()
+            self.assertEqual("超时", await readline(reader))
+            self.assertLess(time.monotonic() - start, 3)
+            writer.close()
+
+        self.run_server(client)
+        print("pass")
+
+    def test_error(self):
+        """
+        测试错误的程序名和参数
+        """
+        print("[测试对话服务的错误]", end=" ")
+
+        async def client(server, _):
+            reader, writer, reply = await connect(server, "nothing")
+            self.assertTrue(reply.startswith("ERROR"))
+            self.assertEqual(b"", await reader.read())
+            writer.close()
+            reader, writer, reply = await connect(server, "simple 张三")
+            self.assertTrue(reply.startswith("ERROR"))
+            writer.close()
+
+        self.run_server(client)
+        print("pass")
+
+    def test_long_line(self):
+        """
+        测试超过LINE_LIMIT的一行
+        """
+        print("[测试对话服务的超长行]", end=" ")
+
+        async def client(server, _):
+            long_line = "账" * LINE_LIMIT
+            # 第一行就超长
+            reader, writer, reply = await connect(server, long_line)
+            self.assertEqual("ERROR line too long", reply)
+            self.assertEqual(b"", await asyncio.wait_for(reader.read(), 5))
+            writer.close()
+            # 对话中超长
+            reader, writer, ok = await connect(server, "simple 张三 100")
+            self.assertEqual("OK", ok)
+            self.assertEqual("张三，请问有什么可以帮您", await readline(reader))
+            writer.write((long_line + "\n").encode())
+            await writer.drain()
+            self.assertEqual("ERROR line too long", await readline(reader))
+            self.assertEqual(b"", await asyncio.wait_for(reader.read(), 5))
+            writer.close()
+
+        with self.assertNoLogs("samoyed.server"):
+            self.run_server(client)
+        print("pass")
+
+    def test_max_sessions(self):
+        """
+        测试同时进行的对话的上限
+        """
+        print("[测试对话数上限]", end=" ")
+
+        async def client(server, session_server):
+            first, first_writer, ok = await connect(server, "quick")
+            self.assertEqual("OK", ok)
+            self.assertEqual(1, session_server.active)
+            # 第二个连接等待第一个对话结束
+            second, second_writer, ok = await connect(server, "quick")
+            self.assertEqual("你好", await readline(first))
+            self.assertEqual("OK", ok)
+            self.assertEqual("你好", await readline(second))
+            first_writer.close()
+            second_writer.close()
+
+        self.run_server(client, max_sessions=1)
+        print("pass")
+
+    def test_admission(self):
+        """
+        测试排队的上限、排队超时和BUSY
+        """
+        print("[测试准入控制]", end=" ")
+
+        async def client(server, session_server):
+            first, first_writer, ok = await connect(server, "quick")
+            self.assertEqual("OK", ok)
+            # 排队的连接超过上限
+            second, second_writer, reply = await connect(server, "quick")
+            self.assertEqual("BUSY", reply)
+            self.assertEqual(b"", await second.read())
+            second_writer.close()
+            self.assertEqual({"active": 1, "queued": 0, "accepted": 1, "rejected": 1, "dropped": 0},
+                             session_server.stats())
+            first_writer.close()
+
+        self.run_server(client, max_sessions=1, max_queue=0)
+
+        async def client(server, session_server):
+            first, first_writer, ok = await connect(server, "quick")
+            # 排队超时
+            start = time.monotonic()
+            second, second_writer, reply = await connect(server, "quick")
+            self.assertEqual("BUSY", reply)
+            self.assertTrue(0.2 <= time.monotonic() - start < 1)
+            self.assertEqual(1, session_server.rejected)
+            self.assertEqual(0, session_server.queued)
+            first_writer.close()
+            second_writer.close()
+
+        self.run_server(client, max_sessions=1, max_queue=1, queue_timeout=0.2)
+        print("pass")
+
+    def test_slow_client(self):
+        """
+        测试不读取输出的客户端被断开
+        """
+        print("[测试读得慢的客户端]", end=" ")
+        flood = "import sys\nfor _ in range(200):\n    sys.stdout.write('x' * 1000000)\n"
+
+        async def main(splice):
+            session_server = SubprocessServer([sys.executable, "-c", flood], splice=splice, output_limit=64 * 1024,
+                                              drain_timeout=0.3)
+            server = await session_server.start("127.0.0.1", 0)
+            async with server:
+                reader, writer, ok = await connect(server, "")
+                self.assertEqual("OK", ok)
+                # 不读取输出
+                for _ in range(500):
+                    if session_server.dropped:
+                        break
+                    await asyncio.sleep(0.01)
+                self.assertEqual(1, session_server.dropped)
+                for _ in range(500):
+                    if not session_server.active:
+                        break
+                    await asyncio.sleep(0.01)
+                self.assertEqual(0, session_server.active)
+                writer.close()
+
+        for splice in SPLICE_MODES:
+            asyncio.run(main(splice))
+        print("pass")
+
+    def test_prefork(self):
+        """
+        测试多进程服务
+        """
+        print("[测试多进程服务]", end=" ")
+        prefork = PreforkServer(SessionServer(self.programs), workers=2)
+        host, port = prefork.start("127.0.0.1", 0)
+        try:
+            self.assertEqual(2, len(prefork.pids))
+            self.assertGreater(gc.get_freeze_count(), 0)
+
+            async def conversation(name):
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write("simple {} 100\n".format(name).encode())
+                writer.write("账单\n".encode())
+                await writer.drain()
+                lines = (await asyncio.wait_for(reader.read(), 10)).decode().splitlines()
+                writer.close()
+                return lines
+
+            async def main():
+                return await asyncio.gather(*[conversation("用户{}".format(i)) for i in range(4)])
+
+            for i, lines in enumerate(asyncio.run(main())):
+                self.assertEqual(["OK", "用户{}，请问有什么可以帮您".format(i), "您的本月账单是100元", "感谢您的来电"],
+                                 lines)
+        finally:
+            prefork.stop()
+            prefork.serve_forever()
+            gc.unfreeze()
+        self.assertEqual({}, prefork.pids)
+        print("pass")
+
+    def test_subprocess(self):
+        """
+        测试每个连接一个进程的转发
+        """
+        print("[测试进程转发]", end=" ")
+        echo = "import sys\nprint('hello', *sys.argv[1:])\nfor line in sys.stdin:\n" \
+               "    if line.strip() == 'bye':\n        break\n    print('echo', line.strip())\n"
+
+        async def main(splice):
+            session_server = SubprocessServer([sys.executable, "-c", echo], splice=splice)
+            server = await session_server.start("127.0.0.1", 0)
+            async with server:
+                reader, writer, ok = await connect(server, "张三")
+                self.assertEqual("OK", ok)
+                self.assertEqual("hello 张三", await readline(reader))
+                # 不完整的一行先缓冲起来
+                start = time.monotonic()
+                writer.write("你".encode())
+                await writer.drain()
+                await asyncio.sleep(0.05)
+                writer.write("好\n".encode())
+                await writer.drain()
+                self.assertEqual("echo 你好", await readline(reader))
+                self.assertLess(time.monotonic() - start, 1)
+                writer.write(b"bye\n")
+                await writer.drain()
+                # 进程结束时关闭连接
+                self.assertEqual(b"", await asyncio.wait_for(reader.read(), 5))
+                writer.close()
+
+                # 客户端关闭连接时结束进程
+                reader, writer, ok = await connect(server, "李四")
+                self.assertEqual("hello 李四", await readline(reader))
+                writer.close()
+                for _ in range(500):
+                    if not session_server.active:
+                        break
+                    await asyncio.sleep(0.01)
+                self.assertEqual(0, session_server.active)
+
+                # 和第一行一起发送的输入
+                host, port = server.sockets[0].getsockname()[:2]
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write("王五\n账单\nbye\n".encode())
+                await writer.drain()
+                self.assertEqual(["OK", "hello 王五", "echo 账单"],
+                                 (await asyncio.wait_for(reader.read(), 5)).decode().splitlines())
+                writer.close()
+
+        for splice in SPLICE_MODES:
+            asyncio.run(main(splice))
+        print("pass")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+"""
+会话测试
+"""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from samoyed.exception import *
+from samoyed.pool import pools
+from samoyed.session import Session, FINISHED, WAITING
+from test.aio_test import BRANCH_CODE
+from test.transpile_test import run_interpreter
+
+EXAMPLE_CODE = """
+state main:
+    speak("hello")
+    match @(4,2)listen():
+        "hello" =>
+            speak("hello world")
+        "账单" =>
+            speak("账单")
+            branch main
+        /投诉(.*)/ =>
+            speak("投诉" + $mg1)
+            exit()
+        silence =>
+            speak("超时")
+"""
+
+
+class FakeClock:
+    """
+    手动推进的时钟
+    """
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SessionTest(unittest.TestCase):
+    mode = "tree"
+
+    def make_session(self, code: str = EXAMPLE_CODE) -> (Session, FakeClock):
+        clock = FakeClock()
+        return Session(code, cache=False, mode=self.mode, clock=clock), clock
+
+    def test_feed(self):
+        """
+        测试逐步输入
+        """
+        print("[测试会话输入]", end=" ")
+        session, clock = self.make_session()
+        reply = session.start()
+        self.assertEqual(["hello"], reply.outputs)
+        self.assertEqual(WAITING, reply.status)
+        self.assertEqual(104, reply.deadline)
+
+        # 还没有到最短等待时间，只记录匹配结果，截止时间提前到允许退出的时间
+        clock.now = 101
+        reply = session.feed("hel")
+        self.assertEqual(([], 104), (reply.outputs, reply.deadline))
+        reply = session.feed("lo")
+        self.assertEqual(([], 102), (reply.outputs, reply.deadline))
+        # 没有到截止时间，tick什么也不做
+        self.assertEqual(([], 102), (session.tick().outputs, session.tick().deadline))
+        clock.now = 102
+        reply = session.tick()
+        self.assertEqual(["hello world"], reply.outputs)
+        self.assertEqual(FINISHED, reply.status)
+        self.assertTrue(session.finished)
+        # 结束后的输入没有作用
+        self.assertEqual(FINISHED, session.feed("hello").status)
+        print("pass")
+
+    def test_feed_without_start(self):
+        """
+        测试没有调用start时直接输入，开始时说出的内容不会丢失
+        """
+        print("[测试没有开始的会话输入]", end=" ")
+        code = 'state main:\n    speak("hello")\n    x = listen()\n    speak("got", x)\n'
+        session, clock = self.make_session(code)
+        reply = session.feed("abc")
+        self.assertEqual(["hello", "got abc"], reply.outputs)
+        self.assertTrue(reply.finished)
+
+        # 还在等待输入时，问候语也在第一次回复中
+        session, clock = self.make_session()
+        reply = session.feed("hel")
+        self.assertEqual((["hello"], WAITING), (reply.outputs, reply.status))
+        print("pass")
+
+    def test_turns(self):
+        """
+        测试多轮对话、跳转、超时和exit
+        """
+        print("[测试多轮对话]", end=" ")
+        session, clock = self.make_session()
+        session.start()
+        clock.now = 103
+        self.assertEqual(["账单", "hello"], session.feed("我的账单").outputs)
+        # 新的一轮重新计时
+        self.assertEqual(107, session.tick().deadline)
+        clock.now = 107
+        reply = session.tick()
+        self.assertEqual(["超时"], reply.outputs)
+        self.assertTrue(reply.finished)
+
+        session, clock = self.make_session()
+        session.start()
+        clock.now = 102
+        reply = session.feed("投诉网络")
+        self.assertEqual(["投诉网络"], reply.outputs)
+        self.assertTrue(reply.finished)
+        self.assertTrue(session.context.is_exit())
+        print("pass")
+
+    def test_many_sessions(self):
+        """
+        测试一个线程中交替推进很多个会话
+        """
+        print("[测试多个会话]", end=" ")
+        clock = FakeClock()
+        sessions = [Session(EXAMPLE_CODE, args={"id": n}, mode=self.mode, clock=clock) for n in range(1000)]
+        for session in sessions:
+            self.assertEqual(["hello"], session.start().outputs)
+        clock.now += 2
+        for n, session in enumerate(sessions):
+            text = "账单" if n % 2 else "hello"
+            self.assertEqual(["账单", "hello"] if n % 2 else ["hello world"], session.feed(text).outputs)
+        self.assertEqual(500, sum(session.finished for session in sessions))
+        print("pass")
+
+    def test_same_result(self):
+        """
+        测试没有输入的程序，执行结果与同步的解释器一致
+        """
+        print("[测试会话执行结果]", end=" ")
+        expected = run_interpreter(BRANCH_CODE, {})
+        session, _ = self.make_session(BRANCH_CODE)
+        reply = session.start()
+        self.assertTrue(reply.finished)
+        self.assertEqual(expected, reply.outputs + ["<exit>"])
+
+        # 程序出错时抛出异常，会话结束
+        session, _ = self.make_session("state main:\n    speak(\"a\")\n    speak(x)\n")
+        with self.assertRaises(SamoyedRuntimeError):
+            session.start()
+        self.assertTrue(session.finished)
+        with self.assertRaises(SamoyedInterpretError):
+            session.start()
+        print("pass")
+
+    def test_listen(self):
+        """
+        测试程序中直接调用listen
+        """
+        print("[测试会话listen]", end=" ")
+        session, _ = self.make_session("state main:\n    x = listen()\n    speak(\"你说了\" + x)\n")
+        reply = session.start()
+        self.assertEqual(([], WAITING, None), (reply.outputs, reply.status, reply.deadline))
+        self.assertEqual(["你说了你好"], session.feed("你好").outputs)
+        print("pass")
+
+    def test_sqlite(self):
+        """
+        测试sqlite不阻塞推进会话的事件循环
+        """
+        print("[测试会话sqlite]", end=" ")
+        with tempfile.TemporaryDirectory() as workdir:
+            db = os.path.join(workdir, "session.db")
+            conn = sqlite3.connect(db)
+            conn.execute("CREATE TABLE T(A INT);")
+            conn.execute("INSERT INTO T VALUES (7);")
+            conn.commit()
+            conn.close()
+            code = 'state main:\n    d = sqlite_connect("{}")\n    r = sqlite(d, "SELECT A FROM T;")\n' \
+                   '    speak(eval("r[0][0]"))\n    x = listen()\n    speak(x)\n'.format(db)
+            # 在当前线程中执行
+            session, _ = self.make_session(code)
+            self.assertEqual(["7"], session.start().outputs)
+            self.assertEqual(["a"], session.feed("a").outputs)
+
+            async def run():
+                # 连接都被占用，等到事件循环放回之后才能执行
+                pool = pools.get(db)
+                held = [pool.acquire() for _ in range(pool.size)]
+                loop = asyncio.get_running_loop()
+                loop.call_later(0.2, lambda: [pool.release(conn) for conn in held])
+                session, _ = self.make_session(code)
+                reply = await session.start_async()
+                self.assertEqual((["7"], WAITING), (reply.outputs, reply.status))
+                self.assertEqual(["b"], (await session.feed_async("b")).outputs)
+                self.assertEqual(FINISHED, (await session.tick_async()).status)
+
+            asyncio.run(run())
+            pools.get(db).close()
+        print("pass")
+
+
+class ClosureSessionTest(SessionTest):
+    """
+    用closure模式执行同样的测试
+    """
+    mode = "closure"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import os
+import queue
+import signal
+import threading
+import time
+import unittest
+
+from samoyed.libs import TimeControl
+from samoyed.source import *
+from samoyed.utils import PipeReader
+
+
+class SourceTest(unittest.TestCase):
+
+    def test_file_source(self):
+        """
+        测试从文件描述符读取
+        """
+        print("[测试FileSource]", end=" ")
+        r, w = os.pipe()
+        try:
+            source = FileSource(r)
+            os.write(w, "你好\nwor".encode())
+            self.assertEqual("你好", source.read(1))
+            # 不完整的一行不会返回
+            self.assertIsNone(source.read(0.05))
+            os.write(w, b"ld\n")
+            self.assertEqual("world", source.read(1))
+
+            # 有输入时立即返回，不等到timeout
+            timer = threading.Timer(0.1, lambda: os.write(w, b"late\n"))
+            timer.start()
+            start = time.monotonic()
+            self.assertEqual("late", source.read(5))
+            self.assertLess(time.monotonic() - start, 1)
+
+            os.write(w, b"last")
+            os.close(w)
+            w = None
+            self.assertEqual("last", source.readline())
+            with self.assertRaises(EOFError):
+                source.read(1)
+        finally:
+            os.close(r)
+            if w is not None:
+                os.close(w)
+        print("pass")
+
+    def test_wake(self):
+        """
+        测试唤醒正在等待输入的read
+        """
+        print("[测试唤醒输入源]", end=" ")
+        r, w = os.pipe()
+        q = queue.Queue()
+        try:
+            for source in (FileSource(r), CallableSource(lambda: q.get())):
+                threading.Timer(0.1, source.wake).start()
+                start = time.monotonic()
+                self.assertIsNone(source.read(5))
+                self.assertLess(time.monotonic() - start, 1)
+            # 唤醒之后仍然可以读到输入
+            source = FileSource(r)
+            source.wake()
+            self.assertIsNone(source.read(1))
+            os.write(w, b"hello\n")
+            self.assertEqual("hello", source.read(1))
+            source.close()
+        finally:
+            os.close(r)
+            os.close(w)
+        print("pass")
+
+    def test_queue_source(self):
+        """
+        测试从队列读取
+        """
+        print("[测试QueueSource]", end=" ")
+        q = queue.Queue()
+        source = QueueSource(q)
+        self.assertIsNone(source.read(0.05))
+        q.put("hello")
+        self.assertEqual("hello", source.read(0))
+        q.put("world")
+        self.assertEqual("world", source())
+        print("pass")
+
+    def test_callable_source(self):
+        """
+        测试在后台线程中调用输入函数
+        """
+        print("[测试CallableSource]", end=" ")
+        q = queue.Queue()
+        calls = []
+        func = lambda: calls.append(1) or q.get()
+        source = input_source(func)
+        self.assertIsInstance(source, CallableSource)
+        # 调用没有结束，留到下一次读取。同一个地方的新函数复用这个输入源，不会启动新的调用
+        self.assertIsNone(source.read(0.05))
+        self.assertIs(source, input_source(lambda: calls.append(2) or q.get(), reuse=source))
+        q.put("hello")
+        self.assertEqual("hello", source.read(1))
+        self.assertEqual([1], calls)
+        # 之后的调用使用新的函数
+        q.put("world")
+        self.assertEqual("world", source.read(1))
+        self.assertEqual([1, 2], calls)
+        # 丢弃没有结束的调用
+        self.assertIsNone(source.read(0.05))
+        source.close()
+        q.put("lost")
+        while not q.empty():
+            time.sleep(0.01)
+        q.put("again")
+        self.assertEqual("again", source.read(1))
+        # 读取是抽象方法
+        with self.assertRaises(TypeError):
+            InputSource()
+
+        # 函数抛出的异常传给读取的一方
+        def error():
+            raise EOFError
+
+        with self.assertRaises(EOFError):
+            CallableSource(error).read(1)
+
+        # 没有内容时等待interval再调用
+        calls = []
+        source = CallableSource(lambda: calls.append(1), interval=10)
+        self.assertIsNone(source.read(1))
+        self.assertIsNone(source.read(0.05))
+        self.assertEqual(1, len(calls))
+        print("pass")
+
+    def test_input_source(self):
+        """
+        测试输入源的选择
+        """
+        print("[测试input_source]", end=" ")
+        source = QueueSource(queue.Queue())
+        self.assertIs(source, input_source(source))
+        self.assertIs(stdin(), input_source(listen))
+        self.assertIs(stdin(), input_source(input))
+        self.assertIsInstance(input_source(source, ("x",)), CallableSource)
+        # 管道的读取函数使用它已经读到的输入
+        r, w = os.pipe()
+        try:
+            reader = PipeReader(r)
+            os.write(w, "你好\n世".encode())
+            reader.fill()
+            source = input_source(reader)
+            self.assertIsInstance(source, FileSource)
+            self.assertIs(source, FileSource.of(r))
+            os.write(w, "界\n".encode())
+            self.assertEqual("你好", source.read(1))
+            self.assertEqual("世界", source.read(1))
+            source.close()
+        finally:
+            FileSource._sources.pop(r, None)
+            os.close(r)
+            os.close(w)
+        print("pass")
+
+    def test_time_control(self):
+        """
+        测试TimeControl使用输入源，不使用信号，可以在其他线程中运行
+        """
+        print("[测试TimeControl输入源]", end=" ")
+        handler = signal.getsignal(signal.SIGALRM)
+        r, w = os.pipe()
+        source = FileSource(r)
+        results = []
+        elapsed = []
+
+        def run():
+            start = time.monotonic()
+            control = TimeControl(source, 5)
+            for line in control():
+                if line is not None:
+                    results.append(line)
+                    elapsed.append(time.monotonic() - start)
+                    control.cancel()
+                    break
+
+        try:
+            thread = threading.Thread(target=run)
+            thread.start()
+            time.sleep(0.1)
+            os.write(w, b"hello\n")
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        finally:
+            os.close(r)
+            os.close(w)
+        self.assertEqual(["hello"], results)
+        self.assertLess(elapsed[0], 1)
+        self.assertIs(handler, signal.getsignal(signal.SIGALRM))
+
+        # min_wait之前也一直读取输入，到了min_wait时返回一次
+        q = queue.Queue()
+        control = TimeControl(QueueSource(q), 1, 0.2)
+        start = time.monotonic()
+        for line in control():
+            if control.can_exit.is_set():
+                break
+        self.assertTrue(0.2 <= time.monotonic() - start < 0.9)
+        control.cancel()
+        print("pass")
+
+
+if __name__ == '__main__':
+    unittest.main()
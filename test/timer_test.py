@@ -0,0 +1,52 @@
+import queue
+import threading
+import time
+import unittest
+
+from samoyed.timer import *
+
+
+class TimerTest(unittest.TestCase):
+
+    def test_call_later(self):
+        """
+        测试计时器按截止时间的顺序到期
+        """
+        print("[测试计时服务]", end=" ")
+        service = TimerService()
+        fired = []
+        done = threading.Event()
+        service.call_later(0.2, lambda: (fired.append("b"), done.set()))
+        service.call_later(0.1, lambda: fired.append("a"))
+        # 新的计时器最早到期时唤醒后台线程
+        service.call_later(0.01, lambda: fired.append("first"))
+        cancelled = service.call_later(0.05, lambda: fired.append("cancelled"))
+        cancelled.cancel()
+        self.assertEqual(3, len(service))
+        self.assertTrue(done.wait(2))
+        self.assertEqual(["first", "a", "b"], fired)
+        self.assertEqual(0, len(service))
+        # 到期之后取消什么也不做
+        cancelled.cancel()
+        self.assertEqual(0, len(service))
+        print("pass")
+
+    def test_cancel(self):
+        """
+        测试大量取消时重建堆
+        """
+        print("[测试取消计时器]", end=" ")
+        service = TimerService()
+        handles = [service.call_later(10 + i, lambda: None) for i in range(100)]
+        for handle in handles[:90]:
+            handle.cancel()
+        self.assertEqual(10, len(service))
+        self.assertLessEqual(len(service._heap), 50)
+        fired = threading.Event()
+        service.call_later(0.01, fired.set)
+        self.assertTrue(fired.wait(2))
+        print("pass")
+
+
+if __name__ == '__main__':
+    unittest.main()
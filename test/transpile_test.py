@@ -0,0 +1,246 @@
+"""
+转译器测试
+
+把程序翻译成python代码后执行，结果应当与解释器一致
+"""
+import os
+import tempfile
+import time
+import unittest
+from functools import partial
+from queue import Queue
+from threading import Thread, Timer
+
+from samoyed.core import Interpreter, Context
+from samoyed.exception import *
+from samoyed.transpile import transpile
+from test.interpreter_test import LISTEN_SITE_CODE
+from test.libs_test import mock_input
+
+SCRIPT_DIR = "{}/script".format(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_module(code: str) -> dict:
+    """
+    翻译并执行生成的代码，返回模块的名字空间
+    """
+    i = Interpreter(code, cache=False)
+    namespace = {"__name__": "transpiled"}
+    exec(compile(transpile(i.ast, i.context.seq_args, i.context.option_args), "<transpiled>", "exec"), namespace)
+    return namespace
+
+
+def run_interpreter(code: str, names: dict) -> list:
+    """
+    用解释器执行，返回speak的内容
+    """
+    output = []
+    i = Interpreter(code, dont_init=True, cache=False)
+    i.context.names.update(names)
+    i.context.names["speak"] = output.append
+    try:
+        i.init()
+        i.exec()
+    except SystemExit:
+        output.append("<exit>")
+    except SamoyedException as e:
+        output.append((type(e), str(e)))
+    return output
+
+
+def run_transpiled(code: str, names: dict) -> list:
+    """
+    执行翻译后的代码，返回speak的内容
+    """
+    output = []
+    module = load_module(code)
+    context = Context()
+    context.names.update(names)
+    context.names["speak"] = output.append
+    try:
+        module["run"](context)
+    except SystemExit:
+        output.append("<exit>")
+    except SamoyedException as e:
+        output.append((type(e), str(e)))
+    return output
+
+
+class TranspileTest(unittest.TestCase):
+    def assertSameResult(self, code: str, names: dict = None) -> list:
+        expected = run_interpreter(code, names or {})
+        self.assertEqual(expected, run_transpiled(code, names or {}))
+        return expected
+
+    def test_scripts(self):
+        """
+        测试所有脚本都能生成合法的python代码
+        """
+        print("[测试翻译脚本]", end=" ")
+        # 初始化时会执行外部的语句，例如database.sam会在当前目录创建./test.db
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                for name in sorted(os.listdir(SCRIPT_DIR)):
+                    with open(os.path.join(SCRIPT_DIR, name), encoding="utf-8") as f:
+                        module = load_module(f.read())
+                    self.assertIn("main", module["STATES"], name)
+            finally:
+                os.chdir(cwd)
+        print("pass")
+
+    def test_branch(self):
+        """
+        测试跳转，以及块中执行branch后跳过剩余语句的细节
+        """
+        print("[测试跳转]", end=" ")
+        code = """
+cnt = 0
+state main:
+    speak("main")
+    if cnt > 1:
+        exit()
+    match cnt:
+        0 =>
+            speak("zero")
+            branch a
+            speak("after branch in case")
+        default =>
+            branch b
+            speak("never")
+    if cnt == 0:
+        if true:
+            branch a
+            speak("never")
+        speak("never")
+    speak("after if")
+state a:
+    speak("a")
+    cnt = cnt + 1
+    branch main
+state b:
+    speak("b" + cnt)
+    cnt = cnt + 1
+    branch main
+    speak("still in b")
+    if true:
+        speak("only first")
+        speak("skipped")
+"""
+        self.assertEqual(["main", "zero", "after branch in case", "after if", "a", "main", "after if", "b1",
+                          "still in b", "only first", "main", "<exit>"], self.assertSameResult(code))
+        print("pass")
+
+    def test_expression(self):
+        """
+        测试表达式和异常
+        """
+        print("[测试表达式]", end=" ")
+        code = """
+x = 3
+state main:
+    speak(x * 2 + 1 - 4 // 3 % 2)
+    speak(-x)
+    speak(x > 2 ? "big" : "small")
+    speak(not x)
+    speak(x > 1 or x > 5 and false)
+    speak("a" + 1 + 2.5)
+    speak(len("hello"))
+    speak({})
+"""
+        for tail, names in [("1", {}), ("-\"a\"", {}), ("y", {}), ("1 / 0", {}), ("f()", {}),
+                            ("f(1)", {"f": lambda: 1}), ("1 < \"a\"", {}), ("(1 + \"a\") * 2", {})]:
+            self.assertSameResult(code.format(tail), dict(names, len=len))
+        print("pass")
+
+    def test_match(self):
+        """
+        测试普通的match：与解释器一致，match的值是case的子串时匹配，正则表达式不会匹配
+        """
+        print("[测试match]", end=" ")
+        code = """
+state main:
+    match "账单":
+        "我的账单" =>
+            speak("substring")
+        default =>
+            speak("default")
+    match 3:
+        "3" =>
+            speak("string")
+        3 =>
+            speak("int")
+    match "投诉ab":
+        /投诉(a)(b)/ =>
+            speak("reg")
+        default =>
+            speak("no reg")
+    match "nothing":
+        "x" =>
+            speak("x")
+        default =>
+            branch end
+            speak("never")
+state end:
+    speak("end")
+"""
+        self.assertEqual(["substring", "int", "no reg", "end"], self.assertSameResult(code))
+        print("pass")
+
+    def test_time_control(self):
+        """
+        测试带时间控制的match
+        """
+        code = """
+state main:
+    match @(2,1)listen():
+        /投诉(.*)/ =>
+            speak("投诉" + $mg1)
+        "账单" =>
+            speak("账单")
+        silence =>
+            speak("沉默")
+"""
+        for plan, expected in [({0: "账", 0.3: "单"}, ["账单"]), ({0: "投诉网络"}, ["投诉网络"]), ({}, ["沉默"])]:
+            print("[测试时间控制 {}]".format(expected[0]), end=" ")
+            results = []
+            for run in (run_interpreter, run_transpiled):
+                q = Queue()
+                thread = Thread(target=mock_input, args=(q, plan))
+                thread.start()
+                start = time.time()
+                results.append(run(code, {"listen": partial(lambda qq: qq.get(), q)}))
+                # 至少等待1秒
+                self.assertGreaterEqual(time.time() - start, 1)
+                thread.join()
+            self.assertEqual([expected, expected], results)
+            print("pass")
+
+    def test_listen_site(self):
+        """
+        测试同一个match复用输入函数的调用，与解释器一致
+        """
+        print("[测试match复用输入源]", end=" ")
+        q, calls = Queue(), []
+        Timer(1.3, q.put, ("x",)).start()
+        names = {"get": lambda n: calls.append(n) or q.get()}
+        self.assertEqual(["silence", "x"], run_transpiled(LISTEN_SITE_CODE, names))
+        self.assertEqual([1], calls)
+        print("pass")
+
+    def test_no_entrance(self):
+        """
+        测试没有入口
+        """
+        print("[测试没有入口]", end=" ")
+        code = "x = 1\nstate a:\n    pass\n"
+        namespace = {}
+        exec(transpile(Interpreter(code, dont_init=True, cache=False).ast, [], []), namespace)
+        with self.assertRaises(SamoyedNotFoundEntrance):
+            namespace["run"](Context())
+        print("pass")
+
+
+if __name__ == '__main__':
+    unittest.main()
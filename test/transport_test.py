@@ -0,0 +1,138 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from samoyed.core import Context, Interpreter
+from samoyed.transport import *
+from samoyed.utils import PipeReader, make_pipe
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_DIR = "{}/script".format(os.path.dirname(os.path.abspath(__file__)))
+
+QUICK_CODE = """
+state main:
+    speak("你好")
+    match @(3)listen():
+        "账单" =>
+            speak("您的账单")
+            speak("再见")
+        silence =>
+            speak("超时")
+"""
+
+
+def run_in_thread(code: str, transport: Transport, **kwargs) -> threading.Thread:
+    """在另一个线程中执行程序"""
+    thread = threading.Thread(target=lambda: Interpreter(code, transport=transport, **kwargs).exec(), daemon=True)
+    thread.start()
+    return thread
+
+
+class TransportTest(unittest.TestCase):
+
+    def test_default(self):
+        """
+        测试默认使用标准输入输出
+        """
+        print("[测试默认传输]", end=" ")
+        context = Context()
+        self.assertIsInstance(context.transport, StdioTransport)
+        self.assertIs(context.output, context.names["speak"])
+        print("pass")
+
+    def test_memory(self):
+        """
+        测试进程内的队列，不需要子进程和管道
+        """
+        print("[测试内存传输]", end=" ")
+        with open("{}/simple.sam".format(SCRIPT_DIR), encoding="utf-8") as f:
+            code = f.read()
+        transport = MemoryTransport()
+        thread = run_in_thread(code, transport, args={"1": "张三", "名字": "张三", "2": "100", "剩余金额": "100"},
+                               mode="closure")
+        # 等待输入之前已经收到
+        self.assertEqual("张三，请问有什么可以帮您", transport.receive(5))
+        transport.send("我的账单")
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(["您的本月账单是100元", "感谢您的来电"], transport.received())
+        print("pass")
+
+    def test_fifo(self):
+        """
+        测试具名管道
+        """
+        print("[测试具名管道传输]", end=" ")
+        with tempfile.TemporaryDirectory() as workdir:
+            paths = os.path.join(workdir, "in"), os.path.join(workdir, "out")
+            for path in paths:
+                make_pipe(path)
+            with FifoTransport(*paths) as transport:
+                thread = run_in_thread(QUICK_CODE, transport)
+                write_fd = os.open(paths[0], os.O_RDWR)
+                read_fd = os.open(paths[1], os.O_RDWR)
+                try:
+                    reader = PipeReader(read_fd)
+                    self.assertEqual("你好", reader.readline())
+                    os.write(write_fd, "账单\n".encode())
+                    self.assertEqual("您的账单", reader.readline())
+                    self.assertEqual("再见", reader.readline())
+                    thread.join(10)
+                    self.assertFalse(thread.is_alive())
+                finally:
+                    os.close(write_fd)
+                    os.close(read_fd)
+        print("pass")
+
+    def test_unix(self):
+        """
+        测试Unix domain socket
+        """
+        print("[测试Unix socket传输]", end=" ")
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        with ours, UnixTransport(theirs) as transport:
+            thread = run_in_thread(QUICK_CODE, transport, mode="vm")
+            reader = PipeReader(ours.fileno())
+            self.assertEqual("你好", reader.readline())
+            ours.sendall("账单\n".encode())
+            self.assertEqual("您的账单", reader.readline())
+            self.assertEqual("再见", reader.readline())
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(-1, theirs.fileno())
+        print("pass")
+
+    def test_samc_unix(self):
+        """
+        测试samc run连接到Unix domain socket
+        """
+        print("[测试samc run --unix]", end=" ")
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "samoyed.sock")
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+                server.bind(path)
+                server.listen(1)
+                server.settimeout(10)
+                proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "samc"), "run",
+                                         "{}/example.sam".format(SCRIPT_DIR), "--unix", path],
+                                        stdin=subprocess.DEVNULL)
+                try:
+                    conn, _ = server.accept()
+                    with conn:
+                        reader = PipeReader(conn.fileno())
+                        self.assertEqual("hello", reader.readline())
+                        conn.sendall(b"hello\n")
+                        self.assertEqual("hello world", reader.readline())
+                    self.assertEqual(0, proc.wait(10))
+                finally:
+                    proc.kill()
+                    proc.wait()
+        print("pass")
+
+
+if __name__ == '__main__':
+    unittest.main()
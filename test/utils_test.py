@@ -1,3 +1,4 @@
+import os
 import threading
 import time
 import unittest
@@ -27,6 +28,60 @@ class UtilsTest(unittest.TestCase):
         t()
         print("pass")
 
+    def test_pipe_reader(self):
+        """
+        测试增量解码的读取
+        """
+        print("[测试PipeReader]", end=' ')
+        data = "你好\n世界\n再见".encode()
+        r, w = os.pipe()
+        try:
+            reader = PipeReader(r)
+            # 一个汉字的字节被分到两次读取中
+            for i in range(0, len(data), 2):
+                os.write(w, data[i:i + 2])
+                reader.fill()
+            self.assertEqual(["你好", "世界"], list(reader.lines))
+            self.assertEqual("你好", reader.readline())
+            os.close(w)
+            w = None
+            self.assertEqual("世界", reader.readline())
+            # 最后一行没有换行符
+            self.assertEqual("再见", reader.readline())
+            with self.assertRaises(EOFError):
+                reader.readline()
+        finally:
+            os.close(r)
+            if w is not None:
+                os.close(w)
+
+        # 按块读取，不完整的字符和后面的字节一起返回
+        r, w = os.pipe()
+        try:
+            reader = PipeReader(r)
+            for i in range(len(data)):
+                os.write(w, data[i:i + 1])
+            text = [reader(1) for _ in range(len("你好\n世界\n再见"))]
+            self.assertEqual(list("你好\n世界\n再见"), text)
+            # 一个汉字被分到两次写入中，读到前一半时等待后一半，不会返回表示输入结束的空字符串
+            char = "好".encode()
+            os.write(w, char[:1])
+            threading.Timer(0.1, os.write, (w, char[1:])).start()
+            self.assertEqual("好", reader(2))
+            self.assertFalse(reader.eof)
+            # 输入结束时不完整的字符替换成U+FFFD
+            os.write(w, char[:2])
+            os.close(w)
+            w = None
+            self.assertEqual("\ufffd", reader.read())
+            self.assertTrue(reader.eof)
+            self.assertEqual("", reader.read())
+        finally:
+            os.close(r)
+            if w is not None:
+                os.close(w)
+        print("pass")
+
 if __name__ == '__main__':
     unittest.main()
     print("通过utils_test\n")
\ No newline at end of file